@@ -1,14 +1,28 @@
 import os
+from pathlib import Path
 
 import streamlit as st
 
 from src.rag.llm import LLMConfig
-from src.rag.parsers import parse_document
-from src.rag.pipeline import PipelineConfig, RAGPipeline
+from src.rag.parsers import ParserConfig
+from src.rag.pipeline import KnowledgeBase, PipelineConfig, RAGPipeline
 
 st.set_page_config(page_title="Engineering RAG", layout="wide")
 st.title("工程级 RAG 实验台（test）")
 
+SNAPSHOT_DIR = os.getenv("RAG_SNAPSHOT_DIR", "artifacts/rag_snapshot")
+PARSE_CACHE = os.getenv("RAG_PARSE_CACHE", "artifacts/cache/parsed.sqlite")
+
+
+@st.cache_resource
+def get_knowledge_base() -> KnowledgeBase:
+    # One knowledge base per process, shared by every browser session.
+    config = PipelineConfig(parser=ParserConfig(cache_path=PARSE_CACHE or None))
+    return KnowledgeBase.from_snapshot(config, SNAPSHOT_DIR)
+
+
+knowledge = get_knowledge_base()
+
 with st.sidebar:
     st.header("数据导入")
     llm_provider = st.selectbox("回答模式", ["extractive", "openai", "ollama"], index=0)
@@ -21,30 +35,34 @@ with st.sidebar:
     if llm_provider == "ollama":
         st.info("无需云 API，需本地先启动 Ollama 服务。")
 
+    llm_config = LLMConfig(
+        provider=llm_provider,
+        model=llm_model,
+        temperature=0.0,
+        ollama_base_url=ollama_base_url,
+    )
+    if "pipeline" not in st.session_state or st.session_state.pipeline.knowledge is not knowledge:
+        st.session_state.pipeline = RAGPipeline(knowledge.config, knowledge=knowledge)
+        st.session_state.pop("provider", None)
     if (
-        "pipeline" not in st.session_state
-        or st.session_state.get("provider") != llm_provider
+        st.session_state.get("provider") != llm_provider
         or st.session_state.get("model") != llm_model
         or st.session_state.get("ollama_base_url") != ollama_base_url
     ):
-        cfg = PipelineConfig(
-            llm=LLMConfig(
-                provider=llm_provider,
-                model=llm_model,
-                temperature=0.0,
-                ollama_base_url=ollama_base_url,
-            )
-        )
-        st.session_state.pipeline = RAGPipeline(cfg)
+        # Only the generator is rebuilt; the shared index is untouched.
+        st.session_state.pipeline.set_llm(llm_config)
         st.session_state.provider = llm_provider
         st.session_state.model = llm_model
         st.session_state.ollama_base_url = ollama_base_url
 
+    tags_text = st.text_input("文档标签（逗号分隔，可选）", "")
+    tags = [t.strip() for t in tags_text.split(",") if t.strip()] or None
+
     st.subheader("方式 A：手动文本")
     doc_id = st.text_input("文档 ID", "doc-1")
     content = st.text_area("文档内容（示例）", "RAG 的核心是检索质量与证据约束。")
     if st.button("写入索引（手动文本）"):
-        st.session_state.pipeline.ingest(doc_id, content)
+        st.session_state.pipeline.ingest(doc_id, content, tags=tags)
         st.success(f"已写入索引：{doc_id}")
 
     st.subheader("方式 B：上传真实文档")
@@ -57,24 +75,101 @@ with st.sidebar:
         if not files:
             st.warning("请先上传至少一个文件。")
         else:
-            for f in files:
+            if len(files) > 1:
+                bar = st.progress(0.0, text=f"并行解析 {len(files)} 个文件…")
+                done = []
+
+                def _on_result(res):
+                    done.append(res)
+                    bar.progress(len(done) / len(files), text=f"已完成 {len(done)}/{len(files)}：{res.filename}")
+                    if not res.ok:
+                        st.error(f"解析失败 {res.filename}: {res.error}")
+                    elif not res.document.pages:
+                        st.warning(f"文件无可提取文本：{res.filename}")
+                    else:
+                        how = "解析缓存命中" if res.cached else f"解析 {res.seconds:.1f}s"
+                        st.success(f"已写入：{res.filename} -> doc_id={res.document.doc_id}（{how}）")
+
+                st.session_state.pipeline.ingest_many(
+                    [(f.name, f.getvalue()) for f in files],
+                    workers=os.cpu_count(),
+                    on_result=_on_result,
+                    tags=tags,
+                )
+            else:
+                f = files[0]
+                bar = st.progress(0.0, text=f"解析中：{f.name}")
+
+                def _on_page(done, total, chunks):
+                    frac = min(1.0, done / total) if total else 0.0
+                    bar.progress(frac, text=f"{f.name}：第 {done} 页，已写入 {chunks} 个 chunk")
+
                 try:
-                    parsed = parse_document(f.name, f.getvalue())
-                    if not parsed.content.strip():
+                    n_chunks = st.session_state.pipeline.ingest_file(
+                        f.name, f.getvalue(), progress=_on_page, tags=tags
+                    )
+                    bar.progress(1.0, text=f"完成：{f.name}")
+                    if n_chunks:
+                        st.success(f"已写入：{f.name} -> doc_id={Path(f.name).stem}（{n_chunks} 个 chunk）")
+                    else:
                         st.warning(f"文件无可提取文本：{f.name}")
-                        continue
-                    st.session_state.pipeline.ingest(parsed.doc_id, parsed.content)
-                    st.success(f"已写入：{f.name} -> doc_id={parsed.doc_id}")
                 except Exception as exc:
                     st.error(f"解析失败 {f.name}: {exc}")
+            stats = knowledge.parse_cache_stats()
+            if stats:
+                st.caption(
+                    f"解析缓存：命中率 {stats['hit_rate']:.0%}（{stats['hits']}/{stats['hits'] + stats['misses']}），"
+                    f"{stats['entries']} 个文件，{stats['bytes'] / 1e6:.1f} MB，累计节省 {stats['seconds_saved']:.1f}s"
+                )
+
+    st.subheader("索引快照")
+    if st.button("保存索引快照"):
+        st.session_state.pipeline.save(SNAPSHOT_DIR)
+        st.success(f"已保存到：{SNAPSHOT_DIR}（重启后自动加载）")
 
 st.header("问答")
 query = st.text_input("问题", "为什么 RAG 会 hallucinate?")
+with st.expander("检索范围（元数据过滤）"):
+    records = list(knowledge.registry)
+    doc_filter = st.multiselect("限定文档", sorted(r.doc_id for r in records))
+    type_filter = st.multiselect("限定文件类型", sorted({r.source_type for r in records}))
+    tag_filter = st.multiselect("包含任一标签", sorted({t for r in records for t in r.tags}))
+    page_from, page_to = st.columns(2)
+    page_min = page_from.number_input("起始页/幻灯片", min_value=0, value=0, help="0 表示不限")
+    page_max = page_to.number_input("结束页/幻灯片", min_value=0, value=0, help="0 表示不限")
+where = {}
+if doc_filter:
+    where["doc_id"] = doc_filter
+if type_filter:
+    where["source_type"] = type_filter
+if tag_filter:
+    where["tags"] = {"$in": tag_filter}
+page_range = {}
+if page_min:
+    page_range["$gte"] = int(page_min)
+if page_max:
+    page_range["$lte"] = int(page_max)
+if page_range:
+    where["page"] = page_range
+
 if st.button("检索并回答"):
-    result = st.session_state.pipeline.answer(query)
     st.subheader("答案")
-    st.write(result["answer"])
-
-    st.subheader("证据片段")
-    for i, ev in enumerate(result["evidence"], start=1):
-        st.markdown(f"**[{i}]** {ev}")
+    answer_box = st.empty()
+    answer_box.markdown("_检索中…_")
+    answer_text = ""
+    for event in st.session_state.pipeline.answer_stream(query, timings=True, where=where or None):
+        if event["type"] == "evidence":
+            st.subheader("证据片段")
+            for i, ev in enumerate(event["evidence"], start=1):
+                st.markdown(f"**[{i}]** {ev}")
+            if event.get("cached"):
+                st.caption(f"命中答案缓存（{event['cached']}）")
+            answer_box.markdown("_生成中…_")
+        elif event["type"] == "token":
+            answer_text += event["text"]
+            answer_box.markdown(answer_text + "▌")
+        else:
+            answer_box.markdown(event["answer"])
+            timings = event.get("timings") or {}
+            if timings:
+                st.caption("耗时：" + " · ".join(f"{stage} {ms:.1f} ms" for stage, ms in timings.items()))
@@ -0,0 +1,269 @@
+"""Offline end-to-end latency benchmark with a per-stage breakdown.
+
+Builds a deterministic synthetic corpus, ingests it through
+``RAGPipeline.ingest`` and then answers random queries with
+``RAGPipeline.answer``, recording throughput and p50/p95/p99 latency per
+stage (chunking, embedding, index upsert, search, rerank, context packing,
+generation) from the spans the pipeline's tracer emits. The default
+configuration uses the built-in stubs (hash embeddings, overlap reranker,
+extractive generator), so no model is downloaded.
+
+    python -m src.rag.bench --chunks 10000 --queries 200 --output artifacts/bench/latest.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import asdict
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .cache import AnswerCacheConfig
+from .chunking import ChunkConfig
+from .embeddings import EmbeddingConfig
+from .index import IndexConfig
+from .llm import LLMConfig
+from .pipeline import PipelineConfig, RAGPipeline
+from .rerank import RerankConfig
+from .tracing import Span
+
+_SYLLABLES = "检索增强生成向量索引数据模型文档证据回答问题系统质量排序召回延迟吞吐缓存分块压缩查询语义结构"
+_WORDS = ["rag", "vector", "index", "bm25", "faiss", "latency", "cache", "chunk", "embedding", "rerank"]
+# Tracer span name -> (benchmark stage, span attribute holding the item count).
+_INGEST_STAGES = {
+    "chunk": ("chunking", "chunks"),
+    "embed": ("embedding", "texts"),
+    "index.upsert": ("index_upsert", "vectors"),
+    "sparse.upsert": ("sparse_upsert", "texts"),
+    "ingest": ("ingest", "chunks"),
+}
+_QUERY_STAGES = {
+    "embed": ("query_embedding", "texts"),
+    "index.search": ("dense_search", "queries"),
+    "sparse.search": ("sparse_search", "queries"),
+    "rerank": ("rerank", "candidates"),
+    "context.pack": ("context_pack", "passages"),
+    "generate": ("generation", None),
+    "answer": ("answer", None),
+}
+
+
+class StageTimer:
+    """Collects wall-clock samples and processed-item counts per stage."""
+
+    def __init__(self) -> None:
+        self.samples: Dict[str, List[float]] = {}
+        self.items: Dict[str, int] = {}
+
+    @contextmanager
+    def measure(self, stage: str, items: int = 1) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start, items)
+
+    def record(self, stage: str, seconds: float, items: int = 1) -> None:
+        self.samples.setdefault(stage, []).append(seconds)
+        self.items[stage] = self.items.get(stage, 0) + items
+
+    def record_spans(self, spans: List[Span], stages: Dict[str, Tuple[str, Optional[str]]]) -> None:
+        """Add the tracer spans named in ``stages`` as samples of their benchmark stage."""
+        for span in spans:
+            stage = stages.get(span.name)
+            if stage is not None:
+                name, attribute = stage
+                self.record(name, span.duration, int(span.attributes.get(attribute, 1)) if attribute else 1)
+
+    def summary(self) -> Dict[str, Dict[str, Optional[float]]]:
+        out: Dict[str, Dict[str, Optional[float]]] = {}
+        for stage, samples in self.samples.items():
+            arr = np.asarray(samples)
+            total = float(arr.sum())
+            p50, p95, p99 = np.percentile(arr, [50, 95, 99]) * 1000.0
+            out[stage] = {
+                "calls": len(samples),
+                "items": self.items[stage],
+                "total_s": total,
+                # None rather than inf: json.dump would write the invalid token Infinity.
+                "items_per_s": self.items[stage] / total if total > 0 else None,
+                "p50_ms": float(p50),
+                "p95_ms": float(p95),
+                "p99_ms": float(p99),
+            }
+        return out
+
+
+def synthetic_document(rng: random.Random, approx_chars: int) -> str:
+    """Mixed Chinese/English paragraphs with sentence punctuation."""
+    paragraphs: List[str] = []
+    size = 0
+    while size < approx_chars:
+        sentences = []
+        for _ in range(rng.randint(2, 6)):
+            parts = [
+                "".join(rng.choices(_SYLLABLES, k=rng.randint(2, 6))) if rng.random() < 0.7 else rng.choice(_WORDS)
+                for _ in range(rng.randint(4, 12))
+            ]
+            sentences.append("，".join(parts) + rng.choice("。！？"))
+        paragraph = "".join(sentences)
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+    return "\n\n".join(paragraphs)
+
+
+def synthetic_query(rng: random.Random) -> str:
+    terms = ["".join(rng.choices(_SYLLABLES, k=rng.randint(2, 4))) for _ in range(rng.randint(1, 3))]
+    return " ".join(terms + [rng.choice(_WORDS)])
+
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def run_benchmark(
+    config: PipelineConfig,
+    chunks: int = 10_000,
+    queries: int = 200,
+    chunks_per_doc: int = 50,
+    top_k: int = 8,
+    top_n: int = 3,
+    seed: int = 0,
+) -> Dict:
+    """Ingest about ``chunks`` synthetic chunks, then time ``queries`` answers.
+
+    Documents are added whole, so the corpus overshoots ``chunks`` by at most
+    one document.
+    """
+    rng = random.Random(seed)
+    pipeline = RAGPipeline(config)
+    tracer = pipeline.tracer
+    timer = StageTimer()
+    doc_chars = config.chunk.chunk_size * chunks_per_doc
+
+    ingest_start = time.perf_counter()
+    doc = 0
+    while len(pipeline.store) < chunks:
+        text = synthetic_document(rng, doc_chars)
+        with tracer.collect() as spans:
+            pipeline.ingest(f"doc-{doc}", text)
+        timer.record_spans(spans, _INGEST_STAGES)
+        doc += 1
+    ingest_seconds = time.perf_counter() - ingest_start
+
+    for _ in range(queries):
+        query = synthetic_query(rng)
+        with tracer.collect() as spans:
+            pipeline.answer(query, top_k=top_k, top_n=top_n)
+        timer.record_spans(spans, _QUERY_STAGES)
+
+    return {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {
+            "chunks": len(pipeline.store),
+            "documents": doc,
+            "queries": queries,
+            "top_k": top_k,
+            "top_n": top_n,
+            "seed": seed,
+        },
+        "config": asdict(config),
+        "ingest_seconds": ingest_seconds,
+        "ingest_chunks_per_s": len(pipeline.store) / ingest_seconds if ingest_seconds > 0 else None,
+        "stages": timer.summary(),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline latency benchmark for RAGPipeline.")
+    parser.add_argument("--chunks", type=int, default=10_000, help="Synthetic corpus size in chunks")
+    parser.add_argument("--queries", type=int, default=200, help="Number of timed queries")
+    parser.add_argument("--chunks-per-doc", type=int, default=50)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--strategy", default="recursive", help="fixed | recursive | semantic")
+    parser.add_argument("--batch-size", type=int, default=256, help="Ingest micro-batch size")
+    parser.add_argument("--backend", default="memory", help="memory | faiss | chroma")
+    parser.add_argument("--faiss-index", default="flat", help="flat | ivf_flat | ivf_pq | hnsw")
+    parser.add_argument("--storage", default="float32", help="Memory backend: float32 | float16 | int8 | pq")
+    parser.add_argument("--mode", default="hybrid", help="dense | sparse | hybrid")
+    parser.add_argument("--embedding", default="hash", help="Embedding provider; hash needs no model")
+    parser.add_argument("--dim", type=int, default=256, help="Dimension of hash embeddings")
+    parser.add_argument("--reranker", default="overlap", help="overlap | cross-encoder")
+    parser.add_argument("--llm", default="extractive", help="extractive | openai | ollama")
+    parser.add_argument("--top-k", type=int, default=8)
+    parser.add_argument("--top-n", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Write the JSON report here")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    config = PipelineConfig(
+        chunk=ChunkConfig(strategy=args.strategy, chunk_size=args.chunk_size),
+        embedding=EmbeddingConfig(provider=args.embedding, dim=args.dim),
+        index=IndexConfig(backend=args.backend, faiss_index=args.faiss_index, storage=args.storage),
+        rerank=RerankConfig(provider=args.reranker),
+        llm=LLMConfig(provider=args.llm),
+        answer_cache=AnswerCacheConfig(enabled=False),
+        ingest_batch_size=args.batch_size,
+    )
+    config.retrieval.mode = args.mode
+    report = run_benchmark(
+        config,
+        chunks=args.chunks,
+        queries=args.queries,
+        chunks_per_doc=args.chunks_per_doc,
+        top_k=args.top_k,
+        top_n=args.top_n,
+        seed=args.seed,
+    )
+
+    print(f"{'stage':<16}{'calls':>8}{'items/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage, row in report["stages"].items():
+        rate = "n/a" if row["items_per_s"] is None else f"{row['items_per_s']:.1f}"
+        print(
+            f"{stage:<16}{row['calls']:>8}{rate:>12}"
+            f"{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}"
+        )
+    rss = report["peak_rss_mb"]
+    print(
+        f"chunks={report['params']['chunks']} ingest={report['ingest_seconds']:.1f}s "
+        f"peak_rss={'n/a' if rss is None else f'{rss:.0f} MB'}"
+    )
+
+    if args.output:
+        out = Path(args.output)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"Saved report to: {out}")
+
+
+if __name__ == "__main__":
+    main()
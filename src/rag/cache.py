@@ -0,0 +1,397 @@
+"""Caches shared by the ingestion, retrieval and answering stages."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class SQLiteLRUStore:
+    """Size-bounded key/blob store on SQLite with least-recently-used eviction.
+
+    Every read bumps the entry's access stamp; once the total payload exceeds
+    ``max_bytes`` the stalest entries are deleted until it fits again. Stamps
+    come from a logical clock that resumes from the largest stored stamp, so
+    the order survives restarts and wall-clock adjustments.
+    """
+
+    def __init__(self, path: str, max_bytes: int, table: str = "entries"):
+        if not re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", table):
+            raise ValueError(f"Invalid cache table name: {table}")
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._table = table
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, nbytes INTEGER NOT NULL, last_access INTEGER NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_lru ON {table}(last_access)")
+        self._conn.commit()
+        row = self._conn.execute(
+            f"SELECT COUNT(*), COALESCE(SUM(nbytes), 0), COALESCE(MAX(last_access), 0) FROM {table}"
+        ).fetchone()
+        self._entries, self._bytes, self._clock = int(row[0]), int(row[1]), int(row[2])
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, bytes]:
+        found: Dict[str, bytes] = {}
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit.
+            for start in range(0, len(unique), 500):
+                part = unique[start : start + 500]
+                marks = ",".join("?" * len(part))
+                rows = self._conn.execute(f"SELECT key, value FROM {self._table} WHERE key IN ({marks})", part)
+                found.update((k, bytes(v)) for k, v in rows)
+            if found:
+                now = self._tick()
+                self._conn.executemany(
+                    f"UPDATE {self._table} SET last_access = ? WHERE key = ?",
+                    [(now, k) for k in found],
+                )
+                self._conn.commit()
+            self.hits += sum(1 for k in keys if k in found)
+            self.misses += sum(1 for k in keys if k not in found)
+        return found
+
+    def put(self, key: str, value: bytes) -> None:
+        self.put_many([(key, value)])
+
+    def put_many(self, items: Iterable[Tuple[str, bytes]]) -> None:
+        items = [(k, v) for k, v in items if len(v) <= self.max_bytes]
+        if not items:
+            return
+        with self._lock:
+            now = self._tick()
+            for key, value in items:
+                old = self._conn.execute(f"SELECT nbytes FROM {self._table} WHERE key = ?", (key,)).fetchone()
+                if old is not None:
+                    self._bytes -= int(old[0])
+                    self._entries -= 1
+                self._conn.execute(
+                    f"INSERT OR REPLACE INTO {self._table} (key, value, nbytes, last_access) VALUES (?, ?, ?, ?)",
+                    (key, sqlite3.Binary(value), len(value), now),
+                )
+                self._bytes += len(value)
+                self._entries += 1
+            self._evict()
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            old = self._conn.execute(f"SELECT nbytes FROM {self._table} WHERE key = ?", (key,)).fetchone()
+            if old is None:
+                return
+            self._conn.execute(f"DELETE FROM {self._table} WHERE key = ?", (key,))
+            self._conn.commit()
+            self._bytes -= int(old[0])
+            self._entries -= 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self._table}")
+            self._conn.commit()
+            self._entries = self._bytes = 0
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": self._entries,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _tick(self) -> int:
+        # Callers hold ``_lock``.
+        self._clock += 1
+        return self._clock
+
+    def _evict(self) -> None:
+        while self._bytes > self.max_bytes and self._entries:
+            rows = self._conn.execute(
+                f"SELECT key, nbytes FROM {self._table} ORDER BY last_access LIMIT 256"
+            ).fetchall()
+            for key, nbytes in rows:
+                if self._bytes <= self.max_bytes:
+                    break
+                self._conn.execute(f"DELETE FROM {self._table} WHERE key = ?", (key,))
+                self._bytes -= int(nbytes)
+                self._entries -= 1
+
+
+def _normalize_for_key(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class EmbeddingCache:
+    """Content-addressed embedding cache keyed by (provider, model, text hash)."""
+
+    def __init__(self, path: str, max_bytes: int, namespace: str):
+        self.namespace = namespace
+        self._store = SQLiteLRUStore(path, max_bytes, table="embeddings")
+
+    @property
+    def hits(self) -> int:
+        return self._store.hits
+
+    @property
+    def misses(self) -> int:
+        return self._store.misses
+
+    def key(self, text: str) -> str:
+        payload = f"{self.namespace}\0{_normalize_for_key(text)}".encode("utf-8")
+        return hashlib.sha256(payload).hexdigest()
+
+    def get_many(self, texts: Sequence[str]) -> Dict[int, np.ndarray]:
+        """Return cached vectors keyed by position in ``texts``."""
+        keys = [self.key(t) for t in texts]
+        found = self._store.get_many(keys)
+        return {i: np.frombuffer(found[k], dtype=np.float32) for i, k in enumerate(keys) if k in found}
+
+    def put_many(self, texts: Sequence[str], vectors: np.ndarray) -> None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self._store.put_many((self.key(t), v.tobytes()) for t, v in zip(texts, vectors))
+
+    def stats(self) -> Dict[str, float]:
+        return self._store.stats()
+
+    def clear(self) -> None:
+        self._store.clear()
+
+
+class ParseCache:
+    """Normalized page texts of parsed files, keyed by (parser signature, file hash).
+
+    Entries are zlib-compressed JSON in a size-bounded ``SQLiteLRUStore``, so
+    re-uploading the same bytes skips extraction and normalization entirely.
+    The signature should change whenever the parser, its libraries or the
+    normalization rules would produce different text.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self._store = SQLiteLRUStore(path, max_bytes, table="parsed_pages")
+        self._lock = threading.Lock()
+        self.seconds_saved = 0.0
+
+    @staticmethod
+    def key(data: bytes, signature: str) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        return hashlib.sha256(f"{signature}\0{digest}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[List[Tuple[Optional[int], str, Optional[int]]]]:
+        """Cached ``(number, text, total)`` pages, or None on a miss."""
+        raw = self._store.get(key)
+        if raw is None:
+            return None
+        entry = json.loads(zlib.decompress(raw))
+        with self._lock:
+            self.seconds_saved += entry["seconds"]
+        return [tuple(page) for page in entry["pages"]]
+
+    def put(self, key: str, pages: Sequence[Tuple[Optional[int], str, Optional[int]]], seconds: float) -> None:
+        """Store pages together with the parse time a later hit will save."""
+        entry = {"seconds": seconds, "pages": [list(page) for page in pages]}
+        payload = json.dumps(entry, ensure_ascii=False).encode("utf-8")
+        self._store.put(key, zlib.compress(payload, 6))
+
+    def stats(self) -> Dict[str, float]:
+        return {**self._store.stats(), "seconds_saved": round(self.seconds_saved, 3)}
+
+    def clear(self) -> None:
+        self._store.clear()
+
+
+@dataclass
+class AnswerCacheConfig:
+    enabled: bool = True
+    max_entries: int = 1000
+    ttl_seconds: float = 3600.0
+    semantic: bool = True
+    similarity_threshold: float = 0.95  # cosine similarity between query embeddings
+
+
+@dataclass
+class _AnswerEntry:
+    result: Dict
+    scope: Tuple
+    vector: Optional[np.ndarray]
+    chunk_ids: Tuple
+    created: float
+
+
+def normalize_query(query: str) -> str:
+    return _normalize_for_key(query).lower()
+
+
+class AnswerCache:
+    """Two-level answer cache: exact normalized query, then query-embedding similarity.
+
+    Entries expire after ``ttl_seconds``, are evicted LRU beyond
+    ``max_entries`` and are dropped as soon as any chunk they cite is
+    invalidated. ``scope`` separates answers produced with different
+    retrieval parameters or generators.
+    """
+
+    def __init__(self, config: AnswerCacheConfig):
+        self.config = config
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple, _AnswerEntry]" = OrderedDict()
+        self._by_chunk: Dict = {}
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: List[Tuple] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_exact(self, query: str, scope: Tuple = ()) -> Optional[Dict]:
+        """Exact lookup; a miss is counted here only when no semantic level follows."""
+        if not self.config.enabled:
+            return None
+        key = (scope, normalize_query(query))
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                if not self.config.semantic:
+                    self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            return entry.result
+
+    def get_similar(self, query_vector: np.ndarray, scope: Tuple = ()) -> Optional[Dict]:
+        """Semantic lookup after an exact miss; counts the lookup's single miss."""
+        if not (self.config.enabled and self.config.semantic):
+            return None
+        with self._lock:
+            if self._matrix is None:
+                self._rebuild_matrix()
+            if not self._matrix_keys:
+                self.misses += 1
+                return None
+            q = np.asarray(query_vector, dtype=np.float32).reshape(-1)
+            q = q / max(float(np.linalg.norm(q)), 1e-12)
+            sims = self._matrix @ q
+            for row in np.argsort(-sims):
+                if sims[row] < self.config.similarity_threshold:
+                    break
+                key = self._matrix_keys[row]
+                if key[0] != scope:
+                    continue
+                entry = self._live(key)
+                if entry is None:
+                    continue
+                self._entries.move_to_end(key)
+                self.semantic_hits += 1
+                return entry.result
+            self.misses += 1
+            return None
+
+    def put(
+        self,
+        query: str,
+        result: Dict,
+        chunk_ids: Sequence,
+        query_vector: Optional[np.ndarray] = None,
+        scope: Tuple = (),
+    ) -> None:
+        if not self.config.enabled:
+            return
+        key = (scope, normalize_query(query))
+        vector = None
+        if query_vector is not None:
+            vector = np.asarray(query_vector, dtype=np.float32).reshape(-1)
+            vector = vector / max(float(np.linalg.norm(vector)), 1e-12)
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = _AnswerEntry(result, scope, vector, tuple(chunk_ids), time.monotonic())
+            for cid in chunk_ids:
+                self._by_chunk.setdefault(cid, set()).add(key)
+            while len(self._entries) > self.config.max_entries:
+                self._drop(next(iter(self._entries)))
+            self._matrix = None
+
+    def invalidate_chunks(self, chunk_ids: Iterable) -> int:
+        """Drop every cached answer that cited one of ``chunk_ids``."""
+        dropped = 0
+        with self._lock:
+            for cid in chunk_ids:
+                for key in self._by_chunk.pop(cid, ()):
+                    dropped += self._drop(key)
+            if dropped:
+                self._matrix = None
+        return dropped
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_chunk.clear()
+            self._matrix = None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+        }
+
+    def _live(self, key: Tuple) -> Optional[_AnswerEntry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.created > self.config.ttl_seconds:
+            self._drop(key)
+            self._matrix = None
+            return None
+        return entry
+
+    def _drop(self, key: Tuple) -> int:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return 0
+        for cid in entry.chunk_ids:
+            keys = self._by_chunk.get(cid)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_chunk[cid]
+        return 1
+
+    def _rebuild_matrix(self) -> None:
+        keys = [key for key, entry in self._entries.items() if entry.vector is not None]
+        self._matrix_keys = keys
+        if keys:
+            self._matrix = np.vstack([self._entries[key].vector for key in keys])
+        else:
+            self._matrix = np.zeros((0, 0), dtype=np.float32)
@@ -1,34 +1,157 @@
 """Chunking strategies for engineering-grade RAG experiments."""
 
+import re
 from dataclasses import dataclass
-from typing import Iterable, List
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+Span = Tuple[int, int]
+EmbedFn = Callable[[Sequence[str]], np.ndarray]
+
+# Break points, strongest first: paragraph, line, sentence end, clause/word.
+_BOUNDARY_RE = re.compile(
+    r"(?P<paragraph>\n[ \t]*\n\s*)"
+    r"|(?P<line>\n)"
+    r"|(?P<sentence>[。！？；!?;…]+[”’」』\"')）]*|\.(?=\s))"
+    r"|(?P<clause>[，、,：:]|[ \t]+)"
+)
+_LEVEL = {"paragraph": 0, "line": 1, "sentence": 2, "clause": 3}
+_SENTENCE_LEVEL = _LEVEL["sentence"]
 
 
 @dataclass
 class ChunkConfig:
-    strategy: str = "recursive"
+    strategy: str = "recursive"  # fixed | recursive | semantic
     chunk_size: int = 500
     chunk_overlap: int = 100
+    semantic_percentile: float = 20.0  # split where adjacent-sentence similarity is in the lowest N%
 
 
-def chunk_text(text: str, config: ChunkConfig) -> List[str]:
-    """Minimal baseline chunking utility.
+def chunk_spans(text: str, config: ChunkConfig, embed: Optional[EmbedFn] = None) -> List[Span]:
+    """Return ``(start, end)`` character offsets of the chunks of ``text``.
 
-    This baseline intentionally keeps implementation simple so that you can
-    replace it with LangChain/LlamaIndex splitters later.
+    ``fixed`` slices fixed-width windows. ``recursive`` cuts each chunk at the
+    strongest separator (paragraph > line > sentence > clause) that keeps it
+    within ``chunk_size``, in one pass over precomputed boundaries; overlap
+    starts at a sentence boundary or is skipped. ``semantic`` embeds sentences
+    with ``embed`` and merges neighbours until their similarity drops.
     """
+    if config.strategy not in {"fixed", "recursive", "semantic"}:
+        raise ValueError(f"Unsupported strategy: {config.strategy}")
     if not text.strip():
         return []
 
-    if config.strategy not in {"fixed", "recursive", "semantic"}:
-        raise ValueError(f"Unsupported strategy: {config.strategy}")
+    size = max(1, config.chunk_size)
+    if config.strategy == "fixed":
+        step = max(1, size - config.chunk_overlap)
+        return [(i, min(i + size, len(text))) for i in range(0, len(text), step)]
+    if config.strategy == "recursive":
+        return _recursive_spans(text, size, max(0, config.chunk_overlap))
+    if embed is None:
+        raise ValueError("Semantic chunking requires an embedding function")
+    return _semantic_spans(text, size, config.semantic_percentile, embed)
+
 
-    step = max(1, config.chunk_size - config.chunk_overlap)
-    return [text[i : i + config.chunk_size] for i in range(0, len(text), step)]
+def chunk_text(text: str, config: ChunkConfig, embed: Optional[EmbedFn] = None) -> List[str]:
+    return [text[start:end] for start, end in chunk_spans(text, config, embed)]
 
 
-def batch_chunk(texts: Iterable[str], config: ChunkConfig) -> List[str]:
+def batch_chunk(texts: Iterable[str], config: ChunkConfig, embed: Optional[EmbedFn] = None) -> List[str]:
     output: List[str] = []
     for text in texts:
-        output.extend(chunk_text(text, config))
+        output.extend(chunk_text(text, config, embed))
     return output
+
+
+def _boundaries(text: str, lo: int, hi: int) -> List[Tuple[int, int]]:
+    return [(m.end(), _LEVEL[m.lastgroup]) for m in _BOUNDARY_RE.finditer(text, lo, hi)]
+
+
+def _trim(text: str, start: int, end: int) -> Optional[Span]:
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return (start, end) if start < end else None
+
+
+def _recursive_spans(text: str, size: int, overlap: int, lo: int = 0, hi: Optional[int] = None) -> List[Span]:
+    hi = len(text) if hi is None else hi
+    bounds = _boundaries(text, lo, hi)
+    spans: List[Span] = []
+    start, prev_end, j = lo, lo, 0
+    while start < hi:
+        limit = start + size
+        end = hi
+        if limit < hi:
+            while j < len(bounds) and bounds[j][0] <= start:
+                j += 1
+            # Ignore breaks in the first quarter so a stray newline does not
+            # produce a near-empty chunk, and breaks inside the overlap so each
+            # chunk adds new text.
+            floor = max(start + size // 4, prev_end)
+            best = [0, 0, 0, 0]
+            k = j
+            while k < len(bounds) and bounds[k][0] <= limit:
+                pos, level = bounds[k]
+                if pos > floor:
+                    best[level] = pos
+                k += 1
+            end = next((pos for pos in best if pos), limit)
+
+        span = _trim(text, start, end)
+        if span is not None:
+            spans.append(span)
+        if end >= hi:
+            break
+
+        prev_end = next_start = end
+        if overlap:
+            k = j
+            while k < len(bounds) and bounds[k][0] < end:
+                pos, level = bounds[k]
+                if pos >= end - overlap and pos > start and level <= _SENTENCE_LEVEL:
+                    next_start = pos
+                    break
+                k += 1
+        start = next_start
+    return spans
+
+
+def _sentence_spans(text: str, size: int) -> List[Span]:
+    """Sentence-or-stronger pieces; pieces longer than ``size`` are split recursively."""
+    spans: List[Span] = []
+    start = 0
+    cuts = [pos for pos, level in _boundaries(text, 0, len(text)) if level <= _SENTENCE_LEVEL]
+    for end in cuts + [len(text)]:
+        span = _trim(text, start, end)
+        start = end
+        if span is None:
+            continue
+        if span[1] - span[0] > size:
+            spans.extend(_recursive_spans(text, size, 0, span[0], span[1]))
+        else:
+            spans.append(span)
+    return spans
+
+
+def _semantic_spans(text: str, size: int, percentile: float, embed: EmbedFn) -> List[Span]:
+    sentences = _sentence_spans(text, size)
+    if len(sentences) <= 1:
+        return sentences
+
+    vectors = np.asarray(embed([text[s:e] for s, e in sentences]), dtype=np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    similarity = np.einsum("ij,ij->i", vectors[:-1], vectors[1:])
+    breaks = similarity < np.percentile(similarity, percentile)
+
+    spans: List[Span] = []
+    start, end = sentences[0]
+    for i, (s, e) in enumerate(sentences[1:]):
+        if breaks[i] or e - start > size:
+            spans.append((start, end))
+            start = s
+        end = e
+    spans.append((start, end))
+    return spans
@@ -0,0 +1,186 @@
+"""Token-budget-aware packing of evidence into generation prompts."""
+
+from __future__ import annotations
+
+import math
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]")
+
+
+@dataclass
+class ContextConfig:
+    max_tokens: int = 2000  # evidence budget, excluding the instructions and question
+    tokenizer: str = "auto"  # auto | estimate | tiktoken:<model or encoding> | hf:<model>
+    cache_size: int = 50000  # cached token counts per distinct text
+    merge_gap: int = 4  # characters of trimmed whitespace allowed between adjacent chunks
+
+
+@dataclass
+class Passage:
+    """One evidence candidate; ``source``/``start``/``end`` enable merging.
+
+    ``source`` identifies the text the chunk was cut from, such as
+    ``(doc_id, page)``, and ``start``/``end`` are character offsets of
+    ``text`` within it, as recorded by ``ChunkStore.source_span``.
+    """
+
+    label: str
+    text: str
+    score: float = 0.0
+    source: Optional[Hashable] = None
+    start: Optional[int] = None
+    end: Optional[int] = None
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap tokenizer-free estimate: one token per CJK character, ~4 chars otherwise."""
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+class TokenCounter:
+    """Count tokens with the target model's tokenizer, memoised per text.
+
+    ``auto`` uses tiktoken for OpenAI models and the estimator otherwise
+    (Ollama does not expose its tokenizer). If the requested tokenizer cannot
+    be loaded the estimator is used instead.
+    """
+
+    def __init__(self, spec: str = "auto", provider: str = "", model: str = "", cache_size: int = 50000):
+        self.name, encode = _resolve_tokenizer(spec, provider, model)
+        self._count_uncached = (lambda text: len(encode(text))) if encode else estimate_tokens
+        self._cached = lru_cache(maxsize=max(0, cache_size))(self._count_uncached)
+
+    @classmethod
+    def from_tokenizer(cls, tokenizer, cache_size: int = 50000) -> "TokenCounter":
+        """Wrap an already loaded Hugging Face tokenizer."""
+        counter = cls("estimate", cache_size=cache_size)
+        counter.name = getattr(tokenizer, "name_or_path", "hf")
+        counter._count_uncached = lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+        counter._cached = lru_cache(maxsize=max(0, cache_size))(counter._count_uncached)
+        return counter
+
+    def count(self, text: str) -> int:
+        return self._cached(text)
+
+
+def _resolve_tokenizer(spec: str, provider: str, model: str) -> Tuple[str, Optional[Callable[[str], list]]]:
+    if spec == "auto":
+        spec = f"tiktoken:{model}" if provider == "openai" else "estimate"
+    kind, _, name = spec.partition(":")
+    try:
+        if kind == "tiktoken":
+            import tiktoken
+
+            try:
+                enc = tiktoken.encoding_for_model(name)
+            except KeyError:
+                enc = tiktoken.get_encoding(name or "cl100k_base")
+            return spec, enc.encode_ordinary
+        if kind == "hf":
+            from transformers import AutoTokenizer
+
+            tok = AutoTokenizer.from_pretrained(name)
+            return spec, lambda text: tok.encode(text, add_special_tokens=False)
+    except Exception:  # missing package or tokenizer files
+        return "estimate", None
+    if kind != "estimate":
+        raise ValueError(f"Unsupported tokenizer: {spec}")
+    return "estimate", None
+
+
+class ContextPacker:
+    """Select and merge passages to fit ``config.max_tokens``.
+
+    Passages are visited by descending score. A passage from the same source
+    that overlaps or directly follows an already selected one in the source
+    text is merged into it, so the overlap created by ``chunk_overlap`` is paid for once and
+    neighbouring chunks read as one span; passages fully contained in a
+    selection cost nothing and are dropped. Every other passage is kept if
+    its token cost still fits the budget, otherwise it is skipped in favour
+    of lower-ranked ones that do.
+    """
+
+    def __init__(self, config: ContextConfig, counter: Optional[TokenCounter] = None):
+        self.config = config
+        self.counter = counter or TokenCounter(config.tokenizer, cache_size=config.cache_size)
+
+    def pack(self, passages: Sequence[Passage], max_tokens: Optional[int] = None) -> List[Tuple[str, str]]:
+        """Return ``(label, text)`` evidence in descending score order."""
+        budget = self.config.max_tokens if max_tokens is None else max_tokens
+        count = self.counter.count
+        groups: List[_Group] = []
+        seen_text: Dict[str, None] = {}
+        used = 0
+        for passage in sorted(passages, key=lambda p: p.score, reverse=True):
+            if passage.text in seen_text:
+                continue
+            group = self._mergeable(groups, passage)
+            if group is not None:
+                merged = group.merged_with(passage)
+                if merged is None:  # fully contained
+                    continue
+                cost = count(merged.text) - group.tokens
+                if used + cost > budget:
+                    continue
+                merged.tokens = group.tokens + cost
+                groups[groups.index(group)] = merged
+            else:
+                cost = count(passage.text)
+                if used + cost > budget:
+                    continue
+                groups.append(_Group.of(passage, cost))
+            used += cost
+            seen_text[passage.text] = None
+        return [(",".join(g.labels), g.text) for g in groups]
+
+    def _mergeable(self, groups: List["_Group"], passage: Passage) -> Optional["_Group"]:
+        if passage.source is None or passage.start is None or passage.end is None:
+            return None
+        gap = self.config.merge_gap
+        for group in groups:
+            if group.source == passage.source and passage.start <= group.end + gap and group.start <= passage.end + gap:
+                return group
+        return None
+
+
+@dataclass
+class _Group:
+    labels: List[str]
+    text: str
+    tokens: int
+    source: Optional[Hashable] = None
+    start: Optional[int] = None
+    end: Optional[int] = None
+
+    @classmethod
+    def of(cls, passage: Passage, tokens: int) -> "_Group":
+        return cls([passage.label], passage.text, tokens, passage.source, passage.start, passage.end)
+
+    def merged_with(self, passage: Passage) -> Optional["_Group"]:
+        if self.start <= passage.start and passage.end <= self.end:
+            return None
+        if passage.start < self.start:
+            head, head_end, tail, tail_start = passage.text, passage.end, self.text, self.start
+        else:
+            head, head_end, tail, tail_start = self.text, self.end, passage.text, passage.start
+        if tail_start > head_end:
+            # The gap was trimmed whitespace that neither chunk kept: separate the
+            # spans, padded to the gap width so offsets into ``text`` stay aligned.
+            text = head + "\n".ljust(tail_start - head_end) + tail
+        else:
+            text = head + tail[head_end - tail_start :]
+        # Labels stay in document order.
+        labels = [passage.label] + self.labels if passage.start < self.start else self.labels + [passage.label]
+        return _Group(
+            labels,
+            text,
+            self.tokens,
+            self.source,
+            min(self.start, passage.start),
+            max(self.end, passage.end),
+        )
@@ -1,24 +1,175 @@
 """Embedding provider abstraction for OpenAI/BGE comparison."""
 
+from __future__ import annotations
+
+import re
+import threading
+import zlib
 from dataclasses import dataclass
-from typing import List
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .cache import EmbeddingCache
 
 
 @dataclass
 class EmbeddingConfig:
-    provider: str = "bge"
+    provider: str = "bge"  # bge | openai | hash
     model: str = "BAAI/bge-large-zh-v1.5"
+    device: str = "cpu"
+    batch_size: int = 32
+    num_threads: int = 0  # 0 keeps the torch default
+    max_seq_length: int = 512
+    normalize: bool = True
+    dim: int = 256  # only used by the offline "hash" provider
+    cache_path: Optional[str] = None  # SQLite file; None disables the cache
+    cache_max_mb: int = 1024
+
+
+_MODEL_CACHE: Dict[Tuple[str, str], object] = {}
+_MODEL_LOCK = threading.Lock()
+_TOKEN_RE = re.compile(r"[a-z0-9]+|[\u4e00-\u9fff]")
+
+
+def _load_sentence_transformer(model: str, device: str):
+    """Load a sentence-transformers model once per process."""
+    key = (model, device)
+    with _MODEL_LOCK:
+        if key not in _MODEL_CACHE:
+            from sentence_transformers import SentenceTransformer
+
+            _MODEL_CACHE[key] = SentenceTransformer(model, device=device)
+        return _MODEL_CACHE[key]
+
+
+def length_sorted_batches(texts: Sequence[str], batch_size: int) -> Iterator[np.ndarray]:
+    """Yield index batches of similar-length texts to minimise padding."""
+    if not len(texts):
+        return
+    order = np.argsort([len(t) for t in texts], kind="stable")
+    for start in range(0, len(order), max(1, batch_size)):
+        yield order[start : start + batch_size]
 
 
 class EmbeddingProvider:
     def __init__(self, config: EmbeddingConfig):
+        if config.provider not in {"openai", "bge", "hash"}:
+            raise ValueError(f"Unsupported embedding provider: {config.provider}")
         self.config = config
+        self._model = None
+        self._client = None
+        self.cache: Optional[EmbeddingCache] = None
+        if config.cache_path:
+            self.cache = EmbeddingCache(
+                config.cache_path,
+                max_bytes=config.cache_max_mb * 1024 * 1024,
+                namespace=self._cache_namespace(),
+            )
 
-    def embed(self, texts: List[str]) -> List[List[float]]:
-        """Placeholder embedding method.
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed ``texts`` into a ``(len(texts), dim)`` float32 matrix.
 
-        Replace with real API/model calls in production.
+        Cached vectors are reused; the remaining inputs are encoded in
+        length-sorted micro-batches of at most ``config.batch_size`` and
+        scattered back into input order.
         """
-        if self.config.provider not in {"openai", "bge"}:
-            raise ValueError(f"Unsupported embedding provider: {self.config.provider}")
-        return [[float(len(t) % 10)] * 8 for t in texts]
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        cached = self.cache.get_many(texts) if self.cache is not None else {}
+        missing = [i for i in range(len(texts)) if i not in cached]
+        computed = self._embed_uncached([texts[i] for i in missing]) if missing else None
+        if computed is not None and self.cache is not None:
+            self.cache.put_many([texts[i] for i in missing], computed)
+        if not cached:
+            return computed
+
+        dim = next(iter(cached.values())).shape[0]
+        out = np.empty((len(texts), dim), dtype=np.float32)
+        for i, vector in cached.items():
+            out[i] = vector
+        if computed is not None:
+            out[missing] = computed
+        return out
+
+    def cache_stats(self) -> Dict[str, float]:
+        return self.cache.stats() if self.cache is not None else {}
+
+    def _embed_uncached(self, texts: List[str]) -> np.ndarray:
+        out = None
+        for idx in length_sorted_batches(texts, self.config.batch_size):
+            vectors = self._encode([texts[i] for i in idx])
+            if out is None:
+                out = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+            out[idx] = vectors
+        return out
+
+    def _cache_namespace(self) -> str:
+        cfg = self.config
+        parts = [cfg.provider, cfg.model, f"norm={cfg.normalize}"]
+        if cfg.provider == "hash":
+            parts.append(f"dim={cfg.dim}")
+        if cfg.provider == "bge":
+            parts.append(f"max_len={cfg.max_seq_length}")
+        return "|".join(parts)
+
+    @property
+    def dim(self) -> int:
+        if self.config.provider == "hash":
+            return self.config.dim
+        if self.config.provider == "bge":
+            return int(self._sentence_model().get_sentence_embedding_dimension())
+        return int(self.embed(["dim"]).shape[1])
+
+    def _encode(self, batch: List[str]) -> np.ndarray:
+        if self.config.provider == "bge":
+            return self._encode_bge(batch)
+        if self.config.provider == "openai":
+            return self._encode_openai(batch)
+        return self._encode_hash(batch)
+
+    def _sentence_model(self):
+        if self._model is None:
+            if self.config.num_threads > 0:
+                import torch
+
+                torch.set_num_threads(self.config.num_threads)
+            self._model = _load_sentence_transformer(self.config.model, self.config.device)
+            self._model.max_seq_length = self.config.max_seq_length
+        return self._model
+
+    def _encode_bge(self, batch: List[str]) -> np.ndarray:
+        vectors = self._sentence_model().encode(
+            batch,
+            batch_size=len(batch),
+            normalize_embeddings=self.config.normalize,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+        return np.asarray(vectors, dtype=np.float32)
+
+    def _encode_openai(self, batch: List[str]) -> np.ndarray:
+        if self._client is None:
+            from openai import OpenAI
+
+            self._client = OpenAI()
+        resp = self._client.embeddings.create(model=self.config.model, input=batch)
+        vectors = np.asarray([item.embedding for item in resp.data], dtype=np.float32)
+        return self._maybe_normalize(vectors)
+
+    def _encode_hash(self, batch: List[str]) -> np.ndarray:
+        """Deterministic feature-hashing embedding for offline runs and benchmarks."""
+        dim = self.config.dim
+        vectors = np.zeros((len(batch), dim), dtype=np.float32)
+        for row, text in enumerate(batch):
+            for token in _TOKEN_RE.findall(text.lower()):
+                h = zlib.crc32(token.encode("utf-8"))
+                vectors[row, h % dim] += 1.0 if h & 0x80000000 else -1.0
+        return self._maybe_normalize(vectors)
+
+    def _maybe_normalize(self, vectors: np.ndarray) -> np.ndarray:
+        if not self.config.normalize:
+            return vectors
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
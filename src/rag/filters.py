@@ -0,0 +1,180 @@
+"""Metadata filters compiled into chunk-id bitmaps.
+
+A filter is a JSON-style mapping in the spirit of Chroma/MongoDB ``where``
+clauses::
+
+    {"source_type": "pdf", "page": {"$gte": 3, "$lte": 10}}
+    {"$or": [{"doc_id": {"$in": ["a", "b"]}}, {"tags": "finance"}]}
+
+Fields are ``doc_id``, ``source_type``, ``tags`` and ``ingested_at``
+(per document) and ``page`` (per chunk; the page or slide number). Document
+fields are evaluated once per document and broadcast to chunks through the
+store's ``doc`` column, so compiling a filter is a few vectorised passes over
+the metadata columns. The result is a boolean mask indexed by chunk id that
+the dense and sparse retrievers apply while scoring.
+"""
+
+from __future__ import annotations
+
+import json
+from datetime import datetime
+from typing import Callable, Dict, List, Mapping, Optional, Sequence
+
+import numpy as np
+
+from .registry import DocumentRegistry
+from .store import ChunkStore
+
+_DOC_FIELDS = {"doc_id", "source_type", "tags", "ingested_at"}
+_CHUNK_FIELDS = {"page"}
+_COMPARE = {
+    "$eq": np.equal,
+    "$ne": np.not_equal,
+    "$gt": np.greater,
+    "$gte": np.greater_equal,
+    "$lt": np.less,
+    "$lte": np.less_equal,
+}
+
+
+def filter_key(where: Optional[Mapping]) -> str:
+    """Canonical text of a filter, used for cache keys."""
+    return json.dumps(where or {}, sort_keys=True, ensure_ascii=False)
+
+
+def compile_filter(where: Mapping, store: ChunkStore, registry: DocumentRegistry) -> np.ndarray:
+    """Boolean mask over ``store.capacity`` chunk ids; True marks live chunks matching ``where``."""
+    return _Compiler(store, registry).node(where) & store.column("alive")
+
+
+class _Compiler:
+    def __init__(self, store: ChunkStore, registry: DocumentRegistry):
+        self.store = store
+        self.registry = registry
+        self._docs: Optional[Dict[str, list]] = None
+
+    def node(self, where: Mapping) -> np.ndarray:
+        if not isinstance(where, Mapping):
+            raise ValueError(f"Filter must be a mapping, got {type(where).__name__}")
+        mask = np.ones(self.store.capacity, dtype=bool)
+        for key, value in where.items():
+            if key == "$and":
+                for sub in _clauses(key, value):
+                    mask &= self.node(sub)
+            elif key == "$or":
+                any_of = np.zeros_like(mask)
+                for sub in _clauses(key, value):
+                    any_of |= self.node(sub)
+                mask &= any_of
+            elif key == "$not":
+                mask &= ~self.node(value)
+            elif key in _DOC_FIELDS:
+                mask &= self._doc_field(key, value)[self.store.column("doc")]
+            elif key in _CHUNK_FIELDS:
+                pages = self.store.column("page").astype(np.int64)
+                mask &= _apply(value, lambda op, arg: _page_match(pages, op, arg))
+            else:
+                raise ValueError(f"Unsupported filter field: {key}")
+        return mask
+
+    def _doc_field(self, name: str, value) -> np.ndarray:
+        """Evaluate a document-level condition once per document."""
+        column = self._columns()[name]
+        if name == "tags":
+            return _apply(value, lambda op, arg: _tags_match(column, op, arg))
+        if name == "ingested_at":
+            times = np.asarray(column, dtype=np.float64)
+            return _apply(value, lambda op, arg: _compare(times, op, _timestamp(arg)))
+        values = np.asarray(column, dtype=object)
+        return _apply(value, lambda op, arg: _compare(values, op, arg))
+
+    def _columns(self) -> Dict[str, list]:
+        if self._docs is None:
+            docs: Dict[str, list] = {name: [] for name in _DOC_FIELDS}
+            for doc_id in self.store.doc_names():
+                record = self.registry.get(doc_id)
+                docs["doc_id"].append(doc_id)
+                docs["source_type"].append(record.source_type if record else None)
+                docs["tags"].append(frozenset(record.tags) if record else frozenset())
+                docs["ingested_at"].append(record.ingested_at if record else np.nan)
+            self._docs = docs
+        return self._docs
+
+
+def _clauses(op: str, value) -> List[Mapping]:
+    if not isinstance(value, Sequence) or isinstance(value, (str, bytes)):
+        raise ValueError(f"{op} expects a list of filters")
+    return list(value)
+
+
+def _apply(condition, test: Callable[[str, object], np.ndarray]) -> np.ndarray:
+    """AND together ``{op: arg}`` conditions; a bare value means ``$eq``, a bare list ``$in``."""
+    if isinstance(condition, list):
+        return test("$in", condition)
+    if not isinstance(condition, Mapping):
+        return test("$eq", condition)
+    result = None
+    for op, arg in condition.items():
+        part = test(op, arg)
+        result = part if result is None else result & part
+    if result is None:
+        raise ValueError("Empty filter condition")
+    return result
+
+
+def _compare(values: np.ndarray, op: str, arg) -> np.ndarray:
+    if op in ("$in", "$nin"):
+        if not isinstance(arg, Sequence) or isinstance(arg, (str, bytes)):
+            raise ValueError(f"{op} expects a list")
+        hit = np.zeros(len(values), dtype=bool)
+        for item in arg:
+            hit |= np.asarray(values == item, dtype=bool)
+        return hit if op == "$in" else ~hit
+    compare = _COMPARE.get(op)
+    if compare is None:
+        raise ValueError(f"Unsupported filter operator: {op}")
+    if values.dtype == object:
+        # Ordering on strings is element-wise Python comparison; missing values never match.
+        return np.fromiter(
+            (value is not None and bool(compare(value, arg)) for value in values), dtype=bool, count=len(values)
+        )
+    return np.asarray(compare(values, arg), dtype=bool)
+
+
+def _tags_match(tags: List[frozenset], op: str, arg) -> np.ndarray:
+    """``tags: x`` matches documents carrying tag x; ``$in`` any of, ``$all`` every one of."""
+    if op in ("$eq", "$ne"):
+        wanted = frozenset([arg])
+    elif op in ("$in", "$nin", "$all"):
+        if not isinstance(arg, Sequence) or isinstance(arg, (str, bytes)):
+            raise ValueError(f"{op} expects a list")
+        wanted = frozenset(arg)
+    else:
+        raise ValueError(f"Unsupported operator for tags: {op}")
+    if op == "$all":
+        hit = (wanted <= doc_tags for doc_tags in tags)
+    else:
+        hit = (bool(doc_tags & wanted) for doc_tags in tags)
+    result = np.fromiter(hit, dtype=bool, count=len(tags))
+    return ~result if op in ("$ne", "$nin") else result
+
+
+def _page_match(pages: np.ndarray, op: str, arg) -> np.ndarray:
+    # Chunks without a page number are stored as -1 and only match ``None``.
+    if isinstance(arg, list):
+        arg = [-1 if item is None else int(item) for item in arg]
+    else:
+        arg = -1 if arg is None else int(arg)
+    result = _compare(pages, op, arg)
+    if op in ("$gt", "$gte", "$lt", "$lte"):
+        result &= pages >= 0
+    return result
+
+
+def _timestamp(arg):
+    """Accept unix seconds or ISO-8601 strings for ``ingested_at``."""
+    if isinstance(arg, list):
+        return [_timestamp(item) for item in arg]
+    if isinstance(arg, str):
+        return datetime.fromisoformat(arg).timestamp()
+    return float(arg)
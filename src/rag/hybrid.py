@@ -0,0 +1,62 @@
+"""Fusion of dense and sparse retrieval results."""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+Hits = List[Tuple[Hashable, float]]
+
+
+@dataclass
+class RetrievalConfig:
+    mode: str = "hybrid"  # dense | sparse | hybrid
+    fusion: str = "rrf"  # rrf | weighted
+    rrf_k: int = 60
+    dense_weight: float = 0.5
+    candidate_multiplier: int = 2  # each retriever returns top_k * multiplier before fusion
+
+
+def reciprocal_rank_fusion(
+    result_lists: Sequence[Hits],
+    k: int = 60,
+    weights: Optional[Sequence[float]] = None,
+) -> Hits:
+    """Combine ranked lists by summing ``weight / (k + rank)`` per id."""
+    weights = weights or [1.0] * len(result_lists)
+    fused: Dict[Hashable, float] = {}
+    for hits, weight in zip(result_lists, weights):
+        for rank, (doc_id, _) in enumerate(hits, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + weight / (k + rank)
+    return sorted(fused.items(), key=lambda x: x[1], reverse=True)
+
+
+def weighted_score_fusion(result_lists: Sequence[Hits], weights: Sequence[float]) -> Hits:
+    """Combine min-max normalised scores with per-retriever weights."""
+    fused: Dict[Hashable, float] = {}
+    for hits, weight in zip(result_lists, weights):
+        if not hits:
+            continue
+        scores = [s for _, s in hits]
+        lo, hi = min(scores), max(scores)
+        span = hi - lo
+        for doc_id, score in hits:
+            norm = (score - lo) / span if span > 0 else 1.0
+            fused[doc_id] = fused.get(doc_id, 0.0) + weight * norm
+    return sorted(fused.items(), key=lambda x: x[1], reverse=True)
+
+
+def fuse(dense: Hits, sparse: Hits, config: RetrievalConfig, top_k: int) -> Hits:
+    if config.mode == "dense":
+        return dense[:top_k]
+    if config.mode == "sparse":
+        return sparse[:top_k]
+    if config.mode != "hybrid":
+        raise ValueError(f"Unsupported retrieval mode: {config.mode}")
+
+    weights = [config.dense_weight, 1.0 - config.dense_weight]
+    if config.fusion == "rrf":
+        return reciprocal_rank_fusion([dense, sparse], k=config.rrf_k, weights=weights)[:top_k]
+    if config.fusion == "weighted":
+        return weighted_score_fusion([dense, sparse], weights)[:top_k]
+    raise ValueError(f"Unsupported fusion method: {config.fusion}")
@@ -1,23 +1,1080 @@
 """Index abstraction for FAISS/Chroma experimentation."""
 
-from dataclasses import dataclass
-from typing import Dict, List
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+import uuid
+import weakref
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+ChunkId = Union[int, str]
 
 
 @dataclass
 class IndexConfig:
-    backend: str = "faiss"
+    backend: str = "faiss"  # memory | faiss | chroma
+    metric: str = "cosine"  # cosine | ip
+    initial_capacity: int = 1024
+
+    # Memory backend storage: float32 | float16 | int8 | pq (pq uses pq_m below).
+    storage: str = "float32"
+    refine_factor: int = 4  # re-score top_k * factor candidates with float32; 0 disables
+    quant_train_size: int = 4096  # int8/pq: vectors searched exactly before training
+    spill_dir: Optional[str] = None  # float32 vectors are memory-mapped from here (default: temp dir)
+
+    # FAISS: flat | ivf_flat | ivf_pq | hnsw
+    faiss_index: str = "flat"
+    nlist: int = 1024
+    nprobe: int = 16
+    ivf_train_size: int = 0  # vectors buffered before IVF training; 0 means 39 * nlist (FAISS's minimum)
+    ivf_retrain_factor: float = 4.0  # retrain once the corpus is this many times the training set; 0 disables
+    pq_m: int = 16
+    pq_nbits: int = 8
+    hnsw_m: int = 32
+    ef_construction: int = 200
+    ef_search: int = 64
+    hnsw_rebuild_ratio: float = 0.2  # rebuild the graph once this fraction of its nodes is deleted; 0 disables
+
+    # Chroma: embedded client, persisted when persist_dir is set.
+    chroma_collection: str = "rag_chunks"
+    persist_dir: Optional[str] = None
+
+
+def create_index(config: IndexConfig):
+    """Build the vector index selected by ``config.backend``."""
+    if config.backend == "memory":
+        return InMemoryIndex(config) if config.storage == "float32" else QuantizedIndex(config)
+    if config.backend == "faiss":
+        return FaissIndex(config)
+    if config.backend == "chroma":
+        return ChromaIndex(config)
+    raise ValueError(f"Unsupported index backend: {config.backend}")
+
+
+def _check_metric(config: IndexConfig) -> None:
+    if config.metric not in {"cosine", "ip"}:
+        raise ValueError(f"Unsupported index metric: {config.metric}")
+
+
+def _as_matrix(vectors, metric: str) -> np.ndarray:
+    arr = np.asarray(vectors, dtype=np.float32)
+    if arr.ndim == 1:
+        arr = arr[None, :]
+    if metric == "cosine" and arr.size:
+        norms = np.linalg.norm(arr, axis=1, keepdims=True)
+        arr = arr / np.maximum(norms, 1e-12)
+    return np.ascontiguousarray(arr)
+
+
+def _write_meta(path: Path, config: IndexConfig, **extra) -> None:
+    meta = {"config": asdict(config), **extra}
+    (path / "meta.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+
+
+def _read_meta(path: Path) -> Dict:
+    return json.loads((path / "meta.json").read_text(encoding="utf-8"))
 
 
 class InMemoryIndex:
+    """Exact vector search over a contiguous float32 matrix.
+
+    Vectors live in a preallocated ``(capacity, dim)`` matrix that doubles when
+    full, with a parallel id list mapping rows back to chunk ids. Queries are
+    scored with a single matmul and the top-k rows are selected with
+    ``argpartition`` so the cost stays linear in the corpus size.
+    """
+
     def __init__(self, config: IndexConfig):
-        if config.backend not in {"faiss", "chroma"}:
-            raise ValueError(f"Unsupported index backend: {config.backend}")
+        _check_metric(config)
         self.config = config
-        self._store: Dict[str, List[float]] = {}
+        self._matrix = np.empty((0, 0), dtype=np.float32)
+        self._ids: List[ChunkId] = []
+        self._row_of: Dict[ChunkId, int] = {}
+        self._row_ids: Optional[np.ndarray] = None  # chunk id per row, rebuilt lazily for filtering
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @property
+    def dim(self) -> int:
+        return self._matrix.shape[1]
+
+    def upsert(self, doc_id: ChunkId, vector: Sequence[float]) -> None:
+        self.upsert_batch([doc_id], [vector])
+
+    def upsert_batch(self, ids: Sequence[ChunkId], vectors) -> None:
+        vectors = _as_matrix(vectors, self.config.metric)
+        if len(ids) != vectors.shape[0]:
+            raise ValueError(f"Got {len(ids)} ids for {vectors.shape[0]} vectors")
+        if not len(ids):
+            return
+        self._ensure_capacity(len(self._ids) + len(ids), vectors.shape[1])
+        self._row_ids = None
+
+        for doc_id, vector in zip(ids, vectors):
+            row = self._row_of.get(doc_id)
+            if row is None:
+                row = len(self._ids)
+                self._ids.append(doc_id)
+                self._row_of[doc_id] = row
+            self._matrix[row] = vector
+
+    def remove(self, ids: Sequence[ChunkId]) -> None:
+        """Delete rows by moving the last row into each freed slot."""
+        self._row_ids = None
+        for doc_id in ids:
+            row = self._row_of.pop(doc_id, None)
+            if row is None:
+                continue
+            last = len(self._ids) - 1
+            if row != last:
+                moved = self._ids[last]
+                self._matrix[row] = self._matrix[last]
+                self._ids[row] = moved
+                self._row_of[moved] = row
+            self._ids.pop()
+
+    def search(self, query_vector: Sequence[float], top_k: int = 5) -> List[ChunkId]:
+        return self.search_batch([query_vector], top_k=top_k)[0]
+
+    def search_batch(self, query_vectors, top_k: int = 5) -> List[List[ChunkId]]:
+        return [[doc_id for doc_id, _ in hits] for hits in self.search_batch_scored(query_vectors, top_k)]
+
+    def search_batch_scored(
+        self, query_vectors, top_k: int = 5, allowed: Optional[np.ndarray] = None
+    ) -> List[List[Tuple[ChunkId, float]]]:
+        """Score every query against the corpus in one matmul.
+
+        ``allowed`` is a boolean mask indexed by chunk id; other rows are
+        excluded before top-k selection rather than filtered afterwards.
+        """
+        queries = _as_matrix(query_vectors, self.config.metric)
+        n = len(self._ids)
+        if not n or top_k <= 0:
+            return [[] for _ in range(queries.shape[0])]
+        if queries.shape[1] != self.dim:
+            raise ValueError(f"Query dim {queries.shape[1]} does not match index dim {self.dim}")
+
+        scores = queries @ self._matrix[:n].T
+        if allowed is not None:
+            if self._row_ids is None:
+                self._row_ids = chunk_id_array(self._ids)
+            scores[:, ~mask_ids(self._row_ids, allowed)] = -np.inf
+        rows = topk_rows(scores, top_k)
+        top_scores = np.take_along_axis(scores, rows, axis=1)
+        return [
+            [(self._ids[r], float(s)) for r, s in zip(row_ids, row_scores) if s > -np.inf]
+            for row_ids, row_scores in zip(rows, top_scores)
+        ]
+
+    def save(self, path: str) -> None:
+        out = Path(path)
+        out.mkdir(parents=True, exist_ok=True)
+        np.save(out / "vectors.npy", self._matrix[: len(self._ids)])
+        _write_meta(out, self.config, ids=self._ids)
+
+    def load(self, path: str) -> None:
+        src = Path(path)
+        meta = _read_meta(src)
+        matrix = np.load(src / "vectors.npy")
+        self._ids = list(meta["ids"])
+        self._row_of = {doc_id: row for row, doc_id in enumerate(self._ids)}
+        self._row_ids = None
+        self._matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+
+    def _ensure_capacity(self, size: int, dim: int) -> None:
+        if not self._ids and self._matrix.shape[1] != dim:
+            self._matrix = np.empty((max(self.config.initial_capacity, size), dim), dtype=np.float32)
+            return
+        if dim != self.dim:
+            raise ValueError(f"Vector dim {dim} does not match index dim {self.dim}")
+        capacity = self._matrix.shape[0]
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity = max(1, capacity * 2)
+        grown = np.empty((capacity, dim), dtype=np.float32)
+        grown[: len(self._ids)] = self._matrix[: len(self._ids)]
+        self._matrix = grown
+
+
+class _VectorFile:
+    """Full-precision float32 rows in a memory-mapped file that grows by doubling.
+
+    Only the rows touched by a search are paged in, so the resident cost of
+    the float copy stays small. A file opened from a snapshot is read-only
+    until the first write, which copies it to a private working file.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self._dir = directory
+        self._path: Optional[str] = None
+        self._rows: Optional[np.ndarray] = None
+        self._writable = False
+        self._cleanup = None
+
+    @property
+    def capacity(self) -> int:
+        return 0 if self._rows is None else self._rows.shape[0]
+
+    def reserve(self, size: int, dim: int) -> None:
+        if self._rows is not None and self._writable and size <= self.capacity:
+            return
+        capacity = max(self.capacity, 1)
+        while capacity < size:
+            capacity *= 2
+        old = self._rows
+        if not self._writable:
+            fd, path = tempfile.mkstemp(suffix=".f32", dir=self._dir)
+            os.close(fd)
+            self._replace_path(path)
+        with open(self._path, "r+b") as fh:
+            fh.truncate(capacity * dim * 4)
+        rows = np.memmap(self._path, dtype=np.float32, mode="r+", shape=(capacity, dim))
+        if old is not None and not self._writable:
+            for start in range(0, old.shape[0], 65536):
+                stop = min(old.shape[0], start + 65536)
+                rows[start:stop] = old[start:stop]
+        self._rows = rows
+        self._writable = True
+
+    def write(self, rows, vectors: np.ndarray) -> None:
+        self._detach()
+        self._rows[rows] = vectors
+
+    def move(self, dst: int, src: int) -> None:
+        self._detach()
+        self._rows[dst] = self._rows[src]
+
+    def _detach(self) -> None:
+        # Every write path goes through here so a snapshot memmap is never written in place.
+        if not self._writable and self._rows is not None:
+            self.reserve(self.capacity, self._rows.shape[1])
+
+    def take(self, rows) -> np.ndarray:
+        return np.asarray(self._rows[rows], dtype=np.float32)
+
+    def head(self, n: int) -> np.ndarray:
+        return self._rows[:n]
+
+    def save(self, path: Path, n: int) -> None:
+        # Write beside the target and swap it in: ``path`` may be the very file
+        # this instance is still reading from, which "w+" would truncate.
+        tmp = path.with_name(path.name + ".tmp")
+        out = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=(n, self._rows.shape[1]))
+        for start in range(0, n, 65536):
+            stop = min(n, start + 65536)
+            out[start:stop] = self._rows[start:stop]
+        out.flush()
+        del out
+        os.replace(tmp, path)
+
+    def open(self, path: Path) -> None:
+        self._replace_path(None)
+        self._rows = np.load(path, mmap_mode="r")
+        self._writable = False
+
+    def _replace_path(self, path: Optional[str]) -> None:
+        self._rows = None
+        if self._cleanup is not None:
+            self._cleanup()
+        self._path = path
+        self._cleanup = weakref.finalize(self, _remove_file, path) if path else None
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _blocks(n: int, width: int, budget: int = 1 << 24):
+    """Row ranges whose ``rows * width`` temporary stays near ``budget`` elements."""
+    step = max(1, budget // max(1, width))
+    for start in range(0, n, step):
+        yield start, min(n, start + step)
+
+
+def _kmeans(x: np.ndarray, k: int, iters: int = 20, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centroids = x[rng.choice(len(x), k, replace=len(x) < k)].copy()
+    x_sq = (x**2).sum(axis=1)[:, None]
+    for _ in range(iters):
+        dist = x_sq - 2.0 * x @ centroids.T + (centroids**2).sum(axis=1)[None, :]
+        assign = dist.argmin(axis=1)
+        counts = np.bincount(assign, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        empty = int((~filled).sum())
+        if empty:
+            centroids[~filled] = x[rng.choice(len(x), empty)]
+    return centroids
+
+
+class _Float16Codes:
+    dtype = np.float16
+    trained = True
+
+    def width(self, dim: int) -> int:
+        return dim
+
+    def train(self, sample: np.ndarray) -> None:
+        pass
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return vectors.astype(np.float16)
+
+    def score(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        scores = np.empty((queries.shape[0], codes.shape[0]), dtype=np.float32)
+        for start, stop in _blocks(codes.shape[0], codes.shape[1]):
+            scores[:, start:stop] = queries @ codes[start:stop].astype(np.float32).T
+        return scores
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {}
+
+    def restore(self, state) -> None:
+        pass
+
+
+class _Int8Codes(_Float16Codes):
+    """Symmetric scalar quantization with one scale per dimension."""
+
+    dtype = np.int8
+
+    def __init__(self) -> None:
+        self.scale: Optional[np.ndarray] = None
+
+    @property
+    def trained(self) -> bool:
+        return self.scale is not None
+
+    def train(self, sample: np.ndarray) -> None:
+        self.scale = np.maximum(np.abs(sample).max(axis=0), 1e-12).astype(np.float32) / 127.0
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.clip(np.rint(vectors / self.scale), -127, 127).astype(np.int8)
+
+    def score(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        # q . (code * scale) == (q * scale) . code
+        return super().score(queries * self.scale, codes)
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"scale": self.scale}
+
+    def restore(self, state) -> None:
+        self.scale = state["scale"]
+
+
+class _PQCodes(_Float16Codes):
+    """Product quantization: ``m`` sub-vectors, 256 k-means centroids each."""
+
+    dtype = np.uint8
+
+    def __init__(self, m: int):
+        self.m = m
+        self.codebooks: Optional[np.ndarray] = None  # (m, 256, dim // m)
+
+    @property
+    def trained(self) -> bool:
+        return self.codebooks is not None
+
+    def width(self, dim: int) -> int:
+        if dim % self.m:
+            raise ValueError(f"Vector dim {dim} is not divisible by pq_m={self.m}")
+        return self.m
+
+    def train(self, sample: np.ndarray) -> None:
+        subs = sample.reshape(len(sample), self.m, -1)
+        self.codebooks = np.stack([_kmeans(subs[:, j], 256, seed=j) for j in range(self.m)]).astype(np.float32)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        subs = vectors.reshape(len(vectors), self.m, -1)
+        codes = np.empty((len(vectors), self.m), dtype=np.uint8)
+        sq = (self.codebooks**2).sum(axis=2)  # (m, 256)
+        for j in range(self.m):
+            codes[:, j] = (sq[j][None, :] - 2.0 * subs[:, j] @ self.codebooks[j].T).argmin(axis=1)
+        return codes
+
+    def score(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        # Asymmetric distance: per-query lookup tables of sub-vector inner products.
+        tables = np.einsum("qmd,mcd->qmc", queries.reshape(len(queries), self.m, -1), self.codebooks)
+        sub = np.arange(self.m)
+        scores = np.empty((queries.shape[0], codes.shape[0]), dtype=np.float32)
+        for start, stop in _blocks(codes.shape[0], self.m * len(queries)):
+            scores[:, start:stop] = tables[:, sub, codes[start:stop]].sum(axis=2)
+        return scores
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"codebooks": self.codebooks}
+
+    def restore(self, state) -> None:
+        self.codebooks = state["codebooks"]
+
+
+class QuantizedIndex:
+    """Exact-layout index that keeps compressed codes in RAM.
+
+    ``storage`` selects float16, per-dimension int8 or product-quantized
+    codes. Searches score the codes, then re-score the best
+    ``top_k * refine_factor`` rows with float32 vectors read lazily from a
+    memory-mapped spill file. int8 and PQ need training, so until
+    ``quant_train_size`` vectors have arrived searches run exactly on the
+    float32 file, as the FAISS IVF variants do.
+    """
+
+    _STORAGE = {"float16", "int8", "pq"}
+
+    def __init__(self, config: IndexConfig):
+        _check_metric(config)
+        if config.storage not in self._STORAGE:
+            raise ValueError(f"Unsupported index storage: {config.storage}")
+        if config.storage == "pq" and config.pq_nbits != 8:
+            raise ValueError("In-memory PQ supports pq_nbits=8 only")
+        self.config = config
+        self._quantizer = self._new_quantizer()
+        self._codes = np.empty((0, 0), dtype=self._quantizer.dtype)
+        self._raw = _VectorFile(config.spill_dir)
+        self._dim = 0
+        self._ids: List[ChunkId] = []
+        self._row_of: Dict[ChunkId, int] = {}
+        self._row_ids: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @property
+    def dim(self) -> int:
+        return self._dim
+
+    @property
+    def nbytes(self) -> int:
+        """Resident bytes of the compressed codes."""
+        return int(self._codes[: len(self._ids)].nbytes)
+
+    def upsert(self, doc_id: ChunkId, vector: Sequence[float]) -> None:
+        self.upsert_batch([doc_id], [vector])
+
+    def upsert_batch(self, ids: Sequence[ChunkId], vectors) -> None:
+        vectors = _as_matrix(vectors, self.config.metric)
+        if len(ids) != vectors.shape[0]:
+            raise ValueError(f"Got {len(ids)} ids for {vectors.shape[0]} vectors")
+        if not len(ids):
+            return
+        if not self._ids and not self._dim:
+            self._dim = vectors.shape[1]
+            self._quantizer.width(self._dim)
+        elif vectors.shape[1] != self._dim:
+            raise ValueError(f"Vector dim {vectors.shape[1]} does not match index dim {self._dim}")
+
+        self._row_ids = None
+        rows = np.empty(len(ids), dtype=np.int64)
+        for i, doc_id in enumerate(ids):
+            row = self._row_of.get(doc_id)
+            if row is None:
+                row = len(self._ids)
+                self._ids.append(doc_id)
+                self._row_of[doc_id] = row
+            rows[i] = row
+        self._raw.reserve(len(self._ids), self._dim)
+        self._raw.write(rows, vectors)
+
+        if self._quantizer.trained:
+            self._ensure_codes(len(self._ids))
+            self._codes[rows] = self._quantizer.encode(vectors)
+        elif len(self._ids) >= self.config.quant_train_size:
+            self._train()
+
+    def remove(self, ids: Sequence[ChunkId]) -> None:
+        """Delete rows by moving the last row into each freed slot."""
+        self._row_ids = None
+        for doc_id in ids:
+            row = self._row_of.pop(doc_id, None)
+            if row is None:
+                continue
+            last = len(self._ids) - 1
+            if row != last:
+                moved = self._ids[last]
+                self._raw.move(row, last)
+                if self._quantizer.trained:
+                    self._codes[row] = self._codes[last]
+                self._ids[row] = moved
+                self._row_of[moved] = row
+            self._ids.pop()
+
+    def search(self, query_vector: Sequence[float], top_k: int = 5) -> List[ChunkId]:
+        return self.search_batch([query_vector], top_k=top_k)[0]
+
+    def search_batch(self, query_vectors, top_k: int = 5) -> List[List[ChunkId]]:
+        return [[doc_id for doc_id, _ in hits] for hits in self.search_batch_scored(query_vectors, top_k)]
+
+    def search_batch_scored(
+        self, query_vectors, top_k: int = 5, allowed: Optional[np.ndarray] = None
+    ) -> List[List[Tuple[ChunkId, float]]]:
+        queries = _as_matrix(query_vectors, self.config.metric)
+        n = len(self._ids)
+        if not n or top_k <= 0:
+            return [[] for _ in range(queries.shape[0])]
+        if queries.shape[1] != self._dim:
+            raise ValueError(f"Query dim {queries.shape[1]} does not match index dim {self._dim}")
+        excluded = None
+        if allowed is not None:
+            if self._row_ids is None:
+                self._row_ids = chunk_id_array(self._ids)
+            excluded = ~mask_ids(self._row_ids, allowed)
+
+        if not self._quantizer.trained:
+            scores = queries @ np.asarray(self._raw.head(n)).T
+            if excluded is not None:
+                scores[:, excluded] = -np.inf
+            rows = topk_rows(scores, top_k)
+            return self._hits(rows, np.take_along_axis(scores, rows, axis=1))
+
+        approx = self._quantizer.score(queries, self._codes[:n])
+        if excluded is not None:
+            approx[:, excluded] = -np.inf
+        refine = self.config.refine_factor
+        rows = topk_rows(approx, top_k * refine if refine > 1 else top_k)
+        if refine <= 0:
+            return self._hits(rows, np.take_along_axis(approx, rows, axis=1))
+
+        # Re-score the shortlist with full-precision vectors from the mmap.
+        exact = np.einsum("qd,qkd->qk", queries, self._raw.take(rows))
+        if excluded is not None:
+            exact[excluded[rows]] = -np.inf
+        order = np.argsort(-exact, axis=1, kind="stable")[:, :top_k]
+        return self._hits(np.take_along_axis(rows, order, axis=1), np.take_along_axis(exact, order, axis=1))
+
+    def save(self, path: str) -> None:
+        out = Path(path)
+        out.mkdir(parents=True, exist_ok=True)
+        n = len(self._ids)
+        if n:
+            self._raw.save(out / "vectors.npy", n)
+        np.save(out / "codes.npy", self._codes[:n] if self._quantizer.trained else self._codes[:0])
+        np.savez(out / "quantizer.npz", **self._quantizer.state())
+        _write_meta(out, self.config, ids=self._ids, dim=self._dim, trained=self._quantizer.trained)
+
+    def load(self, path: str) -> None:
+        src = Path(path)
+        meta = _read_meta(src)
+        self._ids = list(meta["ids"])
+        self._row_of = {doc_id: row for row, doc_id in enumerate(self._ids)}
+        self._row_ids = None
+        self._dim = int(meta["dim"])
+        self._quantizer = self._new_quantizer()
+        if meta["trained"]:
+            with np.load(src / "quantizer.npz") as state:
+                self._quantizer.restore({key: state[key] for key in state.files})
+        self._codes = np.load(src / "codes.npy")
+        self._raw = _VectorFile(self.config.spill_dir)
+        if self._ids:
+            self._raw.open(src / "vectors.npy")
+
+    def _new_quantizer(self):
+        if self.config.storage == "float16":
+            return _Float16Codes()
+        if self.config.storage == "int8":
+            return _Int8Codes()
+        return _PQCodes(self.config.pq_m)
+
+    def _train(self) -> None:
+        n = len(self._ids)
+        sample_rows = np.random.default_rng(0).choice(n, min(n, self.config.quant_train_size), replace=False)
+        self._quantizer.train(self._raw.take(np.sort(sample_rows)))
+        self._codes = np.empty((0, 0), dtype=self._quantizer.dtype)
+        self._ensure_codes(n)
+        for start, stop in _blocks(n, self._dim):
+            self._codes[start:stop] = self._quantizer.encode(np.asarray(self._raw.head(stop)[start:stop]))
+
+    def _ensure_codes(self, size: int) -> None:
+        width = self._quantizer.width(self._dim)
+        capacity = self._codes.shape[0]
+        if size <= capacity and self._codes.shape[1] == width:
+            return
+        capacity = max(capacity, self.config.initial_capacity, 1)
+        while capacity < size:
+            capacity *= 2
+        grown = np.empty((capacity, width), dtype=self._quantizer.dtype)
+        if self._codes.shape[1] == width:
+            kept = min(self._codes.shape[0], len(self._ids))
+            grown[:kept] = self._codes[:kept]
+        self._codes = grown
+
+    def _hits(self, rows: np.ndarray, scores: np.ndarray) -> List[List[Tuple[ChunkId, float]]]:
+        return [
+            [(self._ids[r], float(s)) for r, s in zip(row_ids, row_scores) if s > -np.inf]
+            for row_ids, row_scores in zip(rows, scores)
+        ]
+
+
+class FaissIndex:
+    """FAISS-backed index supporting Flat, IVF-Flat, IVF-PQ and HNSW.
+
+    Chunk ids are mapped to int64 labels. IVF variants need training, so
+    vectors are buffered and searched exactly until enough have arrived to
+    train the quantizer. Centroids fitted on the first documents drift from
+    a growing corpus, so IVF indexes are retrained on a sample of their own
+    vectors whenever the corpus outgrows ``ivf_retrain_factor`` times the
+    training set.
+    """
+
+    _KINDS = {"flat", "ivf_flat", "ivf_pq", "hnsw"}
+
+    def __init__(self, config: IndexConfig):
+        _check_metric(config)
+        if config.faiss_index not in self._KINDS:
+            raise ValueError(f"Unsupported FAISS index type: {config.faiss_index}")
+        self.config = config
+        self._index = None
+        self._dim = 0
+        self._labels: List[Optional[ChunkId]] = []
+        self._label_of: Dict[ChunkId, int] = {}
+        self._label_ids: Optional[np.ndarray] = None
+        self._label_live: Optional[np.ndarray] = None
+        self._tombstones: set = set()
+        self._pending: List[np.ndarray] = []
+        self._pending_labels: List[int] = []
+        self._trained_on = 0  # live vectors when the IVF quantizer was last trained
+
+    def __len__(self) -> int:
+        return len(self._label_of)
+
+    @property
+    def dim(self) -> int:
+        return self._dim
+
+    def upsert(self, doc_id: ChunkId, vector: Sequence[float]) -> None:
+        self.upsert_batch([doc_id], [vector])
+
+    def upsert_batch(self, ids: Sequence[ChunkId], vectors) -> None:
+        vectors = _as_matrix(vectors, self.config.metric)
+        if len(ids) != vectors.shape[0]:
+            raise ValueError(f"Got {len(ids)} ids for {vectors.shape[0]} vectors")
+        if not len(ids):
+            return
+        if self._index is None:
+            self._dim = vectors.shape[1]
+            self._build(self._dim)
+        elif vectors.shape[1] != self._dim:
+            raise ValueError(f"Vector dim {vectors.shape[1]} does not match index dim {self._dim}")
+
+        stale = [self._label_of[doc_id] for doc_id in ids if doc_id in self._label_of]
+        if stale:
+            self._drop_labels(stale)
+
+        labels = np.arange(len(self._labels), len(self._labels) + len(ids), dtype=np.int64)
+        self._label_ids = self._label_live = None
+        for doc_id, label in zip(ids, labels):
+            self._labels.append(doc_id)
+            self._label_of[doc_id] = int(label)
+
+        if self._index.is_trained:
+            self._index.add_with_ids(vectors, labels)
+            factor = self.config.ivf_retrain_factor
+            if self._trained_on and factor > 0 and len(self) > factor * self._trained_on:
+                self._retrain()
+        else:
+            self._pending.append(vectors)
+            self._pending_labels.extend(labels.tolist())
+            if len(self._pending_labels) >= self._min_train_size():
+                self._train()
+
+    def remove(self, ids: Sequence[ChunkId]) -> None:
+        labels = [self._label_of[doc_id] for doc_id in ids if doc_id in self._label_of]
+        if labels:
+            self._drop_labels(labels)
+
+    def search(self, query_vector: Sequence[float], top_k: int = 5) -> List[ChunkId]:
+        return self.search_batch([query_vector], top_k=top_k)[0]
+
+    def search_batch(self, query_vectors, top_k: int = 5) -> List[List[ChunkId]]:
+        return [[doc_id for doc_id, _ in hits] for hits in self.search_batch_scored(query_vectors, top_k)]
+
+    def search_batch_scored(
+        self, query_vectors, top_k: int = 5, allowed: Optional[np.ndarray] = None
+    ) -> List[List[Tuple[ChunkId, float]]]:
+        queries = _as_matrix(query_vectors, self.config.metric)
+        if self._index is None or not len(self) or top_k <= 0:
+            return [[] for _ in range(queries.shape[0])]
+        if queries.shape[1] != self._dim:
+            raise ValueError(f"Query dim {queries.shape[1]} does not match index dim {self._dim}")
+        label_ok = None
+        if allowed is not None:
+            # Dropped labels map to id -1, so the mask also hides tombstones.
+            if self._label_ids is None:
+                self._label_ids = chunk_id_array(self._labels)
+            label_ok = mask_ids(self._label_ids, allowed)
+        elif self._tombstones:
+            if self._label_live is None:
+                self._label_live = np.fromiter(
+                    (doc_id is not None for doc_id in self._labels), dtype=bool, count=len(self._labels)
+                )
+            label_ok = self._label_live
+        if not self._index.is_trained:
+            return self._search_pending(queries, top_k, label_ok)
+
+        k = min(top_k, self._index.ntotal)
+        if label_ok is None:
+            scores, labels = self._index.search(queries, k)
+        else:
+            import faiss
+
+            # The selector is consulted inside the scan, so filtered queries and
+            # deleted HNSW nodes still leave top_k hits without over-fetching.
+            bitmap = np.packbits(label_ok, bitorder="little")
+            selector = faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap))
+            scores, labels = self._index.search(queries, k, params=self._search_params(selector))
+        results: List[List[Tuple[ChunkId, float]]] = []
+        for row_scores, row_labels in zip(scores, labels):
+            hits: List[Tuple[ChunkId, float]] = []
+            for score, label in zip(row_scores, row_labels):
+                if label < 0 or label in self._tombstones:
+                    continue
+                hits.append((self._labels[label], float(score)))
+                if len(hits) >= top_k:
+                    break
+            results.append(hits)
+        return results
+
+    def save(self, path: str) -> None:
+        import faiss
+
+        out = Path(path)
+        out.mkdir(parents=True, exist_ok=True)
+        if self._index is not None:
+            faiss.write_index(self._index, str(out / "index.faiss"))
+        if self._pending:
+            np.save(out / "pending.npy", np.vstack(self._pending))
+        _write_meta(
+            out,
+            self.config,
+            dim=self._dim,
+            labels=self._labels,
+            tombstones=sorted(self._tombstones),
+            pending_labels=self._pending_labels,
+            trained_on=self._trained_on,
+        )
+
+    def load(self, path: str) -> None:
+        import faiss
+
+        src = Path(path)
+        meta = _read_meta(src)
+        self._dim = int(meta["dim"])
+        self._labels = list(meta["labels"])
+        self._label_ids = self._label_live = None
+        self._tombstones = set(meta["tombstones"])
+        self._label_of = {
+            doc_id: label
+            for label, doc_id in enumerate(self._labels)
+            if doc_id is not None and label not in self._tombstones
+        }
+        self._pending_labels = list(meta["pending_labels"])
+        self._pending = [np.load(src / "pending.npy")] if self._pending_labels else []
+        self._trained_on = int(meta.get("trained_on", len(self._label_of)))
+        index_file = src / "index.faiss"
+        self._index = faiss.read_index(str(index_file)) if index_file.exists() else None
+        if self._index is not None:
+            self._apply_search_params()
+
+    def _build(self, dim: int):
+        import faiss
+
+        cfg = self.config
+        metric = faiss.METRIC_INNER_PRODUCT
+        if cfg.faiss_index == "flat":
+            index = faiss.IndexIDMap(faiss.IndexFlatIP(dim))
+        elif cfg.faiss_index == "hnsw":
+            base = faiss.IndexHNSWFlat(dim, cfg.hnsw_m, metric)
+            base.hnsw.efConstruction = cfg.ef_construction
+            index = faiss.IndexIDMap(base)
+        else:
+            quantizer = faiss.IndexFlatIP(dim)
+            if cfg.faiss_index == "ivf_flat":
+                index = faiss.IndexIVFFlat(quantizer, dim, cfg.nlist, metric)
+            else:
+                index = faiss.IndexIVFPQ(quantizer, dim, cfg.nlist, cfg.pq_m, cfg.pq_nbits, metric)
+        self._index = index
+        self._apply_search_params()
+
+    def _apply_search_params(self) -> None:
+        import faiss
+
+        if self.config.faiss_index.startswith("ivf"):
+            faiss.extract_index_ivf(self._index).nprobe = self.config.nprobe
+        elif self.config.faiss_index == "hnsw":
+            faiss.downcast_index(self._index.index).hnsw.efSearch = self.config.ef_search
+
+    def _search_params(self, selector):
+        import faiss
+
+        if self.config.faiss_index.startswith("ivf"):
+            return faiss.SearchParametersIVF(sel=selector, nprobe=self.config.nprobe)
+        if self.config.faiss_index == "hnsw":
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=self.config.ef_search)
+        return faiss.SearchParameters(sel=selector)
+
+    def _min_train_size(self) -> int:
+        cfg = self.config
+        if cfg.ivf_train_size > 0:
+            size = cfg.ivf_train_size
+        else:
+            # FAISS warns below 39 points per centroid (per PQ sub-quantizer centroid too).
+            size = 39 * cfg.nlist
+            if cfg.faiss_index == "ivf_pq":
+                size = max(size, 39 * 2 ** cfg.pq_nbits)
+        return max(size, cfg.nlist)
+
+    def _train(self) -> None:
+        data = np.vstack(self._pending)
+        labels = np.asarray(self._pending_labels, dtype=np.int64)
+        keep = np.array([label not in self._tombstones for label in labels], dtype=bool)
+        live = np.flatnonzero(keep)
+        size = self._min_train_size()
+        if len(live) > size:
+            live = np.sort(np.random.default_rng(0).choice(live, size, replace=False))
+        self._index.train(data[live] if len(live) >= self.config.nlist else data)
+        self._trained_on = int(keep.sum())
+        if keep.any():
+            self._index.add_with_ids(data[keep], labels[keep])
+        self._tombstones.difference_update(labels[~keep].tolist())
+        self._pending = []
+        self._pending_labels = []
+
+    def _retrain(self) -> None:
+        """Refit the IVF quantizer on the current corpus and re-add every vector.
+
+        Vectors are reconstructed from the index itself; IVF-PQ reconstructs
+        its decoded approximations, which is what it stores.
+        """
+        import faiss
+
+        labels = np.fromiter(self._label_of.values(), dtype=np.int64, count=len(self._label_of))
+        faiss.extract_index_ivf(self._index).set_direct_map_type(faiss.DirectMap.Hashtable)
+        vectors = self._index.reconstruct_batch(labels)
+        self._build(self._dim)
+        self._pending = [vectors]
+        self._pending_labels = labels.tolist()
+        self._train()
+
+    def _search_pending(
+        self, queries: np.ndarray, top_k: int, label_ok: Optional[np.ndarray] = None
+    ) -> List[List[Tuple[ChunkId, float]]]:
+        data = np.vstack(self._pending)
+        labels = np.asarray(self._pending_labels, dtype=np.int64)
+        scores = queries @ data.T
+        if self._tombstones:
+            dead = np.array([label in self._tombstones for label in labels], dtype=bool)
+            scores[:, dead] = -np.inf
+        if label_ok is not None:
+            scores[:, ~label_ok[labels]] = -np.inf
+        rows = topk_rows(scores, top_k)
+        return [
+            [(self._labels[labels[r]], float(scores[q, r])) for r in row if np.isfinite(scores[q, r])]
+            for q, row in enumerate(rows)
+        ]
+
+    def _drop_labels(self, labels: List[int]) -> None:
+        self._label_ids = self._label_live = None
+        for label in labels:
+            doc_id = self._labels[label]
+            self._labels[label] = None
+            self._label_of.pop(doc_id, None)
+        if self._index.is_trained and self.config.faiss_index != "hnsw":
+            self._index.remove_ids(np.asarray(labels, dtype=np.int64))
+        else:
+            # HNSW graphs cannot drop nodes; hide them at query time instead.
+            self._tombstones.update(labels)
+            ratio = self.config.hnsw_rebuild_ratio
+            if self._index.is_trained and ratio > 0 and len(self._tombstones) > ratio * self._index.ntotal:
+                self._rebuild_hnsw()
+
+    def _rebuild_hnsw(self) -> None:
+        """Re-insert the live vectors into a fresh graph, dropping tombstoned nodes."""
+        import faiss
+
+        old = self._index
+        labels = faiss.vector_to_array(old.id_map)
+        vectors = old.index.reconstruct_n(0, old.ntotal)
+        keep = np.fromiter((label not in self._tombstones for label in labels.tolist()), dtype=bool, count=len(labels))
+        self._build(self._dim)
+        if keep.any():
+            self._index.add_with_ids(vectors[keep], labels[keep])
+        self._tombstones.clear()
+
+
+class ChromaIndex:
+    """Chroma-backed index using an embedded local client."""
+
+    def __init__(self, config: IndexConfig):
+        _check_metric(config)
+        self.config = config
+        self._path: Optional[str] = None
+        self._client = None
+        self._collection = None
+        self._open(config.persist_dir)
+
+    def __len__(self) -> int:
+        return self._collection.count()
+
+    def upsert(self, doc_id: ChunkId, vector: Sequence[float]) -> None:
+        self.upsert_batch([doc_id], [vector])
+
+    def upsert_batch(self, ids: Sequence[ChunkId], vectors) -> None:
+        vectors = _as_matrix(vectors, self.config.metric)
+        if len(ids) != vectors.shape[0]:
+            raise ValueError(f"Got {len(ids)} ids for {vectors.shape[0]} vectors")
+        batch = 5000
+        for start in range(0, len(ids), batch):
+            self._collection.upsert(
+                ids=[str(doc_id) for doc_id in ids[start : start + batch]],
+                embeddings=vectors[start : start + batch],
+            )
+
+    def remove(self, ids: Sequence[ChunkId]) -> None:
+        if ids:
+            self._collection.delete(ids=[str(doc_id) for doc_id in ids])
+
+    def search(self, query_vector: Sequence[float], top_k: int = 5) -> List[ChunkId]:
+        return self.search_batch([query_vector], top_k=top_k)[0]
+
+    def search_batch(self, query_vectors, top_k: int = 5) -> List[List[ChunkId]]:
+        return [[doc_id for doc_id, _ in hits] for hits in self.search_batch_scored(query_vectors, top_k)]
+
+    def search_batch_scored(
+        self, query_vectors, top_k: int = 5, allowed: Optional[np.ndarray] = None
+    ) -> List[List[Tuple[ChunkId, float]]]:
+        queries = _as_matrix(query_vectors, self.config.metric)
+        count = len(self)
+        if not count or top_k <= 0:
+            return [[] for _ in range(queries.shape[0])]
+        if allowed is None:
+            return self._query(queries, min(top_k, count))
+
+        # Chroma cannot filter by id inside the HNSW scan, so over-fetch and
+        # widen the window until every query has top_k permitted hits.
+        n_results = min(count, top_k * 4)
+        while True:
+            hits = [
+                [(cid, score) for cid, score in row if _id_allowed(cid, allowed)][:top_k]
+                for row in self._query(queries, n_results)
+            ]
+            if n_results >= count or all(len(row) >= top_k for row in hits):
+                return hits
+            n_results = min(count, n_results * 4)
+
+    def _query(self, queries: np.ndarray, n_results: int) -> List[List[Tuple[ChunkId, float]]]:
+        res = self._collection.query(query_embeddings=queries, n_results=n_results, include=["distances"])
+        # Chroma reports distances; both cosine and ip spaces use 1 - similarity.
+        return [
+            [(_decode_id(doc_id), 1.0 - float(dist)) for doc_id, dist in zip(ids, dists)]
+            for ids, dists in zip(res["ids"], res["distances"])
+        ]
+
+    def save(self, path: str) -> None:
+        if self._is_working_dir(path):
+            return  # the working collection already persists there
+        target = self._replace_collection(self._persistent_client(path), self.config.chroma_collection)
+        self._copy(self._collection, target)
+        _write_meta(Path(path), self.config)
+
+    def load(self, path: str) -> None:
+        """Copy a snapshot into the working collection; the snapshot itself is never written."""
+        if self._is_working_dir(path):
+            return
+        source = self._persistent_client(path).get_collection(self.config.chroma_collection)
+        self._collection = self._replace_collection(self._client, self._collection.name)
+        self._copy(source, self._collection)
+
+    def _open(self, path: Optional[str]) -> None:
+        import chromadb
+
+        if path:
+            self._client = self._persistent_client(path)
+            name = self.config.chroma_collection
+        else:
+            # Ephemeral clients in one process share a backend, so every instance
+            # needs its own collection or they would read each other's vectors.
+            self._client = chromadb.EphemeralClient()
+            name = f"{self.config.chroma_collection}-{uuid.uuid4().hex}"
+            weakref.finalize(self, _drop_collection, self._client, name)
+        self._path = path
+        self._collection = self._client.get_or_create_collection(name, metadata=self._space())
+
+    def _is_working_dir(self, path: str) -> bool:
+        return self._path is not None and Path(self._path).resolve() == Path(path).resolve()
+
+    def _space(self) -> Dict[str, str]:
+        return {"hnsw:space": "cosine" if self.config.metric == "cosine" else "ip"}
+
+    def _replace_collection(self, client, name: str):
+        """Drop ``name`` and create it empty, so vectors deleted since an earlier copy do not linger."""
+        if name in {getattr(c, "name", c) for c in client.list_collections()}:
+            client.delete_collection(name)
+        return client.create_collection(name, metadata=self._space())
+
+    @staticmethod
+    def _persistent_client(path: str):
+        import chromadb
+
+        Path(path).mkdir(parents=True, exist_ok=True)
+        return chromadb.PersistentClient(path=path)
+
+    @staticmethod
+    def _copy(source, target) -> None:
+        total = source.count()
+        batch = 5000
+        for offset in range(0, total, batch):
+            page = source.get(include=["embeddings"], limit=batch, offset=offset)
+            target.upsert(ids=page["ids"], embeddings=page["embeddings"])
+
+
+def _drop_collection(client, name: str) -> None:
+    try:
+        client.delete_collection(name)
+    except Exception:  # the backend may already be torn down at interpreter exit
+        pass
+
+
+def _decode_id(raw: str):
+    # Chroma only stores string ids; integer chunk ids are restored on the way out.
+    return int(raw) if raw.lstrip("-").isdigit() else raw
+
+
+def chunk_id_array(ids: Sequence[Optional[ChunkId]]) -> np.ndarray:
+    """Chunk ids as int64, with -1 for freed slots and non-integer ids."""
+    return np.fromiter((cid if isinstance(cid, (int, np.integer)) else -1 for cid in ids), np.int64, len(ids))
+
+
+def mask_ids(ids: np.ndarray, allowed: np.ndarray) -> np.ndarray:
+    """Look up ``allowed[id]`` for every id; ids outside the mask are rejected."""
+    ok = (ids >= 0) & (ids < len(allowed))
+    ok[ok] = allowed[ids[ok]]
+    return ok
+
+
+def _id_allowed(cid: ChunkId, allowed: np.ndarray) -> bool:
+    return isinstance(cid, (int, np.integer)) and 0 <= cid < len(allowed) and bool(allowed[cid])
 
-    def upsert(self, doc_id: str, vector: List[float]) -> None:
-        self._store[doc_id] = vector
 
-    def search(self, _query_vector: List[float], top_k: int = 5) -> List[str]:
-        return list(self._store.keys())[:top_k]
+def topk_rows(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Return row indices of the top-k scores per query, best first."""
+    n = scores.shape[1]
+    k = min(top_k, n)
+    if k < n:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        part = np.tile(np.arange(n), (scores.shape[0], 1))
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1)
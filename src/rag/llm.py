@@ -2,12 +2,18 @@
 
 from __future__ import annotations
 
+import asyncio
+import json
 import os
+import random
 import re
+import threading
+import time
+import weakref
 from dataclasses import dataclass
-from typing import List, Tuple
-from urllib import error, request
-import json
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import httpx
 
 
 @dataclass
@@ -16,10 +22,109 @@ class LLMConfig:
     model: str = "gpt-4o-mini"
     temperature: float = 0.0
     ollama_base_url: str = "http://localhost:11434"
+    timeout: float = 60.0
+    connect_timeout: float = 5.0
+    max_retries: int = 2
+    retry_backoff: float = 0.5  # seconds, doubled per attempt and jittered
+    max_concurrency: int = 8
+    max_connections: int = 16
+
+
+_RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+_POOL_LOCK = threading.Lock()
+_SYNC_POOLS: Dict[Tuple, object] = {}
+# Async clients are bound to the event loop that created them.
+_ASYNC_POOLS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple, object]]" = weakref.WeakKeyDictionary()
+
+
+def _pool_key(config: LLMConfig) -> Tuple:
+    base = config.ollama_base_url.rstrip("/") if config.provider == "ollama" else ""
+    return (config.provider, base, config.timeout, config.connect_timeout, config.max_connections)
+
+
+def _httpx_kwargs(config: LLMConfig) -> Dict:
+    return {
+        "timeout": httpx.Timeout(config.timeout, connect=config.connect_timeout),
+        "limits": httpx.Limits(
+            max_connections=config.max_connections,
+            max_keepalive_connections=config.max_connections,
+        ),
+    }
+
+
+def _sync_pool(config: LLMConfig):
+    """Process-wide keep-alive client shared by every generator with the same settings."""
+    key = _pool_key(config)
+    with _POOL_LOCK:
+        client = _SYNC_POOLS.get(key)
+        if client is None:
+            if config.provider == "openai":
+                from openai import OpenAI
+
+                client = OpenAI(max_retries=0, http_client=httpx.Client(**_httpx_kwargs(config)))
+            else:
+                client = httpx.Client(base_url=key[1], **_httpx_kwargs(config))
+            _SYNC_POOLS[key] = client
+        return client
+
+
+def _async_pool(config: LLMConfig):
+    loop = asyncio.get_running_loop()
+    pools = _ASYNC_POOLS.setdefault(loop, {})
+    key = _pool_key(config)
+    client = pools.get(key)
+    if client is None:
+        if config.provider == "openai":
+            from openai import AsyncOpenAI
+
+            client = AsyncOpenAI(max_retries=0, http_client=httpx.AsyncClient(**_httpx_kwargs(config)))
+        else:
+            client = httpx.AsyncClient(base_url=key[1], **_httpx_kwargs(config))
+        pools[key] = client
+    return client
+
+
+_BATCH_LOOP: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _batch_loop() -> asyncio.AbstractEventLoop:
+    """Process-wide event loop on a daemon thread that runs ``generate_batch``.
+
+    It lives as long as the process, so its async clients (and their
+    keep-alive connections) are reused from one batch to the next.
+    """
+    global _BATCH_LOOP
+    with _POOL_LOCK:
+        if _BATCH_LOOP is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="llm-batch-loop", daemon=True).start()
+            _BATCH_LOOP = loop
+        return _BATCH_LOOP
+
+
+def _is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, httpx.TransportError):
+        return True
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in _RETRY_STATUS
+    status = getattr(exc, "status_code", None)  # openai.APIStatusError
+    if status is not None:
+        return status in _RETRY_STATUS
+    return type(exc).__name__ in {"APIConnectionError", "APITimeoutError"}
+
+
+def _backoff(config: LLMConfig, attempt: int) -> float:
+    return config.retry_backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
 
 
 class AnswerGenerator:
-    """Generate grounded answers from retrieved evidence."""
+    """Generate grounded answers from retrieved evidence.
+
+    HTTP providers go through pooled keep-alive clients shared per process.
+    ``agenerate``/``agenerate_batch`` run on asyncio with at most
+    ``config.max_concurrency`` requests in flight; transient failures are
+    retried with jittered exponential backoff.
+    """
 
     def __init__(self, config: LLMConfig):
         self.config = config
@@ -39,6 +144,57 @@ class AnswerGenerator:
 
         raise ValueError(f"Unsupported LLM provider: {self.config.provider}")
 
+    def stream(self, query: str, evidence: List[Tuple[str, str]]) -> Iterator[str]:
+        """Yield the answer incrementally as the provider produces tokens."""
+        if self.config.provider == "extractive":
+            yield from self._stream_text(self._extractive_answer(query, evidence))
+            return
+
+        if self.config.provider == "openai":
+            api_key = os.getenv("OPENAI_API_KEY", "").strip()
+            if not api_key:
+                yield from self._stream_text(self._extractive_answer(query, evidence, missing_key=True))
+                return
+            yield from self._openai_stream(query, evidence)
+            return
+
+        if self.config.provider == "ollama":
+            yield from self._ollama_stream(query, evidence)
+            return
+
+        raise ValueError(f"Unsupported LLM provider: {self.config.provider}")
+
+    async def agenerate(self, query: str, evidence: List[Tuple[str, str]]) -> str:
+        if self.config.provider == "extractive":
+            return self._extractive_answer(query, evidence)
+
+        if self.config.provider == "openai":
+            api_key = os.getenv("OPENAI_API_KEY", "").strip()
+            if not api_key:
+                return self._extractive_answer(query, evidence, missing_key=True)
+            return await self._aopenai_answer(query, evidence)
+
+        if self.config.provider == "ollama":
+            return await self._aollama_answer(query, evidence)
+
+        raise ValueError(f"Unsupported LLM provider: {self.config.provider}")
+
+    async def agenerate_batch(self, items: Sequence[Tuple[str, List[Tuple[str, str]]]]) -> List[str]:
+        """Answer many ``(query, evidence)`` pairs concurrently, in input order."""
+        limit = asyncio.Semaphore(max(1, self.config.max_concurrency))
+
+        async def _one(query: str, evidence: List[Tuple[str, str]]) -> str:
+            async with limit:
+                return await self.agenerate(query, evidence)
+
+        return list(await asyncio.gather(*(_one(q, ev) for q, ev in items)))
+
+    def generate_batch(self, items: Sequence[Tuple[str, List[Tuple[str, str]]]]) -> List[str]:
+        """Blocking wrapper around :meth:`agenerate_batch`; safe to call from any thread."""
+        if self.config.provider == "extractive":
+            return [self._extractive_answer(q, ev) for q, ev in items]
+        return asyncio.run_coroutine_threadsafe(self.agenerate_batch(items), _batch_loop()).result()
+
     def _extractive_answer(
         self,
         query: str,
@@ -76,9 +232,7 @@ class AnswerGenerator:
         best = [item for score, item in scored if score > 0]
         return best[:2]
 
-    def _openai_answer(self, query: str, evidence: List[Tuple[str, str]]) -> str:
-        from openai import OpenAI
-
+    def _openai_messages(self, query: str, evidence: List[Tuple[str, str]]) -> List[Dict[str, str]]:
         context = "\n".join([f"[{cid}] {self._clean_inline(text)}" for cid, text in evidence])
         system_prompt = (
             "你是一个严谨的RAG回答助手。"
@@ -90,25 +244,79 @@ class AnswerGenerator:
             f"证据：\n{context}\n\n"
             "请输出简洁中文答案，并给出引用。"
         )
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ]
 
-        client = OpenAI()
-        resp = client.chat.completions.create(
-            model=self.config.model,
-            temperature=self.config.temperature,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-        )
+    def _openai_answer(self, query: str, evidence: List[Tuple[str, str]]) -> str:
+        client = _sync_pool(self.config)
+        messages = self._openai_messages(query, evidence)
+
+        for attempt in range(self.config.max_retries + 1):
+            try:
+                resp = client.chat.completions.create(
+                    model=self.config.model,
+                    temperature=self.config.temperature,
+                    messages=messages,
+                )
+                break
+            except Exception as exc:
+                if attempt >= self.config.max_retries or not _is_retryable(exc):
+                    raise
+                time.sleep(_backoff(self.config, attempt))
         return (resp.choices[0].message.content or "").strip() or "LLM 未返回内容。"
 
-    def _ollama_answer(self, query: str, evidence: List[Tuple[str, str]]) -> str:
-        if not evidence:
-            return "未检索到有效证据，无法基于知识库回答。"
+    async def _aopenai_answer(self, query: str, evidence: List[Tuple[str, str]]) -> str:
+        client = _async_pool(self.config)
+        messages = self._openai_messages(query, evidence)
 
-        payload = {
+        for attempt in range(self.config.max_retries + 1):
+            try:
+                resp = await client.chat.completions.create(
+                    model=self.config.model,
+                    temperature=self.config.temperature,
+                    messages=messages,
+                )
+                break
+            except Exception as exc:
+                if attempt >= self.config.max_retries or not _is_retryable(exc):
+                    raise
+                await asyncio.sleep(_backoff(self.config, attempt))
+        return (resp.choices[0].message.content or "").strip() or "LLM 未返回内容。"
+
+    def _openai_stream(self, query: str, evidence: List[Tuple[str, str]]) -> Iterator[str]:
+        client = _sync_pool(self.config)
+        messages = self._openai_messages(query, evidence)
+        for attempt in range(self.config.max_retries + 1):
+            try:
+                events = client.chat.completions.create(
+                    model=self.config.model,
+                    temperature=self.config.temperature,
+                    messages=messages,
+                    stream=True,
+                )
+                break
+            except Exception as exc:
+                if attempt >= self.config.max_retries or not _is_retryable(exc):
+                    raise
+                time.sleep(_backoff(self.config, attempt))
+
+        emitted = False
+        for event in events:
+            if not event.choices:
+                continue
+            delta = event.choices[0].delta.content
+            if delta:
+                emitted = True
+                yield delta
+        if not emitted:
+            yield "LLM 未返回内容。"
+
+    def _ollama_payload(self, query: str, evidence: List[Tuple[str, str]], stream: bool = False) -> Dict:
+        return {
             "model": self.config.model,
-            "stream": False,
+            "stream": stream,
             "messages": [
                 {
                     "role": "system",
@@ -123,21 +331,91 @@ class AnswerGenerator:
             "options": {"temperature": self.config.temperature},
         }
 
-        url = f"{self.config.ollama_base_url.rstrip('/')}/api/chat"
-        req = request.Request(
-            url,
-            data=json.dumps(payload).encode("utf-8"),
-            headers={"Content-Type": "application/json"},
-            method="POST",
-        )
+    def _ollama_error(self, exc: httpx.HTTPError) -> str:
+        """Message shown instead of raising once a request has failed for good."""
+        if isinstance(exc, httpx.HTTPStatusError):
+            return (
+                f"Ollama 返回错误（HTTP {exc.response.status_code}）。"
+                f"请确认模型 {self.config.model} 已拉取，或切换到 extractive 模式。"
+            )
+        return f"无法连接到本地 Ollama（{self.config.ollama_base_url}）。请先启动 Ollama，或切换到 extractive 模式。"
+
+    def _ollama_answer(self, query: str, evidence: List[Tuple[str, str]]) -> str:
+        if not evidence:
+            return "未检索到有效证据，无法基于知识库回答。"
+
+        client = _sync_pool(self.config)
+        payload = self._ollama_payload(query, evidence)
+        for attempt in range(self.config.max_retries + 1):
+            try:
+                resp = client.post("/api/chat", json=payload)
+                resp.raise_for_status()
+                break
+            except httpx.HTTPError as exc:
+                if attempt >= self.config.max_retries or not _is_retryable(exc):
+                    return self._ollama_error(exc)
+                time.sleep(_backoff(self.config, attempt))
 
-        try:
-            with request.urlopen(req, timeout=40) as resp:
-                data = json.loads(resp.read().decode("utf-8"))
-                content = data.get("message", {}).get("content", "").strip()
-                return content or "Ollama 未返回内容。"
-        except error.URLError:
-            return "无法连接到本地 Ollama（http://localhost:11434）。请先启动 Ollama，或切换到 extractive 模式。"
+        content = resp.json().get("message", {}).get("content", "").strip()
+        return content or "Ollama 未返回内容。"
+
+    async def _aollama_answer(self, query: str, evidence: List[Tuple[str, str]]) -> str:
+        if not evidence:
+            return "未检索到有效证据，无法基于知识库回答。"
+
+        client = _async_pool(self.config)
+        payload = self._ollama_payload(query, evidence)
+        for attempt in range(self.config.max_retries + 1):
+            try:
+                resp = await client.post("/api/chat", json=payload)
+                resp.raise_for_status()
+                break
+            except httpx.HTTPError as exc:
+                if attempt >= self.config.max_retries or not _is_retryable(exc):
+                    return self._ollama_error(exc)
+                await asyncio.sleep(_backoff(self.config, attempt))
+
+        content = resp.json().get("message", {}).get("content", "").strip()
+        return content or "Ollama 未返回内容。"
+
+    def _ollama_stream(self, query: str, evidence: List[Tuple[str, str]]) -> Iterator[str]:
+        """Read Ollama's NDJSON stream; retries only happen before the first token."""
+        if not evidence:
+            yield "未检索到有效证据，无法基于知识库回答。"
+            return
+
+        client = _sync_pool(self.config)
+        payload = self._ollama_payload(query, evidence, stream=True)
+        emitted = False
+        for attempt in range(self.config.max_retries + 1):
+            try:
+                with client.stream("POST", "/api/chat", json=payload) as resp:
+                    resp.raise_for_status()
+                    for line in resp.iter_lines():
+                        if not line.strip():
+                            continue
+                        data = json.loads(line)
+                        token = data.get("message", {}).get("content", "")
+                        if token:
+                            emitted = True
+                            yield token
+                        if data.get("done"):
+                            break
+                break
+            except httpx.HTTPError as exc:
+                if emitted:
+                    raise
+                if attempt >= self.config.max_retries or not _is_retryable(exc):
+                    yield self._ollama_error(exc)
+                    return
+                time.sleep(_backoff(self.config, attempt))
+        if not emitted:
+            yield "Ollama 未返回内容。"
+
+    @staticmethod
+    def _stream_text(text: str) -> Iterator[str]:
+        for line in text.splitlines(keepends=True):
+            yield line
 
     @staticmethod
     def _clean_inline(text: str) -> str:
@@ -0,0 +1,195 @@
+"""Answer and retrieval metrics shared by the experiments and the live pipeline."""
+
+from __future__ import annotations
+
+import math
+import re
+import string
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Hashable, List, Mapping, Optional, Sequence, Union
+
+import numpy as np
+
+_PUNCT_TABLE = str.maketrans("", "", string.punctuation)
+_ARTICLES_RE = re.compile(r"\b(a|an|the)\b")
+_WS_RE = re.compile(r"\s+")
+
+Qrels = Mapping[str, Mapping[Hashable, float]]
+Context = Union[str, Sequence[str]]
+
+
+def _normalize(text: str) -> str:
+    text = text.lower().translate(_PUNCT_TABLE)
+    text = _ARTICLES_RE.sub(" ", text)
+    return _WS_RE.sub(" ", text).strip()
+
+
+# Answers, aliases and passages repeat across k and samples; normalize each once.
+normalize_answer = lru_cache(maxsize=100_000)(_normalize)
+normalize_answer.__doc__ = "SQuAD-style normalization for EM/F1, memoised per distinct text."
+
+
+def normalize_context(context: Context) -> str:
+    """Normalize retrieved text; a passage list reuses each passage's memoised form."""
+    if isinstance(context, str):
+        return _normalize(context)
+    return " ".join(norm for norm in map(normalize_answer, context) if norm)
+
+
+def exact_match(prediction: str, golds: Sequence[str]) -> float:
+    pred = normalize_answer(prediction)
+    return float(any(pred == normalize_answer(g) for g in golds if g))
+
+
+def f1_score(prediction: str, golds: Sequence[str]) -> float:
+    pred_tokens = normalize_answer(prediction).split()
+    if not pred_tokens:
+        return 0.0
+    pred_counts = Counter(pred_tokens)
+
+    best = 0.0
+    for gold in golds:
+        gold_tokens = normalize_answer(gold).split()
+        if not gold_tokens:
+            continue
+        common = sum((pred_counts & Counter(gold_tokens)).values())
+        if not common:
+            continue
+        precision = common / len(pred_tokens)
+        recall = common / len(gold_tokens)
+        best = max(best, 2 * precision * recall / (precision + recall))
+    return best
+
+
+def contains_any_answer(text: Context, answers: Sequence[str]) -> bool:
+    norm_text = normalize_context(text)
+    return any(norm and norm in norm_text for norm in map(normalize_answer, answers))
+
+
+def classify_faithfulness(is_em: bool, supported: bool) -> str:
+    if is_em and supported:
+        return "correct_supported"
+    if is_em and not supported:
+        return "correct_unsupported"
+    return "incorrect"
+
+
+def score_predictions(
+    predictions: Sequence[str],
+    golds: Sequence[Sequence[str]],
+    contexts: Optional[Sequence[Context]] = None,
+) -> Dict[str, np.ndarray]:
+    """Per-row EM/F1 and, given the retrieved ``contexts``, hit and faithfulness columns.
+
+    A context is a string or a list of passages; it is normalized once and
+    reused for the hit and support checks.
+    """
+    em = np.fromiter((exact_match(p, g) for p, g in zip(predictions, golds)), dtype=np.float64, count=len(predictions))
+    f1 = np.fromiter((f1_score(p, g) for p, g in zip(predictions, golds)), dtype=np.float64, count=len(predictions))
+    table = {"em": em, "f1": f1}
+    if contexts is None:
+        return table
+
+    hit = np.zeros(len(predictions))
+    supported = np.zeros(len(predictions))
+    for i, (pred, gold, context) in enumerate(zip(predictions, golds, contexts)):
+        norm_context = normalize_context(context)
+        hit[i] = any(n and n in norm_context for n in map(normalize_answer, gold))
+        norm_pred = normalize_answer(pred)
+        supported[i] = bool(norm_pred) and norm_pred in norm_context
+    correct = em > 0
+    table.update(
+        hit=hit,
+        correct_supported=(correct & (supported > 0)).astype(np.float64),
+        correct_unsupported=(correct & (supported == 0)).astype(np.float64),
+        incorrect=(~correct).astype(np.float64),
+    )
+    return table
+
+
+def relevance_matrix(ranked: Sequence[Sequence[Hashable]], qrels: Sequence[Mapping[Hashable, float]], depth: int) -> np.ndarray:
+    """Grades of the top ``depth`` results, one row per query (0 = not relevant)."""
+    grades = np.zeros((len(ranked), depth), dtype=np.float64)
+    for row, (ids, rel) in enumerate(zip(ranked, qrels)):
+        for col, doc in enumerate(ids[:depth]):
+            grades[row, col] = rel.get(doc, 0.0)
+    return grades
+
+
+def retrieval_metrics(
+    ranked: Sequence[Sequence[Hashable]],
+    qrels: Sequence[Mapping[Hashable, float]],
+    ks: Sequence[int] = (1, 5, 10),
+) -> Dict[str, float]:
+    """Mean recall@k, MRR and nDCG@k over queries, computed on one grade matrix."""
+    depth = max(ks)
+    grades = relevance_matrix(ranked, qrels, depth)
+    relevant = grades > 0
+    n_relevant = np.array([sum(1 for g in rel.values() if g > 0) for rel in qrels], dtype=np.float64)
+    has_relevant = n_relevant > 0
+
+    discounts = 1.0 / np.log2(np.arange(2, depth + 2))
+    gains = 2.0 ** grades - 1.0
+    ideal = np.zeros_like(grades)
+    for row, rel in enumerate(qrels):
+        best = sorted((g for g in rel.values() if g > 0), reverse=True)[:depth]
+        ideal[row, : len(best)] = best
+    ideal_gains = 2.0 ** ideal - 1.0
+
+    first_hit = np.where(relevant.any(axis=1), relevant.argmax(axis=1) + 1, 0)
+    rr = np.divide(1.0, first_hit, out=np.zeros(len(first_hit)), where=first_hit > 0)
+    out: Dict[str, float] = {"queries": float(has_relevant.sum()), "mrr": _mean(rr, has_relevant)}
+    for k in ks:
+        hits = relevant[:, :k].sum(axis=1)
+        out[f"recall@{k}"] = _mean(np.divide(hits, np.maximum(n_relevant, 1)), has_relevant)
+        dcg = (gains[:, :k] * discounts[:k]).sum(axis=1)
+        idcg = (ideal_gains[:, :k] * discounts[:k]).sum(axis=1)
+        out[f"ndcg@{k}"] = _mean(np.divide(dcg, idcg, out=np.zeros_like(dcg), where=idcg > 0), has_relevant)
+    return out
+
+
+def evaluate_pipeline(
+    pipeline,
+    queries: Mapping[str, str],
+    qrels: Qrels,
+    ks: Sequence[int] = (1, 5, 10),
+    level: str = "doc",
+) -> Dict[str, float]:
+    """Retrieval quality of a live ``RAGPipeline`` against labelled ``qrels``.
+
+    With ``level="doc"`` qrels name document ids and each document counts
+    once at the rank of its best chunk; with ``level="chunk"`` they name
+    citation labels such as ``doc-1:3``.
+    """
+    if level not in {"doc", "chunk"}:
+        raise ValueError(f"Unsupported qrels level: {level}")
+    qids = [qid for qid in queries if qid in qrels]
+    depth = max(ks)
+    store = pipeline.store
+    ranked: List[List[Hashable]] = []
+    for qid in qids:
+        # Fetch extra chunks so doc-level ranks still reach ``depth`` documents.
+        hits = pipeline.retrieve(queries[qid], top_k=depth * (4 if level == "doc" else 1))
+        if level == "chunk":
+            ranked.append([store.label(cid) for cid, _ in hits])
+        else:
+            ranked.append(list(dict.fromkeys(store.doc_id(cid) for cid, _ in hits)))
+    return retrieval_metrics(ranked, [qrels[qid] for qid in qids], ks)
+
+
+def load_qrels(path: str) -> Dict[str, Dict[str, float]]:
+    """Read TREC-style ``qid 0 doc_id grade`` lines."""
+    qrels: Dict[str, Dict[str, float]] = {}
+    for line in Path(path).read_text(encoding="utf-8").splitlines():
+        parts = line.split()
+        if len(parts) < 4:
+            continue
+        qid, _, doc_id, grade = parts[:4]
+        qrels.setdefault(qid, {})[doc_id] = float(grade)
+    return qrels
+
+
+def _mean(values: np.ndarray, mask: np.ndarray) -> float:
+    return float(values[mask].mean()) if mask.any() else math.nan
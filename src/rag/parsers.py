@@ -2,19 +2,54 @@
 
 from __future__ import annotations
 
+import os
 import re
+import time
 import unicodedata
-from dataclasses import dataclass
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
 from io import BytesIO
 from pathlib import Path
-from typing import List
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .cache import ParseCache
+
+SUPPORTED_EXTENSIONS = {".pdf": "pdf", ".docx": "docx", ".pptx": "pptx"}
+_PAGE_LABELS = {"pdf": "Page", "pptx": "Slide"}
+_LIBRARIES = {"pdf": "pypdf", "docx": "python-docx", "pptx": "python-pptx"}
+
+# Bump when extraction or ``_normalize_text`` changes, so cached pages are re-parsed.
+PARSER_VERSION = 1
+_DOCX_BLOCK_CHARS = 4000
+
+
+@dataclass
+class ParserConfig:
+    cache_path: Optional[str] = None  # SQLite file for parsed pages; None disables the cache
+    cache_max_mb: int = 512
+
+
+@dataclass
+class PageText:
+    """Normalized text of one page/slide (or paragraph block for DOCX)."""
+
+    number: Optional[int]
+    text: str
+    total: Optional[int] = None
 
 
 @dataclass
 class ParsedDocument:
     doc_id: str
-    content: str
     source_type: str
+    pages: List[PageText] = field(default_factory=list)
+
+    @property
+    def content(self) -> str:
+        label = _PAGE_LABELS.get(self.source_type)
+        if label is None:
+            return "\n".join(p.text for p in self.pages)
+        return "\n\n".join(f"[{label} {p.number}]\n{p.text}" for p in self.pages)
 
 
 def _normalize_text(text: str) -> str:
@@ -37,35 +72,48 @@ def _normalize_text(text: str) -> str:
     return "\n".join(lines)
 
 
-def _read_pdf(data: bytes) -> str:
+def _iter_pdf(data: bytes, start: int = 0, stop: Optional[int] = None) -> Iterator[PageText]:
     from pypdf import PdfReader
 
     reader = PdfReader(BytesIO(data))
-    pages: List[str] = []
-    for i, page in enumerate(reader.pages, start=1):
-        text = (page.extract_text() or "").strip()
+    total = len(reader.pages)
+    for i in range(start, total if stop is None else min(stop, total)):
+        text = (reader.pages[i].extract_text() or "").strip()
         if text:
-            pages.append(f"[Page {i}]\n{_normalize_text(text)}")
-    return "\n\n".join(pages)
+            yield PageText(i + 1, _normalize_text(text), total)
 
 
-def _read_docx(data: bytes) -> str:
+def _count_pdf_pages(data: bytes) -> int:
+    from pypdf import PdfReader
+
+    return len(PdfReader(BytesIO(data)).pages)
+
+
+def _iter_docx(data: bytes, block_chars: int = _DOCX_BLOCK_CHARS) -> Iterator[PageText]:
     from docx import Document
 
+    # DOCX has no stable page boundaries; stream paragraph blocks instead.
     doc = Document(BytesIO(data))
     parts: List[str] = []
+    size = 0
     for para in doc.paragraphs:
         text = para.text.strip()
-        if text:
-            parts.append(_normalize_text(text))
-    return "\n".join(parts)
+        if not text:
+            continue
+        parts.append(_normalize_text(text))
+        size += len(parts[-1]) + 1
+        if size >= block_chars:
+            yield PageText(None, "\n".join(parts))
+            parts, size = [], 0
+    if parts:
+        yield PageText(None, "\n".join(parts))
 
 
-def _read_pptx(data: bytes) -> str:
+def _iter_pptx(data: bytes) -> Iterator[PageText]:
     from pptx import Presentation
 
     prs = Presentation(BytesIO(data))
-    slides: List[str] = []
+    total = len(prs.slides)
     for idx, slide in enumerate(prs.slides, start=1):
         chunk: List[str] = []
         for shape in slide.shapes:
@@ -74,24 +122,219 @@ def _read_pptx(data: bytes) -> str:
             if text:
                 chunk.append(_normalize_text(text))
         if chunk:
-            slides.append(f"[Slide {idx}]\n" + "\n".join(chunk))
-    return "\n\n".join(slides)
+            yield PageText(idx, "\n".join(chunk), total)
 
 
-def parse_document(filename: str, data: bytes) -> ParsedDocument:
+def source_type_of(filename: str) -> str:
     ext = Path(filename).suffix.lower()
+    if ext not in SUPPORTED_EXTENSIONS:
+        raise ValueError(f"Unsupported file type: {ext}. Use .pdf, .docx, or .pptx")
+    return SUPPORTED_EXTENSIONS[ext]
+
+
+def parse_signature(filename: str) -> str:
+    """Everything besides the file bytes that determines parsed output."""
+    from importlib import metadata
+
+    source_type = source_type_of(filename)
+    try:
+        library = f"{_LIBRARIES[source_type]}=={metadata.version(_LIBRARIES[source_type])}"
+    except metadata.PackageNotFoundError:
+        library = _LIBRARIES[source_type]
+    return f"v{PARSER_VERSION}|{source_type}|{library}|nfkc|docx_block={_DOCX_BLOCK_CHARS}"
+
+
+def open_parse_cache(config: ParserConfig) -> Optional[ParseCache]:
+    if not config.cache_path:
+        return None
+    return ParseCache(config.cache_path, max_bytes=config.cache_max_mb * 1024 * 1024)
+
+
+def cached_pages(filename: str, data: bytes, cache: ParseCache) -> Tuple[str, Optional[List[PageText]]]:
+    """Return ``(cache_key, pages)``; pages is None on a miss."""
+    key = cache.key(data, parse_signature(filename))
+    hit = cache.get(key)
+    return key, None if hit is None else [PageText(*page) for page in hit]
+
+
+def iter_pages(filename: str, data: bytes, cache: Optional[ParseCache] = None) -> Iterator[PageText]:
+    """Lazily yield normalized pages so callers never hold the full text.
+
+    With a ``cache``, a previously parsed file is replayed from the cache and
+    a newly parsed one is stored once it has been read to the end.
+    """
+    if cache is not None:
+        key, pages = cached_pages(filename, data, cache)
+        if pages is not None:
+            return iter(pages)
+        return _store_pages(iter_pages(filename, data), cache, key)
+    source_type = source_type_of(filename)
+    if source_type == "pdf":
+        return _iter_pdf(data)
+    if source_type == "docx":
+        return _iter_docx(data)
+    return _iter_pptx(data)
+
+
+def _store_pages(pages: Iterator[PageText], cache: ParseCache, key: str) -> Iterator[PageText]:
+    seen: List[PageText] = []
+    seconds = 0.0
+    while True:
+        # Only extraction is timed, not the consumer's chunking and embedding between pages.
+        began = time.perf_counter()
+        page = next(pages, None)
+        seconds += time.perf_counter() - began
+        if page is None:
+            break
+        seen.append(page)
+        yield page
+    cache.put(key, [(p.number, p.text, p.total) for p in seen], seconds)
+
+
+def parse_document(filename: str, data: bytes, cache: Optional[ParseCache] = None) -> ParsedDocument:
     doc_id = Path(filename).stem
+    source_type = source_type_of(filename)
+    return ParsedDocument(doc_id=doc_id, source_type=source_type, pages=list(iter_pages(filename, data, cache)))
+
+
+@dataclass
+class ParseResult:
+    filename: str
+    document: Optional[ParsedDocument] = None
+    error: Optional[str] = None
+    seconds: float = 0.0  # parser CPU time summed over all worker tasks
+    cached: bool = False  # pages came from the parse cache
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _parse_part(filename: str, data: bytes, start: int, stop: Optional[int]) -> Tuple[List[PageText], float]:
+    began = time.perf_counter()
+    if source_type_of(filename) == "pdf":
+        pages = list(_iter_pdf(data, start, stop))
+    else:
+        pages = list(iter_pages(filename, data))
+    return pages, time.perf_counter() - began
+
+
+def _plan_parts(filename: str, data: bytes, pages_per_task: int) -> List[Tuple[int, Optional[int]]]:
+    if source_type_of(filename) != "pdf":
+        return [(0, None)]
+    total = _count_pdf_pages(data)
+    if total <= pages_per_task:
+        return [(0, None)]
+    return [(start, start + pages_per_task) for start in range(0, total, pages_per_task)]
+
+
+def parse_documents(
+    files: Sequence[Tuple[str, bytes]],
+    workers: Optional[int] = None,
+    pages_per_task: int = 32,
+    cache: Optional[ParseCache] = None,
+) -> Iterator[ParseResult]:
+    """Parse many files on a process pool, yielding each as soon as it completes.
+
+    Large PDFs are split into page ranges so one long manual does not pin a
+    single core. A failure in one file is reported on its result and never
+    aborts the rest of the batch. Files found in ``cache`` are yielded as soon
+    as the pool has its work, without being parsed; the others are stored
+    once parsed.
+    """
+    keys: Dict[int, str] = {}
+    hits: List[ParseResult] = []
+    if cache is not None:
+        misses: List[Tuple[str, bytes]] = []
+        for filename, data in files:
+            try:
+                key, pages = cached_pages(filename, data, cache)
+            except ValueError:
+                misses.append((filename, data))  # unsupported type; reported by the parser below
+                continue
+            if pages is None:
+                keys[len(misses)] = key
+                misses.append((filename, data))
+            else:
+                document = ParsedDocument(Path(filename).stem, source_type_of(filename), pages)
+                hits.append(ParseResult(filename, document=document, cached=True))
+        files = misses
+
+    for idx, result in _parse_uncached(files, workers, pages_per_task, hits):
+        if result.ok and idx in keys:
+            pages = [(p.number, p.text, p.total) for p in result.document.pages]
+            cache.put(keys[idx], pages, result.seconds)
+        yield result
+
+
+def _parse_uncached(
+    files: Sequence[Tuple[str, bytes]],
+    workers: Optional[int],
+    pages_per_task: int,
+    ready: Sequence[ParseResult] = (),
+) -> Iterator[Tuple[int, ParseResult]]:
+    """Yield ``(position in files, result)`` in completion order.
+
+    ``ready`` results (position -1) are yielded once the pool is busy.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1:
+        for result in ready:
+            yield -1, result
+        for idx, (filename, data) in enumerate(files):
+            yield idx, _parse_inline(filename, data)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending: Dict = {}
+        parts: Dict[int, List] = {}
+        results: Dict[int, ParseResult] = {}
+        for idx, (filename, data) in enumerate(files):
+            results[idx] = ParseResult(filename=filename)
+            try:
+                plan = _plan_parts(filename, data, pages_per_task)
+            except Exception as exc:
+                results[idx].error = f"{type(exc).__name__}: {exc}"
+                yield idx, results.pop(idx)
+                continue
+            parts[idx] = [None] * len(plan)
+            for part_no, (start, stop) in enumerate(plan):
+                future = pool.submit(_parse_part, filename, data, start, stop)
+                pending[future] = (idx, part_no)
 
-    if ext == ".pdf":
-        content = _read_pdf(data)
-        return ParsedDocument(doc_id=doc_id, content=content, source_type="pdf")
+        for result in ready:
+            yield -1, result
 
-    if ext == ".docx":
-        content = _read_docx(data)
-        return ParsedDocument(doc_id=doc_id, content=content, source_type="docx")
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                idx, part_no = pending.pop(future)
+                result = results.get(idx)
+                if result is None:
+                    continue  # an earlier part of this file already failed
+                try:
+                    pages, seconds = future.result()
+                except Exception as exc:
+                    result.error = f"{type(exc).__name__}: {exc}"
+                    parts.pop(idx, None)
+                    yield idx, results.pop(idx)
+                    continue
+                result.seconds += seconds
+                parts[idx][part_no] = pages
+                if all(p is not None for p in parts[idx]):
+                    filename = result.filename
+                    result.document = ParsedDocument(
+                        doc_id=Path(filename).stem,
+                        source_type=source_type_of(filename),
+                        pages=[page for part in parts.pop(idx) for page in part],
+                    )
+                    yield idx, results.pop(idx)
 
-    if ext == ".pptx":
-        content = _read_pptx(data)
-        return ParsedDocument(doc_id=doc_id, content=content, source_type="pptx")
 
-    raise ValueError(f"Unsupported file type: {ext}. Use .pdf, .docx, or .pptx")
+def _parse_inline(filename: str, data: bytes) -> ParseResult:
+    began = time.perf_counter()
+    try:
+        document = parse_document(filename, data)
+    except Exception as exc:
+        return ParseResult(filename, error=f"{type(exc).__name__}: {exc}", seconds=time.perf_counter() - began)
+    return ParseResult(filename, document=document, seconds=time.perf_counter() - began)
@@ -1,51 +1,773 @@
 """End-to-end RAG pipeline skeleton with pluggable LLM generation."""
 
+import dataclasses
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from dataclasses import dataclass, field
-from typing import Dict, List
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
 
-from .chunking import ChunkConfig, chunk_text
+import numpy as np
+
+from .cache import AnswerCache, AnswerCacheConfig
+from .chunking import ChunkConfig, chunk_spans
+from .context import ContextConfig, ContextPacker, Passage, TokenCounter
 from .embeddings import EmbeddingConfig, EmbeddingProvider
-from .index import InMemoryIndex, IndexConfig
+from .filters import compile_filter, filter_key
+from .hybrid import RetrievalConfig, fuse
+from .index import IndexConfig, create_index
 from .llm import AnswerGenerator, LLMConfig
-from .rerank import rerank
+from .parsers import (
+    PageText,
+    ParserConfig,
+    ParseResult,
+    iter_pages,
+    open_parse_cache,
+    parse_documents,
+    source_type_of,
+)
+from .registry import DocumentRecord, DocumentRegistry, content_hash
+from .rerank import RerankConfig, Reranker
+from .sparse import BM25Index, SparseConfig
+from .store import ChunkStore
+from .tracing import Tracer, TracingConfig, timings_ms
 
 
 @dataclass
 class PipelineConfig:
+    parser: ParserConfig = field(default_factory=ParserConfig)
     chunk: ChunkConfig = field(default_factory=ChunkConfig)
     embedding: EmbeddingConfig = field(default_factory=EmbeddingConfig)
     index: IndexConfig = field(default_factory=IndexConfig)
+    sparse: SparseConfig = field(default_factory=SparseConfig)
+    retrieval: RetrievalConfig = field(default_factory=RetrievalConfig)
+    rerank: RerankConfig = field(default_factory=RerankConfig)
+    answer_cache: AnswerCacheConfig = field(default_factory=AnswerCacheConfig)
+    context: ContextConfig = field(default_factory=ContextConfig)
+    tracing: TracingConfig = field(default_factory=TracingConfig)
     llm: LLMConfig = field(default_factory=LLMConfig)
+    ingest_batch_size: int = 256  # chunks embedded and upserted per micro-batch
 
 
-class RAGPipeline:
+# progress(pages_done, total_pages, chunks_done); total_pages is None when unknown.
+ProgressCallback = Callable[[int, Optional[int], int], None]
+
+
+@dataclass
+class _PendingPage:
+    """New chunks of one page waiting for the next ingest flush."""
+
+    page: PageText
+    spans: List[Tuple[int, int]]
+    positions: range
+    slots: List[int]  # indexes into the record's chunk_ids to fill with the assigned ids
+
+
+class ReadWriteLock:
+    """Many concurrent readers or one writer; a waiting writer blocks new readers."""
+
+    def __init__(self) -> None:
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class KnowledgeBase:
+    """Chunk store, indexes, embedder and reranker, independent of any LLM.
+
+    One instance can be shared by every ``RAGPipeline`` (and thread) in a
+    process. Queries take the read side of ``lock``; writers take the write
+    side only while they mutate the stores, so readers never see a
+    half-applied micro-batch. Ingest parses and embeds outside it, and
+    writers queue behind each other. ``version`` increases with every write.
+    """
+
     def __init__(self, config: PipelineConfig):
         self.config = config
         self.embedder = EmbeddingProvider(config.embedding)
-        self.index = InMemoryIndex(config.index)
-        self.generator = AnswerGenerator(config.llm)
-        self._chunks: Dict[str, str] = {}
-
-    def ingest(self, doc_id: str, content: str) -> None:
-        chunks = chunk_text(content, self.config.chunk)
-        vectors = self.embedder.embed(chunks)
-        for i, (chunk, vector) in enumerate(zip(chunks, vectors)):
-            cid = f"{doc_id}:{i}"
-            self._chunks[cid] = chunk
-            self.index.upsert(cid, vector)
-
-    def answer(self, query: str, top_k: int = 8, top_n: int = 3) -> Dict[str, List[str]]:
-        qv = self.embedder.embed([query])[0]
-        candidate_ids = self.index.search(qv, top_k=top_k)
-        passages = [(cid, self._chunks[cid]) for cid in candidate_ids if cid in self._chunks]
-        ranked = rerank(query, [text for _, text in passages], top_n=top_n)
-
-        text_to_cid = {text: cid for cid, text in passages}
-        evidence_pairs = [(text_to_cid.get(text, "unknown"), text) for text, _ in ranked]
-        answer = self.generator.generate(query, evidence_pairs)
-
-        return {
-            "query": query,
-            "evidence": [f"[{cid}] {text}" for cid, text in evidence_pairs],
-            "answer": answer,
-        }
+        self.index = create_index(config.index)
+        self.sparse = BM25Index(config.sparse)
+        self.reranker = Reranker(config.rerank)
+        self.registry = DocumentRegistry()
+        self.store = ChunkStore()
+        self.answer_cache = AnswerCache(config.answer_cache)
+        self.parse_cache = open_parse_cache(config.parser)
+        self.tracer = Tracer(config.tracing)
+        self.lock = ReadWriteLock()
+        # Serialises writers, so ingest can parse and embed outside ``lock``.
+        self._writer = threading.Lock()
+        self.version = 0
+        # Compiled filter masks keyed by (filter, version); any write invalidates them.
+        self._masks: "OrderedDict[Tuple[str, int], np.ndarray]" = OrderedDict()
+        self._masks_lock = threading.Lock()
+
+    @classmethod
+    def from_snapshot(cls, config: PipelineConfig, path: str) -> "KnowledgeBase":
+        """Build a knowledge base, warm-started from ``path`` when a snapshot exists."""
+        kb = cls(config)
+        if (Path(path) / "registry.json").exists():
+            kb.load(path)
+        return kb
+
+    def ingest(self, doc_id: str, content: str, tags: Optional[Sequence[str]] = None) -> int:
+        pages = [PageText(None, content, 1)]
+        record = self.registry.get(doc_id)
+        if (
+            record is not None
+            and record.content_hash == _pages_digest(pages)
+            and (tags is None or sorted(set(tags)) == record.tags)
+        ):
+            return len(record.chunk_ids)
+        return self.ingest_pages(doc_id, pages, tags=tags)
+
+    def ingest_file(
+        self,
+        filename: str,
+        data: bytes,
+        progress: Optional[ProgressCallback] = None,
+        tags: Optional[Sequence[str]] = None,
+    ) -> int:
+        """Parse and ingest an uploaded file page by page; returns the chunk count.
+
+        With ``config.parser.cache_path`` set, a file uploaded before skips
+        extraction and goes straight to chunking.
+        """
+        doc_id = Path(filename).stem
+        pages = iter_pages(filename, data, cache=self.parse_cache)
+        return self.ingest_pages(doc_id, pages, progress=progress, source_type=source_type_of(filename), tags=tags)
+
+    def ingest_many(
+        self,
+        files: Sequence[Tuple[str, bytes]],
+        workers: Optional[int] = None,
+        on_result: Optional[Callable[[ParseResult], None]] = None,
+        tags: Optional[Sequence[str]] = None,
+    ) -> List[ParseResult]:
+        """Parse files in parallel and ingest each one as soon as it is ready."""
+        results: List[ParseResult] = []
+        for result in parse_documents(files, workers=workers, cache=self.parse_cache):
+            if self.parse_cache is not None and result.ok:
+                self.tracer.count("parse_cache", result="hit" if result.cached else "miss")
+            if result.ok:
+                document = result.document
+                self.ingest_pages(document.doc_id, document.pages, source_type=document.source_type, tags=tags)
+            results.append(result)
+            if on_result is not None:
+                on_result(result)
+        return results
+
+    def ingest_pages(
+        self,
+        doc_id: str,
+        pages: Iterable[PageText],
+        progress: Optional[ProgressCallback] = None,
+        source_type: str = "text",
+        tags: Optional[Sequence[str]] = None,
+    ) -> int:
+        """Stream pages -> chunks -> embedding micro-batches -> index upserts.
+
+        At most ``config.ingest_batch_size`` chunks are held between flushes,
+        so peak memory does not grow with document length. When the document
+        was ingested before, chunks whose content hash is unchanged keep their
+        id and vector; only new or edited chunks are embedded, and chunks that
+        no longer exist are deleted from every store. ``source_type``, ``tags``
+        and the ingest time are recorded for metadata filters; ``tags=None``
+        keeps the tags of an earlier ingest.
+
+        Parsing, chunking and embedding run outside ``lock``: the write side
+        is held only while a flushed micro-batch is applied to the stores and
+        while the registry record is committed, so queries keep being served
+        during a long ingest and see the new chunks arrive batch by batch.
+        """
+        with self._writer, self.tracer.span("ingest", doc_id=doc_id) as traced:
+            count = self._ingest_pages(doc_id, pages, progress, source_type, tags)
+            traced.set(chunks=count)
+        return count
+
+    def _ingest_pages(
+        self,
+        doc_id: str,
+        pages: Iterable[PageText],
+        progress: Optional[ProgressCallback],
+        source_type: str,
+        tags: Optional[Sequence[str]],
+    ) -> int:
+        batch_size = max(1, self.config.ingest_batch_size)
+        old = self.registry.get(doc_id)
+        reusable: Dict[str, List[int]] = {}
+        if old is not None:
+            for cid, chunk_hash in zip(old.chunk_ids, old.chunk_hashes):
+                reusable.setdefault(chunk_hash, []).append(cid)
+
+        if tags is None:
+            tags = old.tags if old is not None else []
+        record = DocumentRecord(
+            doc_id=doc_id,
+            content_hash="",
+            next_seq=old.next_seq if old else 0,
+            source_type=source_type,
+            tags=sorted(set(tags)),
+            ingested_at=time.time(),
+        )
+        digest = hashlib.sha1()
+        pending: List[_PendingPage] = []
+        kept_at: List[Tuple[int, Optional[int], int]] = []  # (cid, page, offset) of reused chunks
+        added: List[int] = []  # ids flushed so far, rolled back if the ingest fails
+        queued = 0
+        embed = self.embedder.embed if self.config.chunk.strategy == "semantic" else None
+        try:
+            for done, page in enumerate(pages, start=1):
+                digest.update(page.text.encode("utf-8") + b"\0")
+                new_spans: List[Tuple[int, int]] = []
+                new_slots: List[int] = []
+                with self.tracer.span("chunk", page=page.number or 0) as traced:
+                    spans = chunk_spans(page.text, self.config.chunk, embed)
+                    traced.set(chunks=len(spans))
+                for span in spans:
+                    chunk_hash = content_hash(page.text[span[0] : span[1]])
+                    kept = reusable.get(chunk_hash)
+                    if kept:
+                        record.chunk_ids.append(kept[0])
+                        kept_at.append((kept.pop(0), page.number, span[0]))
+                    else:
+                        new_spans.append(span)
+                        new_slots.append(len(record.chunk_ids))
+                        record.chunk_ids.append(-1)
+                    record.chunk_hashes.append(chunk_hash)
+
+                if new_spans:
+                    positions = range(record.next_seq, record.next_seq + len(new_spans))
+                    record.next_seq += len(new_spans)
+                    pending.append(_PendingPage(page, new_spans, positions, new_slots))
+                    queued += len(new_spans)
+                if queued >= batch_size:
+                    self._flush(doc_id, record, pending, added)
+                    pending, queued = [], 0
+                if progress is not None:
+                    progress(done, page.total, len(record.chunk_ids))
+            if pending:
+                self._flush(doc_id, record, pending, added)
+        except BaseException:
+            # No registry record points at the flushed chunks yet; drop them so a
+            # failed parse or embedding leaves no unreachable, searchable orphans.
+            if added:
+                with self.lock.write():
+                    self._remove_chunks(added)
+                    self.version += 1
+            raise
+
+        record.content_hash = digest.hexdigest()
+        stale = [cid for cids in reusable.values() for cid in cids]
+        with self.lock.write():
+            self._remove_chunks(stale)
+            self.store.relocate(kept_at)
+            if added or stale or (old is not None and old.tags != record.tags):
+                # New chunks can outrank the evidence of any cached answer, not only
+                # answers citing this document, so the whole cache is stale.
+                self.answer_cache.clear()
+            self.registry.put(record)
+            self.version += 1
+        return len(record.chunk_ids)
+
+    def parse_cache_stats(self) -> Dict[str, float]:
+        return self.parse_cache.stats() if self.parse_cache is not None else {}
+
+    def delete(self, doc_id: str) -> bool:
+        """Remove a document and all of its chunks; returns False if unknown."""
+        with self._writer, self.lock.write():
+            record = self.registry.get(doc_id)
+            if record is None:
+                return False
+            self._remove_chunks(record.chunk_ids)
+            self.registry.remove(doc_id)
+            self.answer_cache.invalidate_chunks(record.chunk_ids)
+            self.version += 1
+        return True
+
+    def _flush(self, doc_id: str, record: DocumentRecord, pending: List[_PendingPage], added: List[int]) -> None:
+        """Embed queued chunks, then add them to the store and indexes under the write lock.
+
+        New ids are appended to ``added`` as soon as the store assigns them.
+        """
+        tracer = self.tracer
+        texts = [item.page.text[start:end] for item in pending for start, end in item.spans]
+        with tracer.span("embed", texts=len(texts)):
+            vectors = self.embedder.embed(texts)
+        ids: List[int] = []
+        with self.lock.write():
+            for item in pending:
+                page = item.page
+                new_ids = self.store.add_spans(doc_id, page.text, item.spans, item.positions, page=page.number)
+                for slot, cid in zip(item.slots, new_ids):
+                    record.chunk_ids[slot] = cid
+                ids.extend(new_ids)
+                added.extend(new_ids)
+            with tracer.span("index.upsert", vectors=len(ids)):
+                self.index.upsert_batch(ids, vectors)
+            with tracer.span("sparse.upsert", texts=len(ids)):
+                self.sparse.add_batch(ids, texts)
+            self.version += 1
+        tracer.count("chunks_written", len(ids))
+
+    def _remove_chunks(self, ids: List[int]) -> None:
+        if not ids:
+            return
+        # Indexes first: if one of them fails, store and registry still describe every chunk.
+        self.index.remove(ids)
+        self.sparse.remove(ids)
+        self.store.remove(ids)
+
+    def retrieve(
+        self, query: str, top_k: int = 8, query_vector=None, where: Optional[Mapping] = None
+    ) -> List[Tuple[int, float]]:
+        """Dense, sparse or fused candidates according to ``config.retrieval``.
+
+        ``where`` restricts the search to chunks whose metadata match; see
+        ``src/rag/filters.py`` for the syntax.
+        """
+        return self.retrieve_batch([query], top_k=top_k, query_vectors=query_vector, where=where)[0]
+
+    def retrieve_batch(
+        self, queries: Sequence[str], top_k: int = 8, query_vectors=None, where: Optional[Mapping] = None
+    ) -> List[List[Tuple[int, float]]]:
+        """Retrieve for many queries with one embedding call and one matrix search per retriever."""
+        with self.lock.read():
+            return self._retrieve_batch(queries, top_k, query_vectors, where)
+
+    def _retrieve_batch(
+        self, queries: Sequence[str], top_k: int, query_vectors, where: Optional[Mapping] = None
+    ) -> List[List[Tuple[int, float]]]:
+        # Callers hold the read lock.
+        cfg = self.config.retrieval
+        pool = top_k * max(1, cfg.candidate_multiplier) if cfg.mode == "hybrid" else top_k
+        dense: List[List[Tuple[int, float]]] = [[] for _ in queries]
+        sparse: List[List[Tuple[int, float]]] = [[] for _ in queries]
+        tracer = self.tracer
+        allowed = self._filter_mask(where)
+        if allowed is not None and not allowed.any():
+            return [[] for _ in queries]
+        if cfg.mode != "sparse":
+            if query_vectors is None:
+                with tracer.span("embed", texts=len(queries)):
+                    query_vectors = self.embedder.embed(list(queries))
+            with tracer.span("index.search", queries=len(queries), top_k=pool):
+                dense = self.index.search_batch_scored(query_vectors, top_k=pool, allowed=allowed)
+        if cfg.mode != "dense":
+            with tracer.span("sparse.search", queries=len(queries), top_k=pool):
+                sparse = self.sparse.search_batch_scored(list(queries), top_k=pool, allowed=allowed)
+        return [fuse(d, sp, cfg, top_k) for d, sp in zip(dense, sparse)]
+
+    def _filter_mask(self, where: Optional[Mapping]) -> Optional[np.ndarray]:
+        """Chunk-id bitmap for ``where``, compiled once per knowledge-base version."""
+        if not where:
+            return None
+        key = (filter_key(where), self.version)
+        with self._masks_lock:
+            mask = self._masks.get(key)
+            if mask is not None:
+                self._masks.move_to_end(key)
+                return mask
+        with self.tracer.span("filter.compile"):
+            mask = compile_filter(where, self.store, self.registry)
+        with self._masks_lock:
+            self._masks[key] = mask
+            while len(self._masks) > 64:
+                self._masks.popitem(last=False)
+        return mask
+
+    def save(self, path: str) -> None:
+        """Snapshot chunks and the vector index so a restart can skip re-embedding."""
+        out = Path(path)
+        out.mkdir(parents=True, exist_ok=True)
+        # Saving compacts the store and BM25 postings in place.
+        with self._writer, self.lock.write():
+            self.store.save(str(out / "store"))
+            self.index.save(str(out / "index"))
+            self.sparse.save(str(out / "sparse.pkl"))
+            self.registry.save(str(out / "registry.json"))
+
+    def load(self, path: str) -> None:
+        src = Path(path)
+        with self._writer, self.lock.write():
+            self.store.load(str(src / "store"))
+            self.index.load(str(src / "index"))
+            self.sparse.load(str(src / "sparse.pkl"))
+            self.registry.load(str(src / "registry.json"))
+            # Cached answers and rerank scores refer to chunk ids of the replaced corpus.
+            self.answer_cache.clear()
+            self.reranker.clear()
+            self.version += 1
+
+
+class RAGPipeline:
+    """Answer generation on top of a (possibly shared) ``KnowledgeBase``.
+
+    The pipeline owns only the generator and its context packer, so changing
+    LLM settings with ``set_llm`` keeps the ingested corpus. Ingestion,
+    retrieval and persistence calls are forwarded to the knowledge base.
+    """
+
+    def __init__(self, config: PipelineConfig, knowledge: Optional[KnowledgeBase] = None):
+        self.knowledge = knowledge or KnowledgeBase(config)
+        self.config = config
+        self.set_llm(config.llm)
+
+    def set_llm(self, llm: LLMConfig) -> None:
+        """Swap the generator; the knowledge base is untouched."""
+        self.config = dataclasses.replace(self.config, llm=llm)
+        self.generator = AnswerGenerator(llm)
+        ctx = self.config.context
+        self.packer = ContextPacker(ctx, TokenCounter(ctx.tokenizer, llm.provider, llm.model, ctx.cache_size))
+
+    embedder = property(lambda self: self.knowledge.embedder)
+    index = property(lambda self: self.knowledge.index)
+    sparse = property(lambda self: self.knowledge.sparse)
+    reranker = property(lambda self: self.knowledge.reranker)
+    registry = property(lambda self: self.knowledge.registry)
+    store = property(lambda self: self.knowledge.store)
+    answer_cache = property(lambda self: self.knowledge.answer_cache)
+    parse_cache = property(lambda self: self.knowledge.parse_cache)
+    tracer = property(lambda self: self.knowledge.tracer)
+
+    def ingest(self, doc_id: str, content: str, tags: Optional[Sequence[str]] = None) -> int:
+        return self.knowledge.ingest(doc_id, content, tags=tags)
+
+    def ingest_file(
+        self,
+        filename: str,
+        data: bytes,
+        progress: Optional[ProgressCallback] = None,
+        tags: Optional[Sequence[str]] = None,
+    ) -> int:
+        return self.knowledge.ingest_file(filename, data, progress=progress, tags=tags)
+
+    def ingest_many(
+        self,
+        files: Sequence[Tuple[str, bytes]],
+        workers: Optional[int] = None,
+        on_result: Optional[Callable[[ParseResult], None]] = None,
+        tags: Optional[Sequence[str]] = None,
+    ) -> List[ParseResult]:
+        return self.knowledge.ingest_many(files, workers=workers, on_result=on_result, tags=tags)
+
+    def ingest_pages(
+        self,
+        doc_id: str,
+        pages: Iterable[PageText],
+        progress: Optional[ProgressCallback] = None,
+        source_type: str = "text",
+        tags: Optional[Sequence[str]] = None,
+    ) -> int:
+        return self.knowledge.ingest_pages(doc_id, pages, progress=progress, source_type=source_type, tags=tags)
+
+    def delete(self, doc_id: str) -> bool:
+        return self.knowledge.delete(doc_id)
+
+    def retrieve(
+        self, query: str, top_k: int = 8, query_vector=None, where: Optional[Mapping] = None
+    ) -> List[Tuple[int, float]]:
+        return self.knowledge.retrieve(query, top_k=top_k, query_vector=query_vector, where=where)
+
+    def retrieve_batch(
+        self, queries: Sequence[str], top_k: int = 8, query_vectors=None, where: Optional[Mapping] = None
+    ) -> List[List[Tuple[int, float]]]:
+        return self.knowledge.retrieve_batch(queries, top_k=top_k, query_vectors=query_vectors, where=where)
+
+    def save(self, path: str) -> None:
+        self.knowledge.save(path)
+
+    def load(self, path: str) -> None:
+        self.knowledge.load(path)
+
+    def answer(
+        self,
+        query: str,
+        top_k: int = 8,
+        top_n: int = 3,
+        timings: bool = False,
+        where: Optional[Mapping] = None,
+    ) -> Dict:
+        """Answer ``query``; ``result["cached"]`` is ``"exact"``, ``"semantic"`` or None.
+
+        With ``timings=True`` the result also maps each traced stage to the
+        milliseconds it took for this query. ``where`` restricts the evidence
+        to chunks matching a metadata filter.
+        """
+        tracer = self.tracer
+        with tracer.collect() as spans, tracer.span("answer", top_k=top_k, top_n=top_n) as root:
+            scope = self._cache_scope(top_k, top_n, where)
+            cached, query_vector = self._cached_answer(query, scope)
+            if cached is not None:
+                result = cached
+            else:
+                with self.knowledge.lock.read():
+                    version = self.knowledge.version
+                    ranked = self._evidence(query, top_k, top_n, query_vector, where)
+                    evidence_pairs = self._pack(ranked)
+                with tracer.span("generate", provider=self.generator.config.provider):
+                    answer = self.generator.generate(query, evidence_pairs)
+                tracer.count("answer_tokens", self.packer.counter.count(answer))
+
+                result = {
+                    "query": query,
+                    "evidence": [f"[{cid}] {text}" for cid, text in evidence_pairs],
+                    "answer": answer,
+                }
+                self._remember(query, result, ranked, query_vector, scope, version)
+                result = {**result, "cached": None}
+            root.set(cached=str(result["cached"]))
+        tracer.count("queries")
+        if timings:
+            result["timings"] = timings_ms(spans)
+        return result
+
+    def answer_stream(
+        self,
+        query: str,
+        top_k: int = 8,
+        top_n: int = 3,
+        timings: bool = False,
+        where: Optional[Mapping] = None,
+    ) -> Iterator[Dict]:
+        """Yield ``evidence`` first, then answer ``token`` events, then ``done``.
+
+        The UI can show the evidence and the first tokens long before the
+        full answer is finished. Cached answers are replayed as one token.
+        With ``timings=True`` the ``done`` event carries per-stage milliseconds.
+        """
+        tracer = self.tracer
+        tracer.count("queries")
+        # Spans must not stay open across yields, so the generation time is
+        # measured by hand and reported with ``tracer.record``.
+        with tracer.collect() as spans:
+            scope = self._cache_scope(top_k, top_n, where)
+            cached, query_vector = self._cached_answer(query, scope)
+            if cached is None:
+                with self.knowledge.lock.read():
+                    version = self.knowledge.version
+                    ranked = self._evidence(query, top_k, top_n, query_vector, where)
+                    evidence_pairs = self._pack(ranked)
+        extra = {"timings": timings_ms(spans)} if timings else {}
+
+        if cached is not None:
+            yield {"type": "evidence", "query": query, "evidence": cached["evidence"], "cached": cached["cached"]}
+            yield {"type": "token", "text": cached["answer"]}
+            yield {"type": "done", "answer": cached["answer"], **extra}
+            return
+
+        evidence = [f"[{cid}] {text}" for cid, text in evidence_pairs]
+        yield {"type": "evidence", "query": query, "evidence": evidence, "cached": None}
+        parts: List[str] = []
+        generating = 0.0
+        first_token = None
+        stream = self.generator.stream(query, evidence_pairs)
+        while True:
+            start = time.perf_counter()
+            token = next(stream, None)
+            generating += time.perf_counter() - start
+            if token is None:
+                break
+            if first_token is None:
+                first_token = generating
+            parts.append(token)
+            yield {"type": "token", "text": token}
+        answer = "".join(parts)
+        tracer.record(
+            "generate",
+            generating,
+            provider=self.generator.config.provider,
+            first_token_ms=round((first_token or generating) * 1000.0, 3),
+        )
+        tracer.count("answer_tokens", self.packer.counter.count(answer))
+        result = {"query": query, "evidence": evidence, "answer": answer}
+        self._remember(query, result, ranked, query_vector, scope, version)
+        if timings:
+            extra["timings"]["generate"] = round(generating * 1000.0, 3)
+        yield {"type": "done", "answer": answer, **extra}
+
+    def answer_batch(
+        self,
+        queries: Sequence[str],
+        top_k: int = 8,
+        top_n: int = 3,
+        timings: bool = False,
+        where: Optional[Mapping] = None,
+    ) -> List[Dict]:
+        """Answer many queries at once; results are returned in input order.
+
+        Cache misses are embedded in one call, searched as one query matrix
+        per retriever, reranked as one pool of (query, passage) pairs and
+        generated concurrently. Repeated queries are answered once. With
+        ``timings=True`` every result carries the timings of the whole batch.
+        """
+        tracer = self.tracer
+        scope = self._cache_scope(top_k, top_n, where)
+        unique = list(dict.fromkeys(queries))
+        results: Dict[str, Dict] = {}
+        with tracer.collect() as spans, tracer.span("answer_batch", queries=len(queries), unique=len(unique)):
+            misses: List[str] = []
+            for query in unique:
+                hit = self.answer_cache.get_exact(query, scope)
+                if hit is not None:
+                    tracer.count("answer_cache", result="exact")
+                    results[query] = {**hit, "query": query, "cached": "exact"}
+                else:
+                    misses.append(query)
+
+            vectors = None
+            if misses and self._needs_query_vector():
+                with tracer.span("embed", texts=len(misses)):
+                    vectors = self.embedder.embed(misses)
+                keep = []
+                for row, query in enumerate(misses):
+                    hit = self.answer_cache.get_similar(vectors[row], scope)
+                    if hit is not None:
+                        tracer.count("answer_cache", result="semantic")
+                        results[query] = {**hit, "query": query, "cached": "semantic"}
+                    else:
+                        keep.append(row)
+                misses = [misses[row] for row in keep]
+                vectors = vectors[keep]
+            tracer.count("answer_cache", len(misses), result="miss")
+
+            if misses:
+                with self.knowledge.lock.read():
+                    version = self.knowledge.version
+                    candidates = self.knowledge._retrieve_batch(misses, top_k, vectors, where)
+                    passages = [
+                        [(cid, self.store.text(cid)) for cid, _ in hits if cid in self.store] for hits in candidates
+                    ]
+                    n_pairs = sum(len(p) for p in passages)
+                    tracer.count("rerank_candidates", n_pairs)
+                    with tracer.span("rerank", candidates=n_pairs, top_n=top_n):
+                        ranked = self.reranker.rerank_batch(misses, passages, top_n=top_n)
+                    packed = [self._pack(r) for r in ranked]
+                with tracer.span("generate", provider=self.generator.config.provider, queries=len(misses)):
+                    answers = self.generator.generate_batch(list(zip(misses, packed)))
+
+                for row, (query, evidence_pairs, answer) in enumerate(zip(misses, packed, answers)):
+                    tracer.count("answer_tokens", self.packer.counter.count(answer))
+                    result = {
+                        "query": query,
+                        "evidence": [f"[{cid}] {text}" for cid, text in evidence_pairs],
+                        "answer": answer,
+                    }
+                    query_vector = None if vectors is None else vectors[row]
+                    self._remember(query, result, ranked[row], query_vector, scope, version)
+                    results[query] = {**result, "cached": None}
+        tracer.count("queries", len(queries))
+
+        batch_timings = timings_ms(spans) if timings else None
+        out = []
+        for query in queries:
+            result = dict(results[query])
+            if batch_timings is not None:
+                result["timings"] = batch_timings
+            out.append(result)
+        return out
+
+    def _needs_query_vector(self) -> bool:
+        return self.knowledge.config.retrieval.mode != "sparse" or (
+            self.answer_cache.config.enabled and self.answer_cache.config.semantic
+        )
+
+    def _cache_scope(self, top_k: int, top_n: int, where: Optional[Mapping] = None) -> Tuple:
+        llm = self.generator.config
+        mode = self.knowledge.config.retrieval.mode
+        return (top_k, top_n, mode, filter_key(where), llm.provider, llm.model, llm.temperature)
+
+    def _cached_answer(self, query: str, scope: Tuple):
+        """Return ``(cached_result, query_vector)``; the vector is reused on a miss."""
+        tracer = self.tracer
+        hit = self.answer_cache.get_exact(query, scope)
+        if hit is not None:
+            tracer.count("answer_cache", result="exact")
+            return {**hit, "query": query, "cached": "exact"}, None
+
+        query_vector = None
+        if self._needs_query_vector():
+            with tracer.span("embed", texts=1):
+                query_vector = self.embedder.embed([query])
+            hit = self.answer_cache.get_similar(query_vector[0], scope)
+            if hit is not None:
+                tracer.count("answer_cache", result="semantic")
+                return {**hit, "query": query, "cached": "semantic"}, query_vector
+        tracer.count("answer_cache", result="miss")
+        return None, query_vector
+
+    def _remember(self, query: str, result: Dict, ranked, query_vector, scope: Tuple, version: int) -> None:
+        """Cache ``result`` unless it has no evidence or the knowledge base changed since it was read."""
+        if not ranked:
+            # Nothing cites a chunk, so no later ingest could invalidate it.
+            return
+        with self.knowledge.lock.read():
+            if self.knowledge.version == version:
+                chunk_ids = [cid for cid, _, _ in ranked]
+                self.answer_cache.put(query, result, chunk_ids, query_vector=query_vector, scope=scope)
+
+    def _evidence(
+        self, query: str, top_k: int, top_n: int, query_vector=None, where: Optional[Mapping] = None
+    ) -> List[Tuple[int, str, float]]:
+        # Callers hold the knowledge base read lock.
+        hits = self.knowledge._retrieve_batch([query], top_k, query_vector, where)[0]
+        candidate_ids = [cid for cid, _ in hits]
+        passages = [(cid, self.store.text(cid)) for cid in candidate_ids if cid in self.store]
+        self.tracer.count("rerank_candidates", len(passages))
+        with self.tracer.span("rerank", candidates=len(passages), top_n=top_n):
+            return self.reranker.rerank(query, passages, top_n=top_n)
+
+    def _pack(self, ranked: List[Tuple[int, str, float]]) -> List[Tuple[str, str]]:
+        """Fit reranked chunks into the context token budget as ``(label, text)``."""
+        store = self.store
+        passages = []
+        for cid, text, score in ranked:
+            # Only chunks of the same page are merged, by their offsets in the page text.
+            span = store.source_span(cid)
+            source = (store.doc_id(cid), store.page(cid)) if span is not None else None
+            passages.append(Passage(store.label(cid), text, score, source, *(span or (None, None))))
+        with self.tracer.span("context.pack", passages=len(passages)) as traced:
+            packed = self.packer.pack(passages)
+            tokens = sum(self.packer.counter.count(text) for _, text in packed)
+            traced.set(tokens=tokens)
+        self.tracer.count("context_tokens", tokens)
+        return packed
+
+
+def _pages_digest(pages: Iterable[PageText]) -> str:
+    digest = hashlib.sha1()
+    for page in pages:
+        digest.update(page.text.encode("utf-8") + b"\0")
+    return digest.hexdigest()
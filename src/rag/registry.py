@@ -0,0 +1,60 @@
+"""Document registry used for incremental re-ingestion."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class DocumentRecord:
+    """Fingerprints of one ingested document and its chunks, in document order."""
+
+    doc_id: str
+    content_hash: str
+    chunk_ids: List[int] = field(default_factory=list)
+    chunk_hashes: List[str] = field(default_factory=list)
+    next_seq: int = 0  # positions are never reused, so citation labels stay unique
+    source_type: str = "text"  # pdf | docx | pptx | text
+    tags: List[str] = field(default_factory=list)
+    ingested_at: float = 0.0  # unix time of the last ingest
+
+
+class DocumentRegistry:
+    def __init__(self) -> None:
+        self._docs: Dict[str, DocumentRecord] = {}
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._docs
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def __iter__(self) -> Iterator[DocumentRecord]:
+        return iter(self._docs.values())
+
+    def get(self, doc_id: str) -> Optional[DocumentRecord]:
+        return self._docs.get(doc_id)
+
+    def put(self, record: DocumentRecord) -> None:
+        self._docs[record.doc_id] = record
+
+    def remove(self, doc_id: str) -> Optional[DocumentRecord]:
+        return self._docs.pop(doc_id, None)
+
+    def save(self, path: str) -> None:
+        out = Path(path)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        data = [asdict(record) for record in self._docs.values()]
+        out.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+
+    def load(self, path: str) -> None:
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+        self._docs = {item["doc_id"]: DocumentRecord(**item) for item in data}
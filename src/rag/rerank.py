@@ -1,6 +1,38 @@
-"""Cross-encoder reranking placeholders."""
+"""Cross-encoder reranking with batched scoring and a score cache."""
 
-from typing import List, Tuple
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Hashable, List, Sequence, Tuple
+
+import numpy as np
+
+
+@dataclass
+class RerankConfig:
+    provider: str = "cross-encoder"  # cross-encoder | overlap
+    model: str = "BAAI/bge-reranker-base"
+    device: str = "cpu"
+    max_length: int = 512
+    batch_size: int = 64
+    cache_size: int = 50000  # cached (query, chunk id) scores; 0 disables
+
+
+_MODEL_CACHE: Dict[Tuple[str, str, int], object] = {}
+_MODEL_LOCK = threading.Lock()
+
+
+def _load_cross_encoder(model: str, device: str, max_length: int):
+    key = (model, device, max_length)
+    with _MODEL_LOCK:
+        if key not in _MODEL_CACHE:
+            from sentence_transformers import CrossEncoder
+
+            _MODEL_CACHE[key] = CrossEncoder(model, max_length=max_length, device=device)
+        return _MODEL_CACHE[key]
 
 
 def rerank(query: str, passages: List[str], top_n: int = 5) -> List[Tuple[str, float]]:
@@ -8,3 +40,99 @@ def rerank(query: str, passages: List[str], top_n: int = 5) -> List[Tuple[str, f
     scored = [(p, float(len(set(query) & set(p)))) for p in passages]
     scored.sort(key=lambda x: x[1], reverse=True)
     return scored[:top_n]
+
+
+class Reranker:
+    """Score (query, passage) pairs and keep the best ``top_n`` per query.
+
+    All uncached pairs of a call are scored together in forward passes of up
+    to ``config.batch_size`` pairs. Scores are cached by (query hash, chunk id),
+    which is safe because a chunk store never reuses an id for different
+    content; call ``clear`` when the whole corpus is replaced.
+    """
+
+    def __init__(self, config: RerankConfig):
+        if config.provider not in {"cross-encoder", "overlap"}:
+            raise ValueError(f"Unsupported rerank provider: {config.provider}")
+        self.config = config
+        self._model = None
+        self._cache: "OrderedDict[Tuple[str, Hashable], float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def rerank(
+        self,
+        query: str,
+        passages: Sequence[Tuple[Hashable, str]],
+        top_n: int = 5,
+    ) -> List[Tuple[Hashable, str, float]]:
+        return self.rerank_batch([query], [passages], top_n=top_n)[0]
+
+    def rerank_batch(
+        self,
+        queries: Sequence[str],
+        passages: Sequence[Sequence[Tuple[Hashable, str]]],
+        top_n: int = 5,
+    ) -> List[List[Tuple[Hashable, str, float]]]:
+        """Rerank several queries' candidates with one shared scoring pass."""
+        pairs = [(q, cid, text) for q, cands in zip(queries, passages) for cid, text in cands]
+        scores = self.score_pairs(pairs)
+
+        results: List[List[Tuple[Hashable, str, float]]] = []
+        offset = 0
+        for cands in passages:
+            part = scores[offset : offset + len(cands)]
+            offset += len(cands)
+            order = np.argsort(-part, kind="stable")[:top_n]
+            results.append([(cands[i][0], cands[i][1], float(part[i])) for i in order])
+        return results
+
+    def score_pairs(self, pairs: Sequence[Tuple[str, Hashable, str]]) -> np.ndarray:
+        """Score ``(query, chunk_id, text)`` triples, reusing cached scores."""
+        scores = np.empty(len(pairs), dtype=np.float32)
+        keys = [(_query_key(q), cid) for q, cid, _ in pairs]
+        missing: List[int] = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                cached = self._cache.get(key)
+                if cached is None:
+                    missing.append(i)
+                else:
+                    self._cache.move_to_end(key)
+                    scores[i] = cached
+
+        if missing:
+            fresh = self._score([(pairs[i][0], pairs[i][2]) for i in missing])
+            scores[missing] = fresh
+            self._remember([keys[i] for i in missing], fresh)
+        return scores
+
+    def _score(self, pairs: List[Tuple[str, str]]) -> np.ndarray:
+        if self.config.provider == "overlap":
+            return np.asarray([len(set(q) & set(p)) for q, p in pairs], dtype=np.float32)
+        if self._model is None:
+            self._model = _load_cross_encoder(self.config.model, self.config.device, self.config.max_length)
+        scores = self._model.predict(
+            pairs,
+            batch_size=self.config.batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+        return np.asarray(scores, dtype=np.float32).reshape(-1)
+
+    def _remember(self, keys: List[Tuple[str, Hashable]], scores: np.ndarray) -> None:
+        if self.config.cache_size <= 0:
+            return
+        with self._lock:
+            for key, score in zip(keys, scores):
+                self._cache[key] = float(score)
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.config.cache_size:
+                self._cache.popitem(last=False)
+
+
+def _query_key(query: str) -> str:
+    return hashlib.sha1(query.strip().encode("utf-8")).hexdigest()
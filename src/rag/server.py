@@ -0,0 +1,330 @@
+"""Headless HTTP query service with a dynamic micro-batching scheduler.
+
+Concurrent ``/query`` requests are queued and answered together: a worker
+takes the oldest request, waits up to ``max_wait_ms`` for more to arrive and
+hands the whole batch to ``RAGPipeline.answer_batch``, which embeds, searches
+and reranks it as matrices. The queue is bounded; when it is full new
+queries are turned away with 429 instead of piling up latency.
+
+    python -m src.rag.server --port 8000 --snapshot artifacts/rag_snapshot
+
+Endpoints: ``POST /query``, ``POST /ingest``, ``GET /health``, ``GET /metrics``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeout
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from .embeddings import EmbeddingConfig
+from .filters import filter_key
+from .llm import LLMConfig
+from .pipeline import KnowledgeBase, PipelineConfig, RAGPipeline
+from .rerank import RerankConfig
+
+
+@dataclass
+class ServerConfig:
+    host: str = "127.0.0.1"
+    port: int = 8000
+    max_batch_size: int = 32  # queries answered per answer_batch call
+    max_wait_ms: float = 5.0  # how long the oldest query waits for company
+    max_queue: int = 256  # queued queries beyond this are rejected with 429
+    workers: int = 2  # batches in flight; generation of one overlaps retrieval of the next
+    request_timeout: float = 30.0  # seconds before a queued query gives up with 503
+    max_body_bytes: int = 64 * 1024 * 1024
+
+
+class Rejected(RuntimeError):
+    """A request turned away by admission control; ``status`` is the HTTP code."""
+
+    def __init__(self, status: int, reason: str):
+        super().__init__(reason)
+        self.status = status
+
+
+@dataclass
+class _Request:
+    query: str
+    top_k: int
+    top_n: int
+    where: Optional[Mapping] = None
+    future: Future = field(default_factory=Future)
+    enqueued: float = field(default_factory=time.monotonic)
+
+
+class MicroBatcher:
+    """Collect queries for a few milliseconds and answer them as one batch."""
+
+    def __init__(self, pipeline: RAGPipeline, config: Optional[ServerConfig] = None):
+        self.pipeline = pipeline
+        self.config = config or ServerConfig()
+        self._queue: "queue.Queue[Optional[_Request]]" = queue.Queue(maxsize=max(1, self.config.max_queue))
+        self._closed = False
+        self._threads = [
+            threading.Thread(target=self._run, name=f"rag-batcher-{i}", daemon=True)
+            for i in range(max(1, self.config.workers))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, query: str, top_k: int = 8, top_n: int = 3, where: Optional[Mapping] = None) -> Future:
+        """Queue one query; the returned future resolves to its answer dict."""
+        if self._closed:
+            raise Rejected(503, "server is shutting down")
+        request = _Request(query, top_k, top_n, where)
+        try:
+            self._queue.put_nowait(request)
+        except queue.Full:
+            self.pipeline.tracer.count("server_rejected", reason="queue_full")
+            raise Rejected(429, "query queue is full") from None
+        return request.future
+
+    def answer(self, query: str, top_k: int = 8, top_n: int = 3, where: Optional[Mapping] = None) -> Dict:
+        """Submit and wait, giving up with 503 after ``request_timeout``."""
+        future = self.submit(query, top_k, top_n, where)
+        try:
+            return future.result(timeout=self.config.request_timeout)
+        except FutureTimeout:
+            future.cancel()
+            self.pipeline.tracer.count("server_rejected", reason="timeout")
+            raise Rejected(503, "query timed out in the queue") from None
+
+    def close(self) -> None:
+        """Stop accepting queries, finish the queued ones and join the workers."""
+        self._closed = True
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch, stop = self._collect(first)
+            self._dispatch(batch)
+            if stop:
+                return
+
+    def _collect(self, first: _Request) -> Tuple[List[_Request], bool]:
+        batch = [first]
+        deadline = time.monotonic() + self.config.max_wait_ms / 1000.0
+        while len(batch) < self.config.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _dispatch(self, batch: List[_Request]) -> None:
+        tracer = self.pipeline.tracer
+        now = time.monotonic()
+        groups: Dict[Tuple[int, int, str], List[_Request]] = {}
+        for request in batch:
+            # Cancelled futures belong to clients that already gave up.
+            if not request.future.set_running_or_notify_cancel():
+                continue
+            tracer.record("server.queue", now - request.enqueued)
+            key = (request.top_k, request.top_n, filter_key(request.where))
+            groups.setdefault(key, []).append(request)
+
+        for (top_k, top_n, _), requests in groups.items():
+            tracer.count("server_batches")
+            tracer.count("server_batch_queries", len(requests))
+            try:
+                results = self.pipeline.answer_batch(
+                    [r.query for r in requests], top_k=top_k, top_n=top_n, where=requests[0].where
+                )
+            except Exception as exc:
+                for request in requests:
+                    request.future.set_exception(exc)
+                continue
+            for request, result in zip(requests, results):
+                request.future.set_result(result)
+
+
+class RAGServer(ThreadingHTTPServer):
+    """``ThreadingHTTPServer`` that routes requests to a shared pipeline."""
+
+    daemon_threads = True
+    request_queue_size = 1024  # listen backlog; admission control happens in the batcher
+
+    def __init__(self, pipeline: RAGPipeline, config: Optional[ServerConfig] = None):
+        self.config = config or ServerConfig()
+        self.pipeline = pipeline
+        self.batcher = MicroBatcher(pipeline, self.config)
+        super().__init__((self.config.host, self.config.port), _Handler)
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.batcher.close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: RAGServer
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        if self.path == "/health":
+            self._health()
+        elif self.path == "/metrics":
+            body = self.server.pipeline.tracer.prometheus().encode("utf-8")
+            self._send(200, body, "text/plain; version=0.0.4; charset=utf-8")
+        else:
+            self._json(404, {"error": f"unknown path: {self.path}"})
+
+    def do_POST(self) -> None:
+        try:
+            payload = self._read_json()
+            if self.path == "/query":
+                self._query(payload)
+            elif self.path == "/ingest":
+                self._ingest(payload)
+            else:
+                self._json(404, {"error": f"unknown path: {self.path}"})
+        except Rejected as exc:
+            headers = {"Retry-After": "1"} if exc.status in (429, 503) else {}
+            self._json(exc.status, {"error": str(exc)}, headers)
+        except (ValueError, KeyError, TypeError) as exc:
+            self._json(400, {"error": f"{type(exc).__name__}: {exc}"})
+        except Exception as exc:
+            self._json(500, {"error": f"{type(exc).__name__}: {exc}"})
+
+    def _query(self, payload: Dict) -> None:
+        query = str(payload["query"]).strip()
+        if not query:
+            raise ValueError("query is empty")
+        top_k = int(payload.get("top_k", 8))
+        top_n = int(payload.get("top_n", 3))
+        where = payload.get("where") or None
+        self._json(200, self.server.batcher.answer(query, top_k=top_k, top_n=top_n, where=where))
+
+    def _ingest(self, payload: Dict) -> None:
+        pipeline = self.server.pipeline
+        tags = payload.get("tags")
+        if tags is not None and not isinstance(tags, list):
+            raise ValueError("tags must be a list of strings")
+        if "content" in payload:
+            doc_id = str(payload["doc_id"])
+            chunks = pipeline.ingest(doc_id, str(payload["content"]), tags=tags)
+        else:
+            filename = str(payload["filename"])
+            data = base64.b64decode(payload["data"], validate=True)
+            doc_id = Path(filename).stem
+            chunks = pipeline.ingest_file(filename, data, tags=tags)
+        self._json(200, {"doc_id": doc_id, "chunks": chunks})
+
+    def _health(self) -> None:
+        server = self.server
+        knowledge = server.pipeline.knowledge
+        depth = server.batcher.depth
+        status = "ok" if depth < server.config.max_queue else "overloaded"
+        body = {
+            "status": status,
+            "documents": len(knowledge.registry),
+            "chunks": len(knowledge.store),
+            "version": knowledge.version,
+            "queue_depth": depth,
+            "max_queue": server.config.max_queue,
+        }
+        self._json(200 if status == "ok" else 503, body)
+
+    def _read_json(self) -> Dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > self.server.config.max_body_bytes:
+            raise Rejected(413, "request body too large")
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if not isinstance(payload, dict):
+            raise ValueError("request body must be a JSON object")
+        return payload
+
+    def _json(self, status: int, payload: Dict, headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self._send(status, body, "application/json; charset=utf-8", headers)
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: Optional[Dict[str, str]] = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        # Access logs go through the tracer counters instead of stderr.
+        return
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Serve RAGPipeline over HTTP with micro-batching")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--snapshot", default=None, help="Warm-start from this snapshot directory")
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--max-queue", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--embedding", default="bge", help="Embedding provider")
+    parser.add_argument("--reranker", default="cross-encoder", help="overlap | cross-encoder")
+    parser.add_argument("--llm", default="extractive", help="extractive | openai | ollama")
+    parser.add_argument("--llm-model", default=None)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    llm = LLMConfig(provider=args.llm)
+    if args.llm_model:
+        llm.model = args.llm_model
+    config = PipelineConfig(
+        embedding=EmbeddingConfig(provider=args.embedding),
+        rerank=RerankConfig(provider=args.reranker),
+        llm=llm,
+    )
+    knowledge = KnowledgeBase.from_snapshot(config, args.snapshot) if args.snapshot else None
+    pipeline = RAGPipeline(config, knowledge=knowledge)
+    server = RAGServer(
+        pipeline,
+        ServerConfig(
+            host=args.host,
+            port=args.port,
+            max_batch_size=args.max_batch_size,
+            max_wait_ms=args.max_wait_ms,
+            max_queue=args.max_queue,
+            workers=args.workers,
+        ),
+    )
+    print(f"Serving on http://{args.host}:{server.server_address[1]} ({len(pipeline.store)} chunks)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""Incrementally updatable BM25 inverted index for sparse retrieval."""
+
+from __future__ import annotations
+
+import math
+import pickle
+import re
+from array import array
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .index import ChunkId, chunk_id_array, mask_ids, topk_rows
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+|[\u4e00-\u9fff]+")
+_CJK_RE = re.compile(r"[\u4e00-\u9fff]")
+
+
+@dataclass
+class SparseConfig:
+    k1: float = 1.5
+    b: float = 0.75
+    compact_ratio: float = 0.3  # rebuild postings once this share of slots is dead
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased latin words plus CJK unigrams and bigrams.
+
+    Chinese has no whitespace word boundaries, so overlapping character
+    bigrams give BM25 phrase-level signal without a segmentation model.
+    """
+    tokens: List[str] = []
+    for run in _TOKEN_RE.findall(text.lower()):
+        if not _CJK_RE.match(run):
+            tokens.append(run)
+            continue
+        tokens.extend(run)
+        tokens.extend(run[i : i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class BM25Index:
+    """BM25 over array-backed postings that supports upserts and deletes.
+
+    Each document occupies a slot. Postings store slot ids and term
+    frequencies in parallel ``array('i')`` buffers, so adding a document only
+    appends to the postings of its own terms. Deleted slots are masked at
+    query time and reclaimed by compaction once enough of them pile up.
+    """
+
+    def __init__(self, config: Optional[SparseConfig] = None):
+        self.config = config or SparseConfig()
+        self._ids: List[Optional[ChunkId]] = []
+        self._slot_of: Dict[ChunkId, int] = {}
+        self._doc_len = array("i")
+        self._alive = bytearray()
+        self._doc_terms: List[Optional[Tuple[str, ...]]] = []
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._df: Dict[str, int] = {}
+        self._total_len = 0
+        self._dead = 0
+        self._slot_ids: Optional[np.ndarray] = None  # chunk id per slot, rebuilt lazily for filtering
+
+    def __len__(self) -> int:
+        return len(self._slot_of)
+
+    def add(self, doc_id: ChunkId, text: str) -> None:
+        self.add_batch([doc_id], [text])
+
+    def add_batch(self, ids: Sequence[ChunkId], texts: Sequence[str]) -> None:
+        if len(ids) != len(texts):
+            raise ValueError(f"Got {len(ids)} ids for {len(texts)} texts")
+        self.remove([doc_id for doc_id in ids if doc_id in self._slot_of])
+        self._slot_ids = None
+
+        for doc_id, text in zip(ids, texts):
+            slot = len(self._ids)
+            tokens = tokenize(text)
+            counts: Dict[str, int] = {}
+            for tok in tokens:
+                counts[tok] = counts.get(tok, 0) + 1
+            for term, tf in counts.items():
+                posting = self._postings.get(term)
+                if posting is None:
+                    posting = self._postings[term] = (array("i"), array("i"))
+                posting[0].append(slot)
+                posting[1].append(tf)
+                self._df[term] = self._df.get(term, 0) + 1
+
+            self._ids.append(doc_id)
+            self._slot_of[doc_id] = slot
+            self._doc_len.append(len(tokens))
+            self._alive.append(1)
+            self._doc_terms.append(tuple(counts))
+            self._total_len += len(tokens)
+
+    def remove(self, ids: Sequence[ChunkId]) -> None:
+        self._slot_ids = None
+        for doc_id in ids:
+            slot = self._slot_of.pop(doc_id, None)
+            if slot is None:
+                continue
+            for term in self._doc_terms[slot] or ():
+                self._df[term] -= 1
+            self._ids[slot] = None
+            self._alive[slot] = 0
+            self._doc_terms[slot] = None
+            self._total_len -= self._doc_len[slot]
+            self._dead += 1
+        if self._ids and self._dead / len(self._ids) > self.config.compact_ratio:
+            self.compact()
+
+    def search(self, query: str, top_k: int = 5) -> List[ChunkId]:
+        return [doc_id for doc_id, _ in self.search_batch_scored([query], top_k)[0]]
+
+    def search_batch_scored(
+        self, queries: Sequence[str], top_k: int = 5, allowed: Optional[np.ndarray] = None
+    ) -> List[List[Tuple[ChunkId, float]]]:
+        """Score queries over the postings; ``allowed`` masks chunk ids before top-k."""
+        if not self._slot_of or top_k <= 0:
+            return [[] for _ in queries]
+
+        cfg = self.config
+        n_slots = len(self._ids)
+        n_docs = len(self._slot_of)
+        doc_len = np.frombuffer(self._doc_len, dtype=np.int32).astype(np.float32)
+        norm = cfg.k1 * (1.0 - cfg.b + cfg.b * doc_len / max(1e-9, self._total_len / n_docs))
+        alive = np.frombuffer(self._alive, dtype=bool)
+
+        scores = np.zeros((len(queries), n_slots), dtype=np.float32)
+        for row, query in enumerate(queries):
+            for term in set(tokenize(query)):
+                posting = self._postings.get(term)
+                df = self._df.get(term, 0)
+                if posting is None or df <= 0:
+                    continue
+                idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+                slots = np.frombuffer(posting[0], dtype=np.int32)
+                tf = np.frombuffer(posting[1], dtype=np.int32).astype(np.float32)
+                scores[row, slots] += idf * tf * (cfg.k1 + 1.0) / (tf + norm[slots])
+        scores[:, ~alive] = 0.0
+        if allowed is not None:
+            if self._slot_ids is None:
+                self._slot_ids = chunk_id_array(self._ids)
+            scores[:, ~mask_ids(self._slot_ids, allowed)] = 0.0
+
+        rows = topk_rows(scores, top_k)
+        return [
+            [(self._ids[s], float(scores[q, s])) for s in slot_ids if scores[q, s] > 0]
+            for q, slot_ids in enumerate(rows)
+        ]
+
+    def compact(self) -> None:
+        """Drop dead slots and renumber postings densely."""
+        remap = np.full(len(self._ids), -1, dtype=np.int32)
+        live = [slot for slot, doc_id in enumerate(self._ids) if doc_id is not None]
+        remap[live] = np.arange(len(live), dtype=np.int32)
+
+        postings: Dict[str, Tuple[array, array]] = {}
+        for term, (slots, tfs) in self._postings.items():
+            old = np.frombuffer(slots, dtype=np.int32)
+            new = remap[old]
+            keep = new >= 0
+            if not keep.any():
+                continue
+            postings[term] = (
+                array("i", new[keep].tobytes()),
+                array("i", np.frombuffer(tfs, dtype=np.int32)[keep].tobytes()),
+            )
+
+        self._postings = postings
+        self._df = {term: df for term, df in self._df.items() if df > 0}
+        self._ids = [self._ids[slot] for slot in live]
+        self._doc_terms = [self._doc_terms[slot] for slot in live]
+        self._doc_len = array("i", (self._doc_len[slot] for slot in live))
+        self._alive = bytearray(b"\x01") * len(live)
+        self._slot_of = {doc_id: slot for slot, doc_id in enumerate(self._ids)}
+        self._slot_ids = None
+        self._dead = 0
+
+    def save(self, path: str) -> None:
+        out = Path(path)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        if self._dead:
+            self.compact()
+        state = {
+            "ids": self._ids,
+            "doc_len": self._doc_len,
+            "doc_terms": self._doc_terms,
+            "postings": self._postings,
+            "df": self._df,
+            "total_len": self._total_len,
+        }
+        with out.open("wb") as fh:
+            pickle.dump(state, fh, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def load(self, path: str) -> None:
+        with Path(path).open("rb") as fh:
+            state = pickle.load(fh)
+        self._ids = state["ids"]
+        self._doc_len = state["doc_len"]
+        self._doc_terms = state["doc_terms"]
+        self._postings = state["postings"]
+        self._df = state["df"]
+        self._total_len = state["total_len"]
+        self._slot_of = {doc_id: slot for slot, doc_id in enumerate(self._ids) if doc_id is not None}
+        self._alive = bytearray(doc_id is not None for doc_id in self._ids)
+        self._dead = len(self._ids) - len(self._slot_of)
+        self._slot_ids = None
@@ -0,0 +1,243 @@
+"""Compact chunk store: one UTF-8 text arena plus columnar metadata."""
+
+from __future__ import annotations
+
+import json
+import mmap
+import os
+from array import array
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_COLUMNS = {"start": "q", "end": "q", "doc": "i", "position": "i", "page": "i", "offset": "q"}
+
+
+class ChunkStore:
+    """Integer-addressed chunk texts kept in a single contiguous buffer.
+
+    Chunk ``i`` is the byte range ``[start[i], end[i])`` of the arena; its
+    document, sequence number within the document, page and character offset
+    within the page live in parallel ``array`` columns, so a lookup is two array reads and a slice. A reopened
+    store maps the saved arena read-only with ``mmap`` and appends new text to
+    an in-memory tail. Chunks added with ``add_spans`` are byte ranges into
+    their source text, which is written once, so overlapping chunks share
+    bytes. Chunk ids are stable for the lifetime of the store; deleted chunks
+    are only dropped from the arena when it is saved.
+    """
+
+    def __init__(self) -> None:
+        self._base: Optional[mmap.mmap] = None
+        self._base_len = 0
+        self._base_file = None
+        self._tail = bytearray()
+        self._cols: Dict[str, array] = {name: array(code) for name, code in _COLUMNS.items()}
+        self._alive = bytearray()
+        self._live = 0
+        self._doc_names: List[str] = []
+        self._doc_index: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return self._live
+
+    def __contains__(self, cid: int) -> bool:
+        return 0 <= cid < len(self._alive) and bool(self._alive[cid])
+
+    @property
+    def capacity(self) -> int:
+        """Number of ids ever allocated, including deleted ones."""
+        return len(self._alive)
+
+    def add(self, doc_id: str, text: str, position: int, page: Optional[int] = None) -> int:
+        return self.add_spans(doc_id, text, [(0, len(text))], [position], page)[0]
+
+    def add_spans(
+        self,
+        doc_id: str,
+        text: str,
+        spans: Sequence[Tuple[int, int]],
+        positions: Sequence[int],
+        page: Optional[int] = None,
+    ) -> List[int]:
+        """Add chunks given as character ``spans`` of ``text``; returns their ids.
+
+        Only the part of ``text`` covered by the spans is appended, once.
+        """
+        if not spans:
+            return []
+        doc = self._doc_index.get(doc_id)
+        if doc is None:
+            doc = self._doc_index[doc_id] = len(self._doc_names)
+            self._doc_names.append(doc_id)
+
+        lo = min(start for start, _ in spans)
+        hi = max(end for _, end in spans)
+        base = self._base_len + len(self._tail)
+        # Map each distinct character offset to its byte offset by encoding the
+        # gaps between consecutive offsets, so the source is encoded only once.
+        byte_at: Dict[int, int] = {}
+        nbytes, prev = 0, lo
+        for offset in sorted({o for span in spans for o in span}):
+            nbytes += len(text[prev:offset].encode("utf-8"))
+            byte_at[offset] = nbytes
+            prev = offset
+        self._tail += text[lo:hi].encode("utf-8")
+
+        cols = self._cols
+        page_value = -1 if page is None else page
+        first = len(self._alive)
+        for (start, end), position in zip(spans, positions):
+            cols["start"].append(base + byte_at[start])
+            cols["end"].append(base + byte_at[end])
+            cols["doc"].append(doc)
+            cols["position"].append(position)
+            cols["page"].append(page_value)
+            cols["offset"].append(start)
+        self._alive.extend(b"\x01" * len(spans))
+        self._live += len(spans)
+        return list(range(first, len(self._alive)))
+
+    def relocate(self, moves: Sequence[Tuple[int, Optional[int], int]]) -> None:
+        """Record the new ``(cid, page, offset)`` of chunks kept across an edit of their source."""
+        cols = self._cols
+        for cid, page, offset in moves:
+            cols["page"][cid] = -1 if page is None else page
+            cols["offset"][cid] = offset
+
+    def remove(self, ids: Sequence[int]) -> None:
+        for cid in ids:
+            if cid in self:
+                self._alive[cid] = 0
+                self._live -= 1
+
+    def text(self, cid: int) -> str:
+        return self._bytes(self._cols["start"][cid], self._cols["end"][cid]).decode("utf-8")
+
+    def get(self, cid: int) -> Optional[str]:
+        return self.text(cid) if cid in self else None
+
+    def doc_id(self, cid: int) -> str:
+        return self._doc_names[self._cols["doc"][cid]]
+
+    def position(self, cid: int) -> int:
+        return self._cols["position"][cid]
+
+    def page(self, cid: int) -> Optional[int]:
+        page = self._cols["page"][cid]
+        return None if page < 0 else page
+
+    def span(self, cid: int) -> Tuple[int, int]:
+        """Arena byte range of a chunk; overlapping chunks of a page share bytes."""
+        return self._cols["start"][cid], self._cols["end"][cid]
+
+    def source_span(self, cid: int) -> Optional[Tuple[int, int]]:
+        """Character range of a chunk within its page text, or None if unknown.
+
+        Unlike ``span`` this follows document order: re-ingest appends edited
+        chunks to the arena tail and ``save`` compacts it.
+        """
+        offset = self._cols["offset"][cid]
+        if offset < 0:
+            return None
+        return offset, offset + len(self.text(cid))
+
+    def doc_names(self) -> List[str]:
+        """Document ids in the order of their integer codes in the ``doc`` column."""
+        return list(self._doc_names)
+
+    def label(self, cid: int) -> str:
+        """Human-readable citation id such as ``doc-1:3``."""
+        return f"{self.doc_id(cid)}:{self.position(cid)}"
+
+    def items(self) -> Iterator[Tuple[int, str]]:
+        for cid in range(len(self._alive)):
+            if self._alive[cid]:
+                yield cid, self.text(cid)
+
+    def column(self, name: str) -> np.ndarray:
+        """Zero-copy NumPy view of a metadata column (``doc``, ``page``, ...)."""
+        if name == "alive":
+            return np.frombuffer(self._alive, dtype=bool)
+        return np.frombuffer(self._cols[name], dtype=np.dtype(self._cols[name].typecode))
+
+    def save(self, path: str) -> None:
+        """Write a compacted arena and the metadata columns to ``path``.
+
+        Live byte ranges are merged where they overlap, so text shared by
+        overlapping chunks is still written once.
+        """
+        out = Path(path)
+        out.mkdir(parents=True, exist_ok=True)
+        old_starts, old_ends = self.column("start"), self.column("end")
+        starts = array("q", bytes(8 * len(self._alive)))
+        ends = array("q", bytes(8 * len(self._alive)))
+        live = [cid for cid in range(len(self._alive)) if self._alive[cid]]
+        live.sort(key=lambda cid: old_starts[cid])
+
+        tmp = out / "arena.bin.tmp"
+        offset = 0
+        run_start = run_end = -1  # current merged source range
+        with tmp.open("wb") as fh:
+            for cid in live:
+                start, end = int(old_starts[cid]), int(old_ends[cid])
+                if start >= run_end:
+                    run_start, run_end = start, end
+                    run_offset = offset
+                    fh.write(self._bytes(start, end))
+                    offset += end - start
+                elif end > run_end:
+                    fh.write(self._bytes(run_end, end))
+                    offset += end - run_end
+                    run_end = end
+                starts[cid] = run_offset + start - run_start
+                ends[cid] = run_offset + end - run_start
+        self._unmap()
+        os.replace(tmp, out / "arena.bin")
+
+        cols = dict(self._cols, start=starts, end=ends)
+        np.savez(
+            out / "columns.npz",
+            alive=np.frombuffer(self._alive, dtype=np.uint8),
+            **{name: np.frombuffer(col, dtype=np.dtype(col.typecode)) for name, col in cols.items()},
+        )
+        (out / "docs.json").write_text(json.dumps(self._doc_names, ensure_ascii=False), encoding="utf-8")
+        # Keep serving from the freshly written arena.
+        self.load(path)
+
+    def load(self, path: str) -> None:
+        src = Path(path)
+        self._unmap()
+        with np.load(src / "columns.npz") as cols:
+            self._alive = bytearray(cols["alive"].tobytes())
+            # Snapshots written before the ``offset`` column existed mark offsets unknown.
+            missing = np.full(len(self._alive), -1)
+            self._cols = {
+                name: array(code, (cols[name] if name in cols.files else missing).astype(code).tobytes())
+                for name, code in _COLUMNS.items()
+            }
+        self._live = self._alive.count(1)
+        self._doc_names = json.loads((src / "docs.json").read_text(encoding="utf-8"))
+        self._doc_index = {doc_id: i for i, doc_id in enumerate(self._doc_names)}
+        self._tail = bytearray()
+
+        arena = src / "arena.bin"
+        self._base_len = arena.stat().st_size
+        if self._base_len:
+            self._base_file = arena.open("rb")
+            self._base = mmap.mmap(self._base_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _bytes(self, start: int, end: int) -> bytes:
+        # Saved text lives in the mapped base and new text in the tail; a single
+        # range never straddles the two.
+        if start >= self._base_len:
+            return bytes(self._tail[start - self._base_len : end - self._base_len])
+        return self._base[start:end]
+
+    def _unmap(self) -> None:
+        if self._base is not None:
+            self._base.close()
+            self._base_file.close()
+        self._base = None
+        self._base_file = None
+        self._base_len = 0
@@ -14,11 +14,13 @@ Implements the assignment setup shown in the screenshots:
 from __future__ import annotations
 
 import argparse
-import re
-import string
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, Iterable, List, Sequence
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
 
 import matplotlib.pyplot as plt
 import pandas as pd
@@ -28,8 +30,26 @@ from rank_bm25 import BM25Okapi
 from tqdm import tqdm
 from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
 
+from .context import ContextConfig, ContextPacker, Passage, TokenCounter
+from .metrics import (  # noqa: F401  (re-exported for existing callers)
+    classify_faithfulness,
+    contains_any_answer,
+    exact_match,
+    f1_score,
+    normalize_answer,
+    score_predictions,
+)
+
 
 DEFAULT_TOPK_VALUES = [1, 3, 5, 10, 20]
+MAX_INPUT_TOKENS = 1024
+PROMPT_TEMPLATE = (
+    "Answer the question based only on the evidence. "
+    "If evidence is insufficient, output 'I don't know'.\n"
+    "Question: {question}\n"
+    "Evidence:\n{context}\n"
+    "Answer:"
+)
 
 
 @dataclass
@@ -41,47 +61,6 @@ class EvalSample:
     passages: List[str]
 
 
-def normalize_answer(text: str) -> str:
-    """SQuAD-style normalization for EM/F1."""
-    text = text.lower()
-    text = "".join(ch for ch in text if ch not in set(string.punctuation))
-    text = re.sub(r"\b(a|an|the)\b", " ", text)
-    text = re.sub(r"\s+", " ", text).strip()
-    return text
-
-
-def exact_match(prediction: str, golds: Sequence[str]) -> float:
-    pred = normalize_answer(prediction)
-    return float(any(pred == normalize_answer(g) for g in golds if g))
-
-
-def f1_score(prediction: str, golds: Sequence[str]) -> float:
-    pred_tokens = normalize_answer(prediction).split()
-    if not pred_tokens:
-        return 0.0
-
-    best = 0.0
-    for gold in golds:
-        gold_tokens = normalize_answer(gold).split()
-        if not gold_tokens:
-            continue
-        common = set(pred_tokens) & set(gold_tokens)
-        if not common:
-            continue
-        common_count = sum(min(pred_tokens.count(tok), gold_tokens.count(tok)) for tok in common)
-        precision = common_count / len(pred_tokens)
-        recall = common_count / len(gold_tokens)
-        if precision + recall == 0:
-            continue
-        best = max(best, 2 * precision * recall / (precision + recall))
-    return best
-
-
-def contains_any_answer(text: str, answers: Sequence[str]) -> bool:
-    norm_text = normalize_answer(text)
-    return any(ans and normalize_answer(ans) in norm_text for ans in answers)
-
-
 def build_eval_samples(raw_dataset: Dataset, num_samples: int) -> List[EvalSample]:
     samples: List[EvalSample] = []
     for row in raw_dataset:
@@ -110,14 +89,29 @@ def tokenize_for_bm25(text: str) -> List[str]:
     return text.split() if text else []
 
 
-def retrieve_topk_bm25(question: str, passages: Sequence[str], k: int) -> List[str]:
+def rank_passages_bm25(question: str, passages: Sequence[str]) -> List[str]:
+    """Full BM25 ranking of a sample's passages; every top-k is a prefix of it."""
     corpus_tokens = [tokenize_for_bm25(p) for p in passages]
     if not any(corpus_tokens):
-        return list(passages[:k])
+        return list(passages)
     bm25 = BM25Okapi(corpus_tokens)
     scores = bm25.get_scores(tokenize_for_bm25(question))
     ranked = sorted(zip(passages, scores), key=lambda x: x[1], reverse=True)
-    return [p for p, _ in ranked[:k]]
+    return [p for p, _ in ranked]
+
+
+def retrieve_topk_bm25(question: str, passages: Sequence[str], k: int) -> List[str]:
+    return rank_passages_bm25(question, passages)[:k]
+
+
+def build_prompt(
+    question: str,
+    evidence: Sequence[str],
+    tokenizer: AutoTokenizer,
+    counter: Optional[TokenCounter] = None,
+) -> str:
+    context = "\n".join(f"[{label}] {text}" for label, text in pack_evidence(question, evidence, tokenizer, counter))
+    return PROMPT_TEMPLATE.format(question=question, context=context)
 
 
 def generate_answer(
@@ -127,73 +121,175 @@ def generate_answer(
     model: AutoModelForSeq2SeqLM,
     device: torch.device,
     max_new_tokens: int = 40,
+    counter: Optional[TokenCounter] = None,
 ) -> str:
-    context = "\n".join(f"[{i+1}] {p}" for i, p in enumerate(evidence))
-    prompt = (
-        "Answer the question based only on the evidence. "
-        "If evidence is insufficient, output 'I don't know'.\n"
-        f"Question: {question}\n"
-        f"Evidence:\n{context}\n"
-        "Answer:"
-    )
-    inputs = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=1024).to(device)
+    prompt = build_prompt(question, evidence, tokenizer, counter)
+    return generate_batch([prompt], tokenizer, model, device, max_new_tokens)[0]
+
+
+def generate_batch(
+    prompts: Sequence[str],
+    tokenizer: AutoTokenizer,
+    model: AutoModelForSeq2SeqLM,
+    device: torch.device,
+    max_new_tokens: int = 40,
+) -> List[str]:
+    """One padded ``generate`` call; callers should group prompts of similar length."""
+    inputs = tokenizer(
+        list(prompts),
+        return_tensors="pt",
+        padding=True,
+        truncation=True,
+        max_length=MAX_INPUT_TOKENS,
+    ).to(device)
     with torch.no_grad():
         output_ids = model.generate(**inputs, max_new_tokens=max_new_tokens)
-    return tokenizer.decode(output_ids[0], skip_special_tokens=True).strip()
+    return [text.strip() for text in tokenizer.batch_decode(output_ids, skip_special_tokens=True)]
+
+
+class PredictionCache:
+    """Append-only JSONL of generated answers keyed by (model, settings, prompt).
+
+    Greedy decoding is deterministic, so a prompt seen before, whether from an
+    interrupted run or from another k that packed the same evidence, is not
+    generated again.
+    """
 
+    def __init__(self, path: Path):
+        self.path = path
+        self._items: Dict[str, str] = {}
+        if path.exists():
+            with path.open(encoding="utf-8") as fh:
+                for line in fh:
+                    try:
+                        item = json.loads(line)
+                    except json.JSONDecodeError:  # torn last line after a crash
+                        continue
+                    self._items[item["key"]] = item["prediction"]
 
-def classify_faithfulness(is_em: bool, supported: bool) -> str:
-    if is_em and supported:
-        return "correct_supported"
-    if is_em and not supported:
-        return "correct_unsupported"
-    return "incorrect"
+    @staticmethod
+    def key(model_name: str, max_new_tokens: int, prompt: str) -> str:
+        raw = f"{model_name}\0{max_new_tokens}\0{prompt}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: str) -> str:
+        return self._items[key]
+
+    def put_many(self, items: Dict[str, str]) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a", encoding="utf-8") as fh:
+            for key, prediction in items.items():
+                fh.write(json.dumps({"key": key, "prediction": prediction}, ensure_ascii=False) + "\n")
+            fh.flush()
+            os.fsync(fh.fileno())
+        self._items.update(items)
+
+
+_WORKER: Dict[str, object] = {}
+
+
+def _init_worker(model_name: str, num_threads: int) -> None:
+    torch.set_num_threads(num_threads)
+    _WORKER["tokenizer"] = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
+    model.eval()
+    _WORKER["model"] = model
+
+
+def _generate_in_worker(keys: List[str], prompts: List[str], max_new_tokens: int) -> Dict[str, str]:
+    preds = generate_batch(prompts, _WORKER["tokenizer"], _WORKER["model"], torch.device("cpu"), max_new_tokens)
+    return dict(zip(keys, preds))
+
+
+def run_generation(
+    jobs: Dict[str, str],
+    cache: PredictionCache,
+    model_name: str,
+    tokenizer: AutoTokenizer,
+    counter: TokenCounter,
+    batch_size: int = 16,
+    workers: int = 1,
+    max_new_tokens: int = 40,
+) -> None:
+    """Generate every uncached ``{key: prompt}`` job, saving after each batch.
+
+    Prompts are sorted by token length before batching so padding stays
+    small. On CPU, ``workers > 1`` spreads batches over processes that each
+    load the model and use ``cpu_count // workers`` torch threads.
+    """
+    pending = sorted((key for key in jobs if key not in cache), key=lambda key: counter.count(jobs[key]))
+    if not pending:
+        return
+    batches = [pending[i : i + batch_size] for i in range(0, len(pending), batch_size)]
+    progress = tqdm(total=len(pending), desc="Generating", leave=False)
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    if workers <= 1 or device.type == "cuda":
+        model = AutoModelForSeq2SeqLM.from_pretrained(model_name).to(device)
+        model.eval()
+        for batch in batches:
+            preds = generate_batch([jobs[key] for key in batch], tokenizer, model, device, max_new_tokens)
+            cache.put_many(dict(zip(batch, preds)))
+            progress.update(len(batch))
+    else:
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(model_name, threads)) as pool:
+            futures = [
+                pool.submit(_generate_in_worker, batch, [jobs[key] for key in batch], max_new_tokens)
+                for batch in batches
+            ]
+            for future in as_completed(futures):
+                done = future.result()
+                cache.put_many(done)
+                progress.update(len(done))
+    progress.close()
+
+
+def pack_evidence(
+    question: str,
+    evidence: Sequence[str],
+    tokenizer: AutoTokenizer,
+    counter: Optional[TokenCounter] = None,
+) -> List[Tuple[str, str]]:
+    """Keep the best-ranked passages that fit the encoder input instead of truncating the prompt tail."""
+    counter = counter or TokenCounter.from_tokenizer(tokenizer)
+    overhead = counter.count(PROMPT_TEMPLATE.format(question=question, context=""))
+    # Each "[i] " marker and newline costs a few tokens on top of the passage.
+    budget = MAX_INPUT_TOKENS - overhead - 4 * len(evidence) - 2
+    packer = ContextPacker(ContextConfig(max_tokens=max(0, budget)), counter)
+    return packer.pack([Passage(str(i + 1), p, score=-i) for i, p in enumerate(evidence)])
 
 
 def evaluate_for_k(
     samples: Sequence[EvalSample],
+    rankings: Sequence[Sequence[str]],
     k: int,
-    tokenizer: AutoTokenizer,
-    model: AutoModelForSeq2SeqLM,
-    device: torch.device,
+    predictions: Sequence[str],
 ) -> Dict[str, float]:
-    em_total = 0.0
-    f1_total = 0.0
-    hit_total = 0.0
-    cs = 0
-    cu = 0
-    incorrect = 0
-
-    for sample in tqdm(samples, desc=f"Evaluating top-k={k}", leave=False):
-        retrieved = retrieve_topk_bm25(sample.question, sample.passages, k=k)
-        joined_retrieved = "\n".join(retrieved)
-        hit_k = float(contains_any_answer(joined_retrieved, sample.answers))
-
-        pred = generate_answer(sample.question, retrieved, tokenizer, model, device)
-        em = exact_match(pred, sample.answers)
-        f1 = f1_score(pred, sample.answers)
-        supported = contains_any_answer(joined_retrieved, [pred])
-        faith_class = classify_faithfulness(bool(em), supported)
-
-        em_total += em
-        f1_total += f1
-        hit_total += hit_k
-        if faith_class == "correct_supported":
-            cs += 1
-        elif faith_class == "correct_unsupported":
-            cu += 1
-        else:
-            incorrect += 1
-
-    n = max(1, len(samples))
+    """Score one k given each sample's full ranking and its prediction at this k."""
+    table = score_predictions(
+        predictions,
+        [sample.answers for sample in samples],
+        contexts=[ranking[:k] for ranking in rankings],
+    )
+
+    def mean(column: str) -> float:
+        return float(table[column].mean()) if len(samples) else 0.0
+
     return {
         "k": k,
-        "em": em_total / n,
-        "f1": f1_total / n,
-        "hit_at_k": hit_total / n,
-        "supported_rate": cs / n,
-        "correct_unsupported_rate": cu / n,
-        "incorrect_rate": incorrect / n,
+        "em": mean("em"),
+        "f1": mean("f1"),
+        "hit_at_k": mean("hit"),
+        "supported_rate": mean("correct_supported"),
+        "correct_unsupported_rate": mean("correct_unsupported"),
+        "incorrect_rate": mean("incorrect"),
     }
 
 
@@ -243,20 +339,41 @@ def run_experiment(
     topk_values: Sequence[int],
     model_name: str,
     output_dir: Path,
+    batch_size: int = 16,
+    workers: int = 1,
+    max_new_tokens: int = 40,
+    resume: bool = True,
 ) -> pd.DataFrame:
     dataset = load_dataset("mandarjoshi/trivia_qa", "unfiltered", split=split)
     samples = build_eval_samples(dataset, num_samples=num_samples)
     if not samples:
         raise RuntimeError("No valid samples were found in TriviaQA unfiltered split.")
 
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    rankings = [rank_passages_bm25(s.question, s.passages) for s in tqdm(samples, desc="BM25", leave=False)]
     tokenizer = AutoTokenizer.from_pretrained(model_name)
-    model = AutoModelForSeq2SeqLM.from_pretrained(model_name).to(device)
-    model.eval()
+    counter = TokenCounter.from_tokenizer(tokenizer)
+
+    # keys[k][i] identifies the prediction of sample i at top-k.
+    jobs: Dict[str, str] = {}
+    keys: Dict[int, List[str]] = {}
+    for k in topk_values:
+        keys[k] = []
+        for sample, ranking in zip(samples, rankings):
+            prompt = build_prompt(sample.question, ranking[:k], tokenizer, counter)
+            key = PredictionCache.key(model_name, max_new_tokens, prompt)
+            jobs[key] = prompt
+            keys[k].append(key)
+
+    cache_path = output_dir / "predictions.jsonl"
+    if not resume and cache_path.exists():
+        cache_path.unlink()
+    cache = PredictionCache(cache_path)
+    run_generation(jobs, cache, model_name, tokenizer, counter, batch_size, workers, max_new_tokens)
 
     rows = []
     for k in topk_values:
-        rows.append(evaluate_for_k(samples, k, tokenizer, model, device))
+        predictions = [cache.get(key) for key in keys[k]]
+        rows.append(evaluate_for_k(samples, rankings, k, predictions))
 
     df = pd.DataFrame(rows).sort_values("k")
     output_dir.mkdir(parents=True, exist_ok=True)
@@ -278,6 +395,10 @@ def parse_args() -> argparse.Namespace:
     )
     parser.add_argument("--model", default="google/flan-t5-base", help="Generator model name")
     parser.add_argument("--output-dir", default="artifacts/topk_ablation", help="Output folder")
+    parser.add_argument("--batch-size", type=int, default=16, help="Prompts per generate() call")
+    parser.add_argument("--workers", type=int, default=1, help="Generator processes (CPU only)")
+    parser.add_argument("--max-new-tokens", type=int, default=40, help="Answer length limit")
+    parser.add_argument("--fresh", action="store_true", help="Ignore cached predictions from earlier runs")
     return parser.parse_args()
 
 
@@ -289,6 +410,10 @@ def main() -> None:
         topk_values=args.topk,
         model_name=args.model,
         output_dir=Path(args.output_dir),
+        batch_size=args.batch_size,
+        workers=args.workers,
+        max_new_tokens=args.max_new_tokens,
+        resume=not args.fresh,
     )
     print("\n=== Top-k Ablation Results ===")
     print(df.to_string(index=False))
@@ -0,0 +1,230 @@
+"""Lightweight stage tracing, counters and exporters for the RAG pipeline."""
+
+from __future__ import annotations
+
+import bisect
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Upper bounds (seconds) of the Prometheus duration histogram buckets.
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+@dataclass
+class TracingConfig:
+    enabled: bool = True
+    span_log_path: Optional[str] = None  # OpenTelemetry-style JSON lines, one span per line
+    service_name: str = "rag"
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start: float  # unix seconds
+    duration: float = 0.0  # seconds
+    attributes: Dict[str, object] = field(default_factory=dict)
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+
+SpanHook = Callable[[Span], None]
+
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("rag_span", default=None)
+# Every active ``collect()`` list, outermost first; nested collectors all receive a span.
+_collectors: contextvars.ContextVar[Tuple[List[Span], ...]] = contextvars.ContextVar("rag_collect", default=())
+
+
+class Tracer:
+    """Times nested spans and keeps process-wide counters and histograms.
+
+    Finished spans are passed to every registered hook (exporters are just
+    hooks). ``collect()`` additionally gathers the spans of one request so a
+    caller can report its own timing breakdown. When disabled, spans still
+    time their block for ``collect()`` but hooks, counters and histograms
+    are skipped.
+    """
+
+    def __init__(self, config: Optional[TracingConfig] = None):
+        self.config = config or TracingConfig()
+        self._hooks: List[SpanHook] = []
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self._histograms: Dict[str, List[float]] = {}  # name -> bucket counts + [count, sum]
+        if self.config.span_log_path:
+            self.add_hook(JsonlSpanExporter(self.config.span_log_path, self.config.service_name))
+
+    def add_hook(self, hook: SpanHook) -> None:
+        self._hooks.append(hook)
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        parent = _current.get()
+        span = Span(
+            name=name,
+            trace_id=parent.trace_id if parent else os.urandom(16).hex(),
+            span_id=os.urandom(8).hex(),
+            parent_id=parent.span_id if parent else None,
+            start=time.time(),
+            attributes=attributes,
+        )
+        token = _current.set(span)
+        t0 = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span.duration = time.perf_counter() - t0
+            _current.reset(token)
+            self._finish(span)
+
+    def record(self, name: str, duration: float, **attributes) -> Span:
+        """Report a span timed elsewhere, e.g. across the yields of a generator."""
+        parent = _current.get()
+        span = Span(
+            name=name,
+            trace_id=parent.trace_id if parent else os.urandom(16).hex(),
+            span_id=os.urandom(8).hex(),
+            parent_id=parent.span_id if parent else None,
+            start=time.time() - duration,
+            duration=duration,
+            attributes=attributes,
+        )
+        self._finish(span)
+        return span
+
+    @contextmanager
+    def collect(self) -> Iterator[List[Span]]:
+        """Gather every span finished inside the block, in completion order."""
+        spans: List[Span] = []
+        token = _collectors.set(_collectors.get() + (spans,))
+        try:
+            yield spans
+        finally:
+            _collectors.reset(token)
+
+    def count(self, name: str, value: float = 1, **labels) -> None:
+        if not self.config.enabled or not value:
+            return
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def counters(self) -> Dict[str, float]:
+        with self._lock:
+            items = list(self._counters.items())
+        return {_series(name, labels): value for (name, labels), value in items}
+
+    def prometheus(self, prefix: str = "rag") -> str:
+        """Render counters and per-stage duration histograms in Prometheus text format."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = {name: list(values) for name, values in sorted(self._histograms.items())}
+
+        lines: List[str] = []
+        seen = set()
+        for (name, labels), value in counters:
+            metric = f"{prefix}_{name}_total"
+            if metric not in seen:
+                lines.append(f"# TYPE {metric} counter")
+                seen.add(metric)
+            lines.append(f"{_series(metric, labels)} {value:g}")
+
+        if histograms:
+            metric = f"{prefix}_stage_duration_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            for stage, values in histograms.items():
+                cumulative = 0.0
+                for bound, n in zip(DURATION_BUCKETS, values):
+                    cumulative += n
+                    lines.append(f'{metric}_bucket{{stage="{stage}",le="{bound:g}"}} {cumulative:g}')
+                count, total = values[-2], values[-1]
+                lines.append(f'{metric}_bucket{{stage="{stage}",le="+Inf"}} {count:g}')
+                lines.append(f'{metric}_count{{stage="{stage}"}} {count:g}')
+                lines.append(f'{metric}_sum{{stage="{stage}"}} {total:.6f}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        """Write a textfile-collector snapshot atomically."""
+        out = Path(path)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        tmp = out.with_suffix(out.suffix + ".tmp")
+        tmp.write_text(self.prometheus(), encoding="utf-8")
+        os.replace(tmp, out)
+
+    def _finish(self, span: Span) -> None:
+        for collected in _collectors.get():
+            collected.append(span)
+        if not self.config.enabled:
+            return
+        with self._lock:
+            values = self._histograms.get(span.name)
+            if values is None:
+                values = self._histograms[span.name] = [0.0] * (len(DURATION_BUCKETS) + 2)
+            bucket = bisect.bisect_left(DURATION_BUCKETS, span.duration)
+            if bucket < len(DURATION_BUCKETS):
+                values[bucket] += 1
+            values[-2] += 1
+            values[-1] += span.duration
+        for hook in self._hooks:
+            hook(span)
+
+
+def timings_ms(spans: List[Span]) -> Dict[str, float]:
+    """Total milliseconds per span name."""
+    out: Dict[str, float] = {}
+    for span in spans:
+        out[span.name] = out.get(span.name, 0.0) + span.duration * 1000.0
+    return {name: round(ms, 3) for name, ms in out.items()}
+
+
+class JsonlSpanExporter:
+    """Append spans as OpenTelemetry-compatible JSON objects, one per line."""
+
+    def __init__(self, path: str, service_name: str = "rag"):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.service_name = service_name
+        self._lock = threading.Lock()
+
+    def __call__(self, span: Span) -> None:
+        start_ns = int(span.start * 1e9)
+        record = {
+            "resource": {"service.name": self.service_name},
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "parentSpanId": span.parent_id or "",
+            "name": span.name,
+            "startTimeUnixNano": start_ns,
+            "endTimeUnixNano": start_ns + int(span.duration * 1e9),
+            "attributes": [{"key": k, "value": _otel_value(v)} for k, v in span.attributes.items()],
+        }
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock, self.path.open("a", encoding="utf-8") as fh:
+            fh.write(line)
+
+
+def _otel_value(value: object) -> Dict[str, object]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _series(name: str, labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return name
+    body = ",".join('{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"')) for k, v in labels)
+    return f"{name}{{{body}}}"
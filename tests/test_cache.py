@@ -0,0 +1,35 @@
+"""Persistent LRU store and answer cache bookkeeping."""
+
+from src.rag.cache import AnswerCache, AnswerCacheConfig, SQLiteLRUStore
+
+
+def test_lru_order_survives_reopen(tmp_path):
+    path = str(tmp_path / "lru.sqlite")
+    store = SQLiteLRUStore(path, max_bytes=30)
+    store.put("old", b"x" * 10)
+    store.put("recent", b"x" * 10)
+    # Stamps written by an earlier process (e.g. before a reboot) may be arbitrarily large.
+    store._conn.execute("UPDATE entries SET last_access = last_access + 1000000000000000")
+    store._conn.commit()
+    store.close()
+
+    store = SQLiteLRUStore(path, max_bytes=30)
+    assert store.get("old") is not None
+    store.put("new", b"x" * 10)
+    store.put("newer", b"x" * 10)
+
+    assert store.get("recent") is None
+    assert all(store.get(key) is not None for key in ("old", "new", "newer"))
+
+
+def test_answer_cache_counts_each_lookup_once():
+    vector = [1.0, 0.0]
+    for semantic in (False, True):
+        cache = AnswerCache(AnswerCacheConfig(semantic=semantic))
+        cache.put("什么是 RAG", {"answer": "a"}, ["doc:0"], vector)
+        assert cache.get_exact("什么是 RAG") is not None
+        assert cache.get_exact("其他问题") is None
+        if semantic:
+            assert cache.get_similar([0.0, 1.0]) is None
+        stats = cache.stats()
+        assert (stats["exact_hits"], stats["misses"]) == (1, 1)
@@ -0,0 +1,71 @@
+"""Vector index persistence."""
+
+import numpy as np
+import pytest
+
+from src.rag.index import IndexConfig, create_index
+
+
+@pytest.mark.parametrize("storage", ["float16", "int8", "pq"])
+def test_save_into_loaded_directory_keeps_vectors(tmp_path, storage):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(300, 32)).astype(np.float32)
+    config = IndexConfig(backend="memory", storage=storage, quant_train_size=100)
+    index = create_index(config)
+    index.upsert_batch(list(range(300)), vectors)
+    index.save(str(tmp_path))
+
+    loaded = create_index(config)
+    loaded.load(str(tmp_path))
+    before = loaded.search_batch_scored(vectors[:5], top_k=3)
+    loaded.save(str(tmp_path))
+
+    assert loaded.search_batch_scored(vectors[:5], top_k=3) == before
+    saved = np.load(tmp_path / "vectors.npy")
+    assert saved.shape == (300, 32) and np.abs(saved).sum() > 0
+
+    reloaded = create_index(config)
+    reloaded.load(str(tmp_path))
+    assert [hits[0][0] for hits in reloaded.search_batch_scored(vectors[:5], top_k=1)] == list(range(5))
+
+
+def test_chroma_instances_are_isolated():
+    pytest.importorskip("chromadb")
+    vectors = np.random.default_rng(0).normal(size=(3, 8)).astype(np.float32)
+    first = create_index(IndexConfig(backend="chroma"))
+    first.upsert_batch([0, 1, 2], vectors)
+    assert len(create_index(IndexConfig(backend="chroma"))) == 0
+
+
+def test_chroma_snapshot_drops_deleted_vectors_and_is_not_mutated(tmp_path):
+    pytest.importorskip("chromadb")
+    vectors = np.random.default_rng(0).normal(size=(4, 8)).astype(np.float32)
+    config = IndexConfig(backend="chroma")
+    index = create_index(config)
+    index.upsert_batch([0, 1, 2], vectors[:3])
+    index.save(str(tmp_path))
+    index.remove([0])
+    index.save(str(tmp_path))
+
+    loaded = create_index(config)
+    loaded.load(str(tmp_path))
+    assert len(loaded) == 2
+    loaded.upsert_batch([3], vectors[3:])
+
+    again = create_index(config)
+    again.load(str(tmp_path))
+    assert len(again) == 2
+
+
+def test_ivf_trains_on_enough_points_and_retrains_as_corpus_grows():
+    pytest.importorskip("faiss")
+    vectors = np.random.default_rng(0).normal(size=(3000, 16)).astype(np.float32)
+    index = create_index(IndexConfig(backend="faiss", faiss_index="ivf_flat", nlist=8, ivf_retrain_factor=2))
+    index.upsert_batch(list(range(300)), vectors[:300])
+    assert not index._index.is_trained  # 39 * nlist = 312 points are needed
+
+    for start in range(300, 3000, 100):
+        index.upsert_batch(list(range(start, start + 100)), vectors[start : start + 100])
+    assert index._trained_on > 1000
+    assert len(index) == index._index.ntotal == 3000
+    assert index.search(vectors[2500], 1) == [2500]
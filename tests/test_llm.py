@@ -0,0 +1,126 @@
+"""AnswerGenerator against a local http.server stand-in for Ollama."""
+
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.rag.llm import AnswerGenerator, LLMConfig
+
+EVIDENCE = [("doc-1:0", "RAG 先检索再生成。")]
+
+
+class _Ollama(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self) -> None:
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with server.lock:
+            server.requests += 1
+            server.clients.add(self.client_address)
+            status = server.statuses.pop(0) if server.statuses else 200
+        if status != 200:
+            self._reply(status, b"{}")
+            return
+        time.sleep(server.delay)
+        question = body["messages"][1]["content"].splitlines()[0]
+        if body["stream"]:
+            self._stream(["答案", "：", question])
+        else:
+            self._reply(200, json.dumps({"message": {"content": "答案：" + question}}).encode("utf-8"))
+
+    def _reply(self, status: int, body: bytes) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, tokens) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for token in tokens + [""]:
+            line = json.dumps({"message": {"content": token}, "done": not token}).encode("utf-8") + b"\n"
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, format: str, *args) -> None:
+        return
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 64  # the default backlog of 5 delays concurrent connects by a SYN retry
+
+
+@pytest.fixture
+def ollama():
+    server = _Server(("127.0.0.1", 0), _Ollama)
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.clients = set()
+    server.statuses = []
+    server.delay = 0.0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _generator(server, **overrides) -> AnswerGenerator:
+    host, port = server.server_address
+    settings = dict(provider="ollama", model="qwen2", ollama_base_url=f"http://{host}:{port}", retry_backoff=0.01)
+    settings.update(overrides)
+    return AnswerGenerator(LLMConfig(**settings))
+
+
+def test_retries_transient_status(ollama):
+    ollama.statuses = [503]
+    answer = _generator(ollama).generate("什么是 RAG", EVIDENCE)
+    assert answer == "答案：问题：什么是 RAG"
+    assert ollama.requests == 2
+
+
+def test_client_error_returns_message(ollama):
+    ollama.statuses = [404]
+    answer = _generator(ollama).generate("什么是 RAG", EVIDENCE)
+    assert "HTTP 404" in answer
+    assert ollama.requests == 1
+
+
+def test_stream_reads_ndjson(ollama):
+    ollama.statuses = [503]
+    tokens = list(_generator(ollama).stream("什么是 RAG", EVIDENCE))
+    assert tokens == ["答案", "：", "问题：什么是 RAG"]
+
+
+def test_generate_batch_is_concurrent_and_reuses_connections(ollama):
+    ollama.delay = 0.2
+    generator = _generator(ollama, max_concurrency=8)
+    items = [(f"问题{i}", EVIDENCE) for i in range(8)]
+    began = time.perf_counter()
+    answers = generator.generate_batch(items)
+    assert time.perf_counter() - began < 8 * 0.2 / 2
+    assert answers == [f"答案：问题：问题{i}" for i in range(8)]
+
+    opened = len(ollama.clients)
+    generator.generate_batch(items)
+    assert len(ollama.clients) == opened
+
+
+def test_unreachable_host_returns_message():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    config = LLMConfig(provider="ollama", ollama_base_url=f"http://127.0.0.1:{port}", max_retries=0)
+    generator = AnswerGenerator(config)
+    assert generator.generate("q", EVIDENCE).startswith("无法连接到本地 Ollama")
+    assert list(generator.stream("q", EVIDENCE))[0].startswith("无法连接到本地 Ollama")
+    assert generator.generate_batch([("q", EVIDENCE)])[0].startswith("无法连接到本地 Ollama")
@@ -0,0 +1,69 @@
+"""KnowledgeBase ingestion and deletion with the offline stubs."""
+
+import pytest
+
+from src.rag.embeddings import EmbeddingConfig
+from src.rag.parsers import PageText
+from src.rag.pipeline import KnowledgeBase, PipelineConfig
+from src.rag.rerank import RerankConfig
+
+
+def _knowledge_base() -> KnowledgeBase:
+    config = PipelineConfig(
+        embedding=EmbeddingConfig(provider="hash"),
+        rerank=RerankConfig(provider="overlap"),
+        ingest_batch_size=1,
+    )
+    config.index.backend = "memory"
+    return KnowledgeBase(config)
+
+
+def _pages(fail_after: int):
+    for number in range(1, 10):
+        if number > fail_after:
+            raise RuntimeError("parser crashed")
+        yield PageText(number, f"第 {number} 页：检索增强生成的说明文字。", 9)
+
+
+def test_failed_ingest_leaves_no_orphan_chunks():
+    kb = _knowledge_base()
+    with pytest.raises(RuntimeError):
+        kb.ingest_pages("manual", _pages(fail_after=5))
+
+    assert "manual" not in kb.registry
+    assert len(kb.store) == len(kb.index) == len(kb.sparse) == 0
+    assert kb.retrieve("检索增强生成") == []
+
+    assert kb.ingest_pages("manual", _pages(fail_after=9)) == 9
+    assert len(kb.store) == 9
+    assert kb.delete("manual")
+    assert len(kb.store) == len(kb.index) == 0
+
+
+def test_failed_reingest_keeps_previous_version():
+    kb = _knowledge_base()
+    kb.ingest("notes", "旧版本的笔记内容。")
+    before = list(kb.registry.get("notes").chunk_ids)
+    with pytest.raises(RuntimeError):
+        kb.ingest_pages("notes", _pages(fail_after=3))
+
+    assert kb.registry.get("notes").chunk_ids == before
+    assert len(kb.store) == len(kb.index) == len(before)
+
+
+def test_load_drops_rerank_scores_of_replaced_corpus(tmp_path):
+    first = _knowledge_base()
+    first.ingest("a", "苹果的种植方法。")
+    first.save(str(tmp_path))
+
+    kb = _knowledge_base()
+    kb.ingest("b", "检索增强生成先检索再生成。")
+    query = "检索增强生成"
+
+    def top_score():
+        passages = [(cid, kb.store.text(cid)) for cid, _ in kb.retrieve(query)]
+        return kb.reranker.rerank(query, passages, top_n=1)[0][2]
+
+    assert top_score() > 0
+    kb.load(str(tmp_path))  # the loaded corpus reuses chunk id 0 for other text
+    assert top_score() == 0